@@ -1,5 +1,9 @@
+import logging
+
 from program_catalog.directory import parse_and_validate
 
+logger = logging.getLogger(__name__)
+
 
 class ArbolAdapter:
     ''' External Adapter class for computing payout evaluations for
@@ -26,14 +30,14 @@ class ArbolAdapter:
             information is logged to the output
         '''
         try:
-            print(f'validating data {self.request_data}', flush=True)
+            logger.debug('validating request %s', self.id)
             if self.request_data is None or self.request_data == {}:
                 self.request_error = 'request data empty'
-                print('data empty', flush=True)
+                logger.debug('data empty')
                 return False
             self.parameters, self.program = parse_and_validate(self.request_data)
             if self.program is None:
-                print('program empty', flush=True)
+                logger.debug('program empty')
                 self.request_error = self.parameters
                 return False
             else:
@@ -47,7 +51,7 @@ class ArbolAdapter:
             contract should payout and if so then for how much
         '''
         try:
-            print('executing request', flush=True)
+            logger.debug('executing request %s', self.id)
             result = self.program.serve_request(self.parameters)
             self.result_success(result)
         except Exception as e:
@@ -78,3 +82,124 @@ class ArbolAdapter:
             'error': f'There was an error: {error}',
             'statusCode': 500,
         }
+
+
+class ArbolBatchAdapter:
+    ''' External Adapter class for evaluating many Arbol weather contracts
+        in one request. Contracts evaluated against the same weather data
+        (same dataset and locations, or same station and variable) share a
+        single data load and are evaluated together
+    '''
+
+    def __init__(self, data):
+        ''' Each call to the adapter creates a new Adapter
+            instance to handle the request
+
+            Parameters: data (dict), the received request body whose "data" is
+            a list of request bodies as accepted by ArbolAdapter
+        '''
+        self.id = data.get('id', '3')
+        self.jobs = data.get('data')
+        if not isinstance(self.jobs, list) or len(self.jobs) == 0:
+            self.result = {
+                'jobRunID': self.id,
+                'error': 'There was an error: request data must be a non-empty list of jobs',
+                'statusCode': 500,
+            }
+        else:
+            self.execute_request()
+
+    def execute_request(self):
+        ''' Validates every job, groups evaluation jobs by their weather data,
+            loads each distinct history once, and evaluates each group. A failure
+            in one job or group is reported in that job's result only
+        '''
+        self.results = [None] * len(self.jobs)
+        groups = {}
+        for i, job in enumerate(self.jobs):
+            if not isinstance(job, dict):
+                self.results[i] = self.job_error(self.id, job, 'job must be an object')
+                continue
+            job_id = job.get('id', self.id)
+            request_data = job.get('data')
+            if request_data is None or request_data == {}:
+                self.results[i] = self.job_error(job_id, request_data, 'request data empty')
+                continue
+            try:
+                parameters, program = parse_and_validate(request_data)
+            except Exception as e:
+                parameters, program = e, None
+            if program is None:
+                self.results[i] = self.job_error(job_id, request_data, parameters)
+                continue
+            if not hasattr(program, 'history_key'):
+                try:
+                    self.results[i] = self.job_success(job_id, request_data, program.serve_request(parameters))
+                except Exception as e:
+                    self.results[i] = self.job_error(job_id, request_data, e)
+                continue
+            try:
+                key = (program, program.history_key(parameters))
+            except Exception as e:
+                self.results[i] = self.job_error(job_id, request_data, e)
+                continue
+            groups.setdefault(key, []).append((i, job_id, request_data, parameters))
+
+        for (program, _), members in groups.items():
+            self.execute_group(program, members)
+        self.result = {
+            'jobRunID': self.id,
+            'result': self.results,
+            'statusCode': 200,
+        }
+
+    def execute_group(self, program, members):
+        ''' Loads the shared history of a group of jobs, covering the union of
+            their windows, and evaluates them together, falling back to evaluating
+            jobs one by one if the batch evaluation fails so that one bad job does
+            not fail the rest
+
+            Parameters: program (class), program class of the group
+                        members (list), (index, job id, request data, parameters) of each job
+        '''
+        try:
+            windows = [program.history_window(parameters) for _, _, _, parameters in members]
+            starts = [start for start, _ in windows]
+            ends = [end for _, end in windows]
+            window = (None if None in starts else min(starts), None if None in ends else max(ends))
+            history = program.load_history(members[0][3], window=window)
+        except Exception as e:
+            for i, job_id, request_data, _ in members:
+                self.results[i] = self.job_error(job_id, request_data, e)
+            return
+        try:
+            payouts = program.serve_batch(history, [parameters for _, _, _, parameters in members])
+            for (i, job_id, request_data, _), payout in zip(members, payouts):
+                self.results[i] = self.job_success(job_id, request_data, payout)
+        except Exception:
+            for i, job_id, request_data, parameters in members:
+                try:
+                    payout = program.serve_batch(history, [parameters])[0]
+                    self.results[i] = self.job_success(job_id, request_data, payout)
+                except Exception as e:
+                    self.results[i] = self.job_error(job_id, request_data, e)
+
+    @staticmethod
+    def job_success(job_id, request_data, result):
+        ''' Returns: dict, job result in the shape of ArbolAdapter.result on success '''
+        return {
+            'jobRunID': job_id,
+            'data': request_data,
+            'result': result,
+            'statusCode': 200,
+        }
+
+    @staticmethod
+    def job_error(job_id, request_data, error):
+        ''' Returns: dict, job result in the shape of ArbolAdapter.result on error '''
+        return {
+            'jobRunID': job_id,
+            'data': request_data,
+            'error': f'There was an error: {error}',
+            'statusCode': 500,
+        }
@@ -1,4 +1,11 @@
-from program_catalog.tools.wrappers import parse_request, get_request_data, operate_on_data
+import logging
+
+from program_catalog.tools.cache import RESULT_CACHE
+from program_catalog.tools.metrics import timed
+from program_catalog.tools.operations import compile_plan
+from program_catalog.tools.wrappers import parse_request, get_request_data, get_result_cache_key, operate_on_data
+
+logger = logging.getLogger(__name__)
 
 
 class dClimateAdapter:
@@ -39,6 +46,8 @@ class dClimateAdapter:
                     if not valid:
                         self.request_error = result
                         self.valid = False
+                    elif request_ops is not None and not self.validate_operations(request_ops, request_params):
+                        self.valid = False
                     else:
                         self.request_args = result
                         self.request_operations = request_ops # self.request_data.get('request_ops', None)
@@ -48,28 +57,49 @@ class dClimateAdapter:
                     self.valid = False
                     self.request_error = e
 
+    def validate_operations(self, request_ops, request_params):
+        ''' Compiles the requested operations so that unsupported operations or
+            parameters are rejected before any data is fetched
+
+            Returns: bool, whether the operations are supported
+        '''
+        try:
+            compile_plan(request_ops, request_params)
+            return True
+        except ValueError as e:
+            self.request_error = f'Unsupported operations: {e}'
+            return False
+
     def execute_request(self):
         ''' Get the designated program and determine whether the associated
             contract should payout and if so then for how much
         '''
         try:
+            cache_key = get_result_cache_key(self.request_args, self.request_data)
+            if cache_key is not None:
+                hit, payload = RESULT_CACHE.get(cache_key)
+                if hit:
+                    self.result_success(dict(payload))
+                    return
+            endpoint = self.request_args.get('_key', '')
+            dataset = self.request_args.get('dataset', self.request_args.get('dataset_name', ''))
             result = get_request_data(self.request_args)
             if self.request_operations is not None:
-                result['data'], result["unit"], msg = operate_on_data(result['data'], self.request_operations, self.request_parameters)
+                with timed('operate', endpoint=endpoint, dataset=dataset):
+                    result['data'], result["unit"], msg = operate_on_data(result['data'], self.request_operations, self.request_parameters, unit=result['unit'])
                 if msg is not None:
                     self.request_error = msg
                     self.result_error()
-                else:
-                    payload = {'unit': result['unit'], 'data': result['data']}
-                    self.result_success(payload)
-            else:
-                # currently only supporting return values and units, not metadata, snapped cooordinates, etc
-                # also first just one return value at a time (along with unit)
-                # unit is now a failure message if fail, adapter no longer returns 500 response on fail
-                payload = {'unit': result['unit'], 'data': result['data']}
-                self.result_success(payload)
+                    return
+            # currently only supporting return values and units, not metadata, snapped cooordinates, etc
+            # also first just one return value at a time (along with unit)
+            # unit is now a failure message if fail, adapter no longer returns 500 response on fail
+            payload = {'unit': result['unit'], 'data': result['data']}
+            if cache_key is not None:
+                RESULT_CACHE.set(cache_key, dict(payload))
+            self.result_success(payload)
         except Exception as e:
-            print(e)
+            logger.exception('could not execute request')
             raise e
             # self.request_error = e
             # self.result_error()
@@ -92,7 +122,7 @@ class dClimateAdapter:
 
             Parameters: error (str), associated error message
         '''
-        print(f'error message: {self.request_error}')
+        logger.info('request error: %s', self.request_error)
         self.result = {
             'jobRunID': self.id,
             'result': {'unit': self.request_error, 'data': 0},
@@ -1,40 +1,113 @@
-from flask import Flask, request, jsonify
+import time
+
+from flask import Flask, Response, request, jsonify
 from dotenv import load_dotenv
 
 load_dotenv()
 
-from adapter import ArbolAdapter
+from program_catalog.tools.logs import configure_logging, sample_request
+
+configure_logging()
+
+from adapter import ArbolAdapter, ArbolBatchAdapter
 from api import dClimateAdapter
+from program_catalog.tools.cache import HISTORY_CACHE, RESULT_CACHE, purge_authorized, purge_dataset
+from program_catalog.tools.crypto import ACCESS_KEY_CACHE, URI_CACHE
+from program_catalog.tools.heads import DATASET_HEADS
+from program_catalog.tools.metrics import REQUESTS, REQUEST_SECONDS, timed, register_collector, render_metrics
+from program_catalog.tools.wrappers import REQUEST_FLIGHT
 
 
 def build_app():
 
     app = Flask(__name__)
+    DATASET_HEADS.start()
+    register_collector('dataset_heads', DATASET_HEADS.stats)
+    register_collector('history_cache', HISTORY_CACHE.stats)
+    register_collector('result_cache', RESULT_CACHE.stats)
+    register_collector('request_coalescing', REQUEST_FLIGHT.stats)
+    register_collector('access_key_cache', ACCESS_KEY_CACHE.stats)
+    register_collector('uri_cache', URI_CACHE.stats)
+
+    def serve(route, adapter):
+        ''' Runs an adapter on the request body and records the request's
+            latency, encoding time and status in the metrics. Requests whose
+            adapter raises are recorded with the status 'error'
+        '''
+        start = time.perf_counter()
+        status = 'error'
+        try:
+            data = request.get_json()
+            if data == '':
+                data = {}
+            response = adapter(data)
+            with timed('encode', endpoint=route):
+                body = jsonify(response.result)
+            status = response.result.get('statusCode', '')
+            return body
+        finally:
+            REQUEST_SECONDS.observe(time.perf_counter() - start, route=route)
+            REQUESTS.inc(route=route, status=status)
 
     @app.before_request
     def log_request_info():
-        ''' Write header and body info of request to logger '''
-        app.logger.debug('Headers: %s', request.headers)
-        app.logger.debug('Body: %s', request.get_data())
+        ''' Write header and body info of a sample of requests to logger '''
+        if sample_request(app.logger):
+            app.logger.debug('Headers: %s', request.headers)
+            app.logger.debug('Body: %s', request.get_data())
 
     @app.route('/', methods=['POST'])
     def call_nft_adapter():
         ''' Primary route for NFT evaluation requests '''
-        data = request.get_json()
-        if data == '':
-            data = {}
-        response = ArbolAdapter(data)
-        return jsonify(response.result)
+        return serve('/', ArbolAdapter)
+
+    @app.route('/batch', methods=['POST'])
+    def call_nft_batch_adapter():
+        ''' Route for evaluating a list of NFT evaluation requests together '''
+        return serve('/batch', ArbolBatchAdapter)
 
     @app.route('/api', methods=['POST'])
     def call_api_adapter():
         ''' Primary route for dClimate API requests '''
-        data = request.get_json()
-        if data == '':
-            data = {}
-        response = dClimateAdapter(data)
-        return jsonify(response.result)
+        return serve('/api', dClimateAdapter)
     
+    @app.route('/stats', methods=['GET'])
+    def stats():
+        ''' Cache and request coalescing counters of this worker '''
+        return jsonify({
+            'history_cache': HISTORY_CACHE.stats(),
+            'result_cache': RESULT_CACHE.stats(),
+            'request_coalescing': REQUEST_FLIGHT.stats(),
+            'access_key_cache': ACCESS_KEY_CACHE.stats(),
+            'uri_cache': URI_CACHE.stats(),
+            'dataset_heads': DATASET_HEADS.stats(),
+        })
+
+    @app.route('/metrics', methods=['GET'])
+    def metrics():
+        ''' Stage latencies, request counts and cache counters of this worker
+            in the Prometheus text format
+        '''
+        return Response(render_metrics(), mimetype='text/plain; version=0.0.4')
+
+    @app.route('/cache/purge', methods=['POST'])
+    def purge_cache():
+        ''' Purges cached histories and results of a republished dataset in
+            this worker and broadcasts the purge to the other workers on the
+            host. Requires the CACHE_PURGE_TOKEN bearer token
+        '''
+        if not purge_authorized(request.headers.get('Authorization', None)):
+            return jsonify({'error': 'unauthorized', 'statusCode': 401}), 401
+        data = request.get_json(silent=True)
+        dataset = data.get('dataset', None) if isinstance(data, dict) else None
+        if dataset is None:
+            return jsonify({'error': 'dataset missing', 'statusCode': 400}), 400
+        return jsonify({
+            'result': purge_dataset(dataset),
+            'broadcast': DATASET_HEADS.broadcast_purge(dataset),
+            'statusCode': 200,
+        })
+
     @app.route('/health', methods=['POST'])
     def health_check():
         ''' Simple health check route '''
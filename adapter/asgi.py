@@ -0,0 +1,195 @@
+import os
+import json
+import time
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from program_catalog.tools.logs import configure_logging
+
+configure_logging()
+
+from adapter import ArbolAdapter, ArbolBatchAdapter
+from api import dClimateAdapter
+from program_catalog.tools.cache import HISTORY_CACHE, RESULT_CACHE, purge_authorized, purge_dataset
+from program_catalog.tools.crypto import ACCESS_KEY_CACHE, URI_CACHE
+from program_catalog.tools.heads import DATASET_HEADS
+from program_catalog.tools.metrics import REQUESTS, REQUEST_SECONDS, register_collector, render_metrics
+from program_catalog.tools.wrappers import REQUEST_FLIGHT
+
+ASYNC_MAX_WORKERS = int(os.getenv("ASYNC_MAX_WORKERS", 64))
+ASYNC_REQUEST_TIMEOUT = float(os.getenv("ASYNC_REQUEST_TIMEOUT", 240))
+
+
+def error_result(path, data, message):
+    ''' Builds the response of a request that failed or missed its deadline
+        in the shape returned by the adapter serving the route
+
+        Parameters: path (str), route of the request
+                    data (dict), the received request body
+                    message (str), error message
+        Returns: dict, adapter-shaped error result
+    '''
+    if path == '/api':
+        return {
+            'jobRunID': data.get('id', '2'),
+            'result': {'unit': message, 'data': 0},
+            'statusCode': 200,
+        }
+    return {
+        'jobRunID': data.get('id', '3'),
+        'data': data.get('data'),
+        'error': f'There was an error: {message}',
+        'statusCode': 500,
+    }
+
+
+def build_asgi_app(max_workers=ASYNC_MAX_WORKERS, timeout=ASYNC_REQUEST_TIMEOUT):
+    ''' Builds an ASGI application serving the same routes as build_app
+
+        The adapters run on a bounded thread pool so a single worker's event loop
+        holds many in-flight requests while wrapper calls wait on IPFS. Each
+        request has a deadline and is abandoned if the client disconnects; the
+        running adapter call finishes in the background and its result is dropped
+
+        Serve with e.g. `uvicorn asgi:app` or
+        `gunicorn --worker-class uvicorn.workers.UvicornWorker asgi:app`
+
+        Parameters: max_workers (int), number of adapter calls run concurrently
+                    timeout (float), seconds before a request is answered with an error
+        Returns: function, the ASGI application
+    '''
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    DATASET_HEADS.start()
+    register_collector('dataset_heads', DATASET_HEADS.stats)
+    register_collector('history_cache', HISTORY_CACHE.stats)
+    register_collector('result_cache', RESULT_CACHE.stats)
+    register_collector('request_coalescing', REQUEST_FLIGHT.stats)
+    register_collector('access_key_cache', ACCESS_KEY_CACHE.stats)
+    register_collector('uri_cache', URI_CACHE.stats)
+    adapters = {
+        '/': ArbolAdapter,
+        '/batch': ArbolBatchAdapter,
+        '/api': dClimateAdapter,
+    }
+
+    async def read_body(receive):
+        body = b''
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                return None
+            body += message.get('body', b'')
+            if not message.get('more_body', False):
+                return body
+
+    async def wait_for_disconnect(receive):
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                return
+
+    async def send_body(send, body, content_type, status=200):
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': [(b'content-type', content_type), (b'content-length', str(len(body)).encode())],
+        })
+        await send({'type': 'http.response.body', 'body': body})
+
+    async def send_json(send, payload, status=200):
+        await send_body(send, json.dumps(payload, default=str).encode('utf-8'), b'application/json', status)
+
+    async def lifespan(receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                executor.shutdown(wait=False, cancel_futures=True)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def app(scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await lifespan(receive, send)
+        if scope['type'] != 'http':
+            return
+        path = scope['path']
+        if path == '/stats' and scope['method'] == 'GET':
+            return await send_json(send, {
+                'history_cache': HISTORY_CACHE.stats(),
+                'result_cache': RESULT_CACHE.stats(),
+                'request_coalescing': REQUEST_FLIGHT.stats(),
+                'access_key_cache': ACCESS_KEY_CACHE.stats(),
+                'uri_cache': URI_CACHE.stats(),
+                'dataset_heads': DATASET_HEADS.stats(),
+            })
+        if path == '/metrics' and scope['method'] == 'GET':
+            return await send_body(send, render_metrics().encode('utf-8'), b'text/plain; version=0.0.4')
+        if scope['method'] != 'POST':
+            return await send_json(send, {'error': 'method not allowed', 'statusCode': 405}, status=405)
+        if path == '/health':
+            return await send_json(send, {'result': 'healthy', 'statusCode': 200})
+        if path == '/cache/purge':
+            headers = dict(scope.get('headers', []))
+            if not purge_authorized(headers.get(b'authorization', b'').decode('latin-1')):
+                return await send_json(send, {'error': 'unauthorized', 'statusCode': 401}, status=401)
+            body = await read_body(receive)
+            try:
+                dataset = json.loads(body).get('dataset', None)
+            except (ValueError, AttributeError):
+                dataset = None
+            if dataset is None:
+                return await send_json(send, {'error': 'dataset missing', 'statusCode': 400}, status=400)
+            return await send_json(send, {
+                'result': purge_dataset(dataset),
+                'broadcast': DATASET_HEADS.broadcast_purge(dataset),
+                'statusCode': 200,
+            })
+        adapter = adapters.get(path, None)
+        if adapter is None:
+            return await send_json(send, {'error': 'not found', 'statusCode': 404}, status=404)
+
+        body = await read_body(receive)
+        if body is None:
+            return
+        try:
+            data = json.loads(body) if body else {}
+        except ValueError:
+            return await send_json(send, {'error': 'request body is not valid json', 'statusCode': 400}, status=400)
+        if not isinstance(data, dict):
+            data = {}
+
+        start = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        call = loop.run_in_executor(executor, adapter, data)
+        disconnect = asyncio.ensure_future(wait_for_disconnect(receive))
+        try:
+            done, _ = await asyncio.wait({call, disconnect}, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            disconnect.cancel()
+        status = None
+        if call in done:
+            try:
+                result = call.result().result
+            except Exception as e:
+                result = error_result(path, data, e)
+                status = 'error'
+        else:
+            call.cancel()
+            if disconnect in done:
+                REQUESTS.inc(route=path, status='disconnected')
+                return
+            result = error_result(path, data, f'request exceeded {timeout} second deadline')
+        REQUEST_SECONDS.observe(time.perf_counter() - start, route=path)
+        REQUESTS.inc(route=path, status=status or result.get('statusCode', ''))
+        return await send_json(send, result)
+
+    return app
+
+
+app = build_asgi_app()
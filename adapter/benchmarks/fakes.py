@@ -0,0 +1,111 @@
+''' Local stand-ins for the dWeather (v3) and dClimate zarr (v4) clients that
+    serve synthetic histories instead of reading IPFS, so the adapter pipelines
+    can be benchmarked without network access
+
+    install_fake_clients must run before anything imports program_catalog
+'''
+import sys
+import time
+import types
+import zlib
+
+import numpy as np
+import pandas as pd
+
+FAKE_HEAD = 'bafyfakehead'
+# datasets the stand-in v3 client lists heads for
+FAKE_DATASETS = ['era5_land_precip-hourly', 'cpc_precip_us-daily', 'ghcnd', 'cme_futures-daily']
+HISTORY_START = '1982-01-01'
+HISTORY_END = '2021-12-31 23:00'
+
+
+class SyntheticData:
+    ''' Generates deterministic synthetic histories. Each (dataset, location)
+        pair gets its own seeded series so that different cells differ, and the
+        same request always returns the same values
+
+        Parameters: start (str), first timestamp of every history
+                    end (str), last timestamp of every history
+                    fetch_latency (float), seconds each fetch sleeps to stand in for IPFS
+    '''
+
+    def __init__(self, start=HISTORY_START, end=HISTORY_END, fetch_latency=0.0):
+        self.start = start
+        self.end = end
+        self.fetch_latency = fetch_latency
+        self.fetches = 0
+
+    def frequency(self, dataset):
+        if 'hourly' in dataset:
+            return 'h'
+        return 'D'
+
+    def series(self, dataset, *key):
+        ''' Returns: Pandas Series, synthetic precipitation-like history of the dataset at the key '''
+        self.fetches += 1
+        if self.fetch_latency > 0:
+            time.sleep(self.fetch_latency)
+        index = pd.date_range(self.start, self.end, freq=self.frequency(dataset))
+        rng = np.random.default_rng(zlib.crc32(repr((dataset,) + key).encode('utf-8')))
+        values = rng.gamma(0.4, 0.3, size=len(index)) * (rng.random(len(index)) < 0.35)
+        return pd.Series(np.round(values, 4), index=index)
+
+    def history(self, dataset, *key):
+        ''' Returns: dict, timestamp: value mapping shaped like the v3 client's histories '''
+        return self.series(dataset, *key).to_dict()
+
+
+def build_v3_client(synthetic):
+    ''' Returns: module, stand-in for dweather_client.client '''
+    client = types.ModuleType('dweather_client.client')
+    client.GRIDDED_DATASETS = {}
+
+    def get_heads(*args, **kwargs):
+        return {dataset: FAKE_HEAD for dataset in FAKE_DATASETS}
+
+    def get_metadata(head, *args, **kwargs):
+        return {'date range': [synthetic.start, synthetic.end]}
+
+    def get_gridcell_history(lat, lon, dataset, **kwargs):
+        return synthetic.history(dataset, round(float(lat), 3), round(float(lon), 3)), 'inch'
+
+    def get_station_history(station_id, weather_variable, dataset='ghcnd', **kwargs):
+        return synthetic.history(dataset, station_id, weather_variable), 'inch'
+
+    client.get_heads = get_heads
+    client.get_metadata = get_metadata
+    client.get_gridcell_history = get_gridcell_history
+    client.get_station_history = get_station_history
+    return client
+
+
+def build_v4_client(synthetic):
+    ''' Returns: module, stand-in for dclimate_zarr_client.client '''
+    client = types.ModuleType('dclimate_zarr_client.client')
+
+    def geo_temporal_query(dataset_name, time_range=None, spatial_agg_kwargs=None, temporal_agg_kwargs=None, **kwargs):
+        points = kwargs.get('point_kwargs', None) or kwargs.get('multiple_points_kwargs', None) or {}
+        data = synthetic.series(dataset_name, repr(sorted(points.items(), key=str)) if isinstance(points, dict) else '')
+        if time_range is not None:
+            data = data.loc[time_range[0]:time_range[1]]
+        if temporal_agg_kwargs is not None:
+            values = [float(getattr(data, temporal_agg_kwargs.get('agg_method', 'mean'))())]
+        else:
+            values = data.to_numpy().tolist()
+        return {'data': values, 'times': [str(t) for t in data.index], 'unit of measurement': 'mm'}
+
+    client.geo_temporal_query = geo_temporal_query
+    return client
+
+
+def install_fake_clients(synthetic):
+    ''' Registers the stand-in clients in sys.modules in place of the real ones
+
+        Parameters: synthetic (SyntheticData), source of the served histories
+    '''
+    for package, client in (('dweather_client', build_v3_client(synthetic)),
+                            ('dclimate_zarr_client', build_v4_client(synthetic))):
+        module = types.ModuleType(package)
+        module.client = client
+        sys.modules[package] = module
+        sys.modules[f'{package}.client'] = client
@@ -0,0 +1,114 @@
+''' Benchmarks history normalization for each wrapper against the pipeline the
+    wrappers used before, to_float_series(data).set_axis(to_datetime(index)).sort_index(),
+    on 40 years of client output, and checks both give the same history
+
+    Run from the adapter directory:
+        python -m benchmarks.normalize
+        python -m benchmarks.normalize grid-history ghcn-history -n 5 --shuffle
+
+    Date keyed wrappers get 40 years of daily values, every other wrapper 40
+    years of hourly values in the key type its client returns
+'''
+import sys
+import time
+import random
+import argparse
+from datetime import date, datetime, timedelta, timezone
+
+import numpy as np
+import pandas as pd
+import astropy.units as u
+
+from program_catalog.tools.history import normalize_history
+from program_catalog.tools.units import to_float_series
+
+YEARS = 40
+START = datetime(1982, 1, 1)
+
+# wrapper key: (key type of the client history, whether the wrapper converts to UTC)
+WRAPPER_KEYS = {
+    'australia-station-history': ('date', False),
+    'cme-history': ('date', False),
+    'cwv-station-history': ('datetime', False),
+    'dutch-station-history': ('date', False),
+    'eaufrance': ('date', False),
+    'german-station-history': ('date', False),
+    'german-station-hourly-history': ('datetime', False),
+    'ghcn-history': ('date', False),
+    'ghisd-station-history': ('datetime', False),
+    'grid-history': ('aware', True),
+    'inmet': ('datetime', False),
+    'japan-station-history': ('datetime', False),
+    'power-history/ne_iso/load': ('datetime', False),
+    'teleconnections': ('date', False),
+    'uk-national-grid/sap': ('datetime', False),
+}
+
+
+def client_history(key_type, shuffle=False):
+    ''' Returns: dict, 40 years of inch Quantities keyed the way the client keys them '''
+    if key_type == 'date':
+        keys = [START.date() + timedelta(days=i) for i in range((date(START.year + YEARS, 1, 1) - START.date()).days)]
+    else:
+        hours = int((datetime(START.year + YEARS, 1, 1) - START).total_seconds() // 3600)
+        tz = timezone(timedelta(hours=-5)) if key_type == 'aware' else None
+        keys = [(START + timedelta(hours=i)).replace(tzinfo=tz) for i in range(hours)]
+    if shuffle:
+        random.Random(0).shuffle(keys)
+    values = np.random.default_rng(0).gamma(0.4, 0.3, size=len(keys)) * u.imperial.inch
+    return dict(zip(keys, values))
+
+
+def legacy_normalize(data, utc):
+    data = to_float_series(data)
+    if data.empty:
+        raise ValueError('No data returned for request')
+    return data.set_axis(pd.to_datetime(data.index, utc=utc)).sort_index()
+
+
+def best_of(function, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        timings.append(time.perf_counter() - start)
+    return min(timings), result
+
+
+def check_equal(legacy, normalized):
+    if not legacy.index.equals(normalized.index):
+        raise AssertionError('indexes differ')
+    if not np.array_equal(legacy.to_numpy(), normalized.to_numpy(), equal_nan=True):
+        raise AssertionError('values differ')
+    if legacy.attrs != normalized.attrs:
+        raise AssertionError('units differ')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark wrapper history normalization')
+    parser.add_argument('wrappers', nargs='*', help='wrapper keys to run, defaults to all')
+    parser.add_argument('-n', '--repeat', type=int, default=3, help='runs of each pipeline, the best is reported')
+    parser.add_argument('--shuffle', action='store_true', help='give the client keys out of time order')
+    args = parser.parse_args(argv)
+
+    names = args.wrappers or list(WRAPPER_KEYS)
+    unknown = [name for name in names if name not in WRAPPER_KEYS]
+    if unknown:
+        parser.error(f'unknown wrappers: {", ".join(unknown)}')
+
+    histories = {}
+    for name in names:
+        key_type, utc = WRAPPER_KEYS[name]
+        if key_type not in histories:
+            histories[key_type] = client_history(key_type, args.shuffle)
+        data = histories[key_type]
+        legacy_seconds, legacy = best_of(lambda: legacy_normalize(data, utc), args.repeat)
+        seconds, normalized = best_of(lambda: normalize_history(data, utc=utc), args.repeat)
+        check_equal(legacy, normalized)
+        print(f'{name:<32} {key_type:<8} n={len(data):<7} legacy {legacy_seconds * 1000:9.1f}ms '
+              f'normalized {seconds * 1000:9.1f}ms  x{legacy_seconds / seconds:.1f}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
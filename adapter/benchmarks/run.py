@@ -0,0 +1,213 @@
+''' Benchmarks the adapter pipelines end to end and per stage against local
+    stand-ins for the v3/v4 clients, and checks the results against regression
+    thresholds
+
+    Run from the adapter directory:
+        python -m benchmarks.run                       # all scenarios, warm caches
+        python -m benchmarks.run --cold                # purge in-memory caches before every request
+        python -m benchmarks.run api_era5_hourly -n 50 --concurrency 8
+        python -m benchmarks.run --update-thresholds   # record the current results as the new baseline
+
+    Each scenario runs in its own process so that peak RSS is per scenario.
+    Exits with status 1 if any scenario exceeds its thresholds
+'''
+import os
+import sys
+import json
+import time
+import argparse
+import resource
+import threading
+import multiprocessing
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from benchmarks.scenarios import SCENARIOS
+
+THRESHOLDS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'thresholds.json')
+# headroom applied to measured results when recording new thresholds
+THRESHOLD_HEADROOM = 1.5
+
+
+def summarize(samples):
+    ''' Returns: dict, count and p50/p99/mean latency in milliseconds of the samples in seconds '''
+    samples = np.asarray(samples, dtype=np.float64) * 1000
+    return {
+        'count': int(len(samples)),
+        'p50_ms': round(float(np.percentile(samples, 50)), 3),
+        'p99_ms': round(float(np.percentile(samples, 99)), 3),
+        'mean_ms': round(float(samples.mean()), 3),
+    }
+
+
+def run_scenario(name, requests, concurrency, warmup, cold, fetch_latency):
+    ''' Runs a scenario in the current process, which must not have imported
+        the adapter yet
+
+        Returns: dict, end to end and per stage latencies, throughput and peak RSS
+    '''
+    os.environ.setdefault('HISTORY_DISK_CACHE_DIR', '')
+    os.environ.setdefault('HEADS_FILE', '')
+    os.environ.setdefault('LOG_LEVEL', 'WARNING')
+    from benchmarks.fakes import SyntheticData, install_fake_clients
+    synthetic = SyntheticData(fetch_latency=fetch_latency)
+    install_fake_clients(synthetic)
+
+    from program_catalog.tools.cache import HISTORY_CACHE, LATEST_HISTORIES, RESULT_CACHE
+    from program_catalog.tools.crypto import clear_secret_caches
+    from program_catalog.tools.metrics import STAGE_SECONDS
+
+    def purge():
+        HISTORY_CACHE.purge()
+        RESULT_CACHE.purge()
+        LATEST_HISTORIES.purge()
+        clear_secret_caches()
+
+    serve = SCENARIOS[name]()
+    for _ in range(warmup):
+        if cold:
+            purge()
+        serve()
+
+    stages = defaultdict(list)
+    stages_lock = threading.Lock()
+    observe = STAGE_SECONDS.observe
+
+    def record(value, **labels):
+        with stages_lock:
+            stages[labels.get('stage', '')].append(value)
+        observe(value, **labels)
+
+    STAGE_SECONDS.observe = record
+
+    def timed_request():
+        if cold:
+            purge()
+        start = time.perf_counter()
+        serve()
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    if concurrency <= 1:
+        latencies = [timed_request() for _ in range(requests)]
+    else:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            latencies = list(executor.map(lambda _: timed_request(), range(requests)))
+    wall = time.perf_counter() - start
+    STAGE_SECONDS.observe = observe
+
+    return {
+        'scenario': name,
+        'mode': 'cold' if cold else 'warm',
+        'concurrency': concurrency,
+        'request': summarize(latencies),
+        'requests_per_second': round(requests / wall, 3),
+        'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        'fetches': synthetic.fetches,
+        'stages': {stage: summarize(samples) for stage, samples in sorted(stages.items())},
+    }
+
+
+def _run_in_process(queue, *args):
+    try:
+        queue.put(run_scenario(*args))
+    except BaseException as e:
+        queue.put({'scenario': args[0], 'error': repr(e)})
+
+
+def run_isolated(*args):
+    ''' Runs a scenario in a fresh spawned process and returns its report '''
+    context = multiprocessing.get_context('spawn')
+    queue = context.Queue()
+    process = context.Process(target=_run_in_process, args=(queue,) + args)
+    process.start()
+    report = queue.get()
+    process.join()
+    return report
+
+
+def check_thresholds(report, thresholds):
+    ''' Returns: list, descriptions of the thresholds the report exceeds '''
+    limits = thresholds.get(report['scenario'], {}).get(report['mode'], {})
+    failures = []
+    if 'p50_ms' in limits and report['request']['p50_ms'] > limits['p50_ms']:
+        failures.append(f"p50 {report['request']['p50_ms']}ms > {limits['p50_ms']}ms")
+    if 'p99_ms' in limits and report['request']['p99_ms'] > limits['p99_ms']:
+        failures.append(f"p99 {report['request']['p99_ms']}ms > {limits['p99_ms']}ms")
+    if 'min_rps' in limits and report['requests_per_second'] < limits['min_rps']:
+        failures.append(f"{report['requests_per_second']} req/s < {limits['min_rps']} req/s")
+    if 'max_rss_mb' in limits and report['peak_rss_mb'] > limits['max_rss_mb']:
+        failures.append(f"peak RSS {report['peak_rss_mb']}MB > {limits['max_rss_mb']}MB")
+    return failures
+
+
+def baseline(report):
+    ''' Returns: dict, thresholds for the report's scenario and mode with headroom '''
+    return {
+        'p50_ms': round(report['request']['p50_ms'] * THRESHOLD_HEADROOM, 1),
+        'p99_ms': round(report['request']['p99_ms'] * THRESHOLD_HEADROOM, 1),
+        'min_rps': round(report['requests_per_second'] / THRESHOLD_HEADROOM, 2),
+        'max_rss_mb': round(report['peak_rss_mb'] * THRESHOLD_HEADROOM, 1),
+    }
+
+
+def print_report(report, failures):
+    if 'error' in report:
+        print(f"{report['scenario']}: FAILED {report['error']}")
+        return
+    request = report['request']
+    status = 'REGRESSION ' + '; '.join(failures) if failures else 'ok'
+    print(f"{report['scenario']} [{report['mode']}, concurrency {report['concurrency']}]: "
+          f"p50 {request['p50_ms']}ms p99 {request['p99_ms']}ms {report['requests_per_second']} req/s "
+          f"peak RSS {report['peak_rss_mb']}MB fetches {report['fetches']} -> {status}")
+    for stage, summary in report['stages'].items():
+        print(f"    {stage:<16} n={summary['count']:<6} p50 {summary['p50_ms']}ms p99 {summary['p99_ms']}ms")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the adapter pipelines against synthetic data')
+    parser.add_argument('scenarios', nargs='*', help='scenarios to run, defaults to all')
+    parser.add_argument('-n', '--requests', type=int, default=20, help='timed requests per scenario')
+    parser.add_argument('--concurrency', type=int, default=1, help='requests issued concurrently')
+    parser.add_argument('--warmup', type=int, default=2, help='untimed requests before timing')
+    parser.add_argument('--cold', action='store_true', help='purge in-memory caches before every request')
+    parser.add_argument('--fetch-latency', type=float, default=0.0, help='seconds each synthetic fetch sleeps')
+    parser.add_argument('--thresholds', default=THRESHOLDS_FILE, help='regression thresholds file')
+    parser.add_argument('--update-thresholds', action='store_true', help='record these results as the thresholds')
+    parser.add_argument('--json', default=None, help='also write the reports to this file')
+    args = parser.parse_args(argv)
+
+    names = args.scenarios or list(SCENARIOS)
+    unknown = [name for name in names if name not in SCENARIOS]
+    if unknown:
+        parser.error(f'unknown scenarios: {", ".join(unknown)}')
+
+    with open(args.thresholds, 'r') as thresholds_file:
+        thresholds = json.load(thresholds_file)
+
+    reports = []
+    regressed = False
+    for name in names:
+        report = run_isolated(name, args.requests, args.concurrency, args.warmup, args.cold, args.fetch_latency)
+        failures = [] if 'error' in report else check_thresholds(report, thresholds)
+        regressed = regressed or bool(failures) or 'error' in report
+        print_report(report, failures)
+        reports.append(report)
+        if args.update_thresholds and 'error' not in report:
+            thresholds.setdefault(name, {})[report['mode']] = baseline(report)
+
+    if args.update_thresholds:
+        with open(args.thresholds, 'w') as thresholds_file:
+            json.dump(thresholds, thresholds_file, indent=4, sort_keys=True)
+            thresholds_file.write('\n')
+        print(f'wrote {args.thresholds}')
+    if args.json is not None:
+        with open(args.json, 'w') as json_file:
+            json.dump(reports, json_file, indent=4)
+    return 1 if regressed and not args.update_thresholds else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
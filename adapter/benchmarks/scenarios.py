@@ -0,0 +1,94 @@
+''' Benchmark scenarios. Each scenario builds its requests once and returns
+    a function serving one request end to end through the adapter classes
+
+    Scenarios import the adapter when they are built, so the fake clients must
+    be installed first (see benchmarks.fakes.install_fake_clients)
+'''
+import os
+import json
+import base64
+from datetime import datetime, timezone
+
+# key the benchmark node with a fixed private key before the crypto module loads it
+BENCHMARK_NODE_KEY = '6b' * 32
+os.environ.setdefault('NODE_PRIVATE_KEY', BENCHMARK_NODE_KEY)
+
+from Crypto.Cipher import AES
+
+
+def api_request(request_url, request_ops, request_params):
+    return {'id': 'bench', 'data': {'request_url': request_url, 'request_ops': request_ops, 'request_params': request_params}}
+
+
+def encrypt_contract(terms, access_key):
+    ''' Returns: str, base 64 NFT URI holding the AES-GCM encrypted contract terms '''
+    iv = os.urandom(32)
+    cipher = AES.new(access_key, AES.MODE_GCM, nonce=iv)
+    ciphertext, mac = cipher.encrypt_and_digest(json.dumps(terms).encode('utf-8'))
+    return base64.b64encode(iv + ciphertext + mac).decode()
+
+
+def evaluation_request(terms, start, end, program_name):
+    ''' Returns: dict, NFT evaluation request for the contract terms, encrypted
+        for the benchmark node the same way contracts are encrypted on chain
+    '''
+    from program_catalog.tools.crypto import NODE_KEY_MANAGER, encrypt_access_key
+    access_key = os.urandom(32)
+    node_public_key = NODE_KEY_MANAGER.private_key.public_key.format(compressed=False)
+    node_key = base64.b64encode(encrypt_access_key(access_key, node_public_key)).decode()
+    return {'id': 'bench', 'data': {
+        'nodeKey': node_key,
+        'jobType': 'evaluation',
+        'uri': encrypt_contract(terms, access_key),
+        'startDate': datetime(*start, tzinfo=timezone.utc).timestamp(),
+        'endDate': datetime(*end, tzinfo=timezone.utc).timestamp(),
+        'programName': program_name,
+    }}
+
+
+def grid(lat, lon, size, step=0.25):
+    ''' Returns: list, lat/lon pairs of a size x size block of gridcells '''
+    return [[str(lat + i * step), str(lon + j * step)] for i in range(size) for j in range(size)]
+
+
+def check_result(result):
+    if result.get('statusCode', None) != 200 or 'error' in result:
+        raise RuntimeError(f'benchmark request failed: {result}')
+    return result
+
+
+def api_era5_hourly():
+    ''' 40 years of hourly era5 for one gridcell, mean of the last 30 days '''
+    from api import dClimateAdapter
+    request = api_request('/apiv3/grid-history/era5_land_precip-hourly/1.375_103.875?use_imperial_units=true',
+                          ['last', 'mean'], ["['30D']", '[]'])
+    return lambda: check_result(dClimateAdapter(request).result)
+
+
+def api_station_daily():
+    ''' 40 years of daily GHCN station data, total over the history '''
+    from api import dClimateAdapter
+    request = api_request('/apiv3/ghcn-history/USW00014739/PRCP?use_imperial_units=true', ['sum'], ['[]'])
+    return lambda: check_result(dClimateAdapter(request).result)
+
+
+def nft_rainfall_grid():
+    ''' Encrypted rainfall contract over a 5 x 5 block of daily gridcells '''
+    from adapter import ArbolAdapter
+    terms = {
+        'dataset': 'cpc_precip_us-daily',
+        'locations': grid(40.125, -100.125, 5),
+        'strike': '10',
+        'limit': '1000',
+        'tick': '50',
+        'opt_type': 'PUT',
+    }
+    request = evaluation_request(terms, (2021, 3, 1), (2021, 5, 31), 'GRP-benchmark')
+    return lambda: check_result(ArbolAdapter(request).result)
+
+
+SCENARIOS = {
+    'api_era5_hourly': api_era5_hourly,
+    'api_station_daily': api_station_daily,
+    'nft_rainfall_grid': nft_rainfall_grid,
+}
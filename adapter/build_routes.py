@@ -0,0 +1,11 @@
+''' Compiles swaggers/*.json into program_catalog/tools/api_routes.py
+
+    Run after changing any swagger file:
+        python build_routes.py
+'''
+from program_catalog.tools.routes import write_routes_module, ROUTES_MODULE
+
+
+if __name__ == '__main__':
+    write_routes_module()
+    print(f'wrote {ROUTES_MODULE}')
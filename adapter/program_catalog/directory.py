@@ -1,8 +1,13 @@
+import json
+import logging
+
 from program_catalog.programs.rainfall_derivative import RainfallDerivative
 from program_catalog.programs.critical_snowfall_derivative import CriticalSnowfallDerivative
-from program_catalog.tools.crypto import Reencryption, decrypt
+from program_catalog.tools.crypto import Reencryption, BatchReencryption, decrypt
 from program_catalog.tools.loaders import parse_timestamp
 
+logger = logging.getLogger(__name__)
+
 
 def get_parameters_and_program(request_data):
     ''' Parses decrypted data and maps named contract terms to 
@@ -16,12 +21,12 @@ def get_parameters_and_program(request_data):
     if node_key is None:
         return 'node key missing', None
 
-    # get job type (currently, evaluation or reencryption)
+    # get job type (currently, evaluation, reencryption or batch_reencryption)
     job_type = request_data.get('jobType', None)
     if job_type is None:
-        return 'job type (reencryption, evaluation) missing', None
+        return 'job type (reencryption, batch_reencryption, evaluation) missing', None
     elif job_type == "reencryption":
-        print(f'reencryption job node key {node_key}', flush=True)
+        logger.debug('reencryption job')
         # reencryption job requires public key of new viewer
         public_key = request_data.get('viewerAddressPublicKey', None)
         if public_key is None:
@@ -31,12 +36,25 @@ def get_parameters_and_program(request_data):
             "public_key": public_key
         }
         program = Reencryption
+    elif job_type == "batch_reencryption":
+        logger.debug('batch reencryption job')
+        # batch reencryption job requires the public keys of every new viewer
+        public_keys = request_data.get('viewerAddressPublicKeys', None)
+        if public_keys is None:
+            return 'public keys missing', None
+        if isinstance(public_keys, str):
+            public_keys = json.loads(public_keys)
+        parameters = {
+            "node_key": node_key,
+            "public_keys": public_keys
+        }
+        program = BatchReencryption
     else:
         # evaluation job requires program name, start date, end date, and remaining encrypted terms (URI)
         request_uri = request_data.get('uri', None)
         if request_uri is None:
             return 'token URI missing', None
-        print(f'evaluation job uri {request_uri}', flush=True)
+        logger.debug('evaluation job for program %s', request_data.get('programName', None))
         request_start_date = request_data.get('startDate', None)
         if request_start_date is None:
             return 'request start date is missing', None
@@ -76,11 +94,11 @@ def parse_and_validate(request_data):
                     then program is None
     '''
     try:
-        print(f'parsing parameters {request_data}', flush=True)
+        logger.debug('parsing parameters for job type %s', request_data.get('jobType', None))
         parameters, program = get_parameters_and_program(request_data)
         if program is None:
             return parameters, None
-        print(f'validating parameters {parameters}', flush=True)
+        logger.debug('validating parameters for %s', program.__name__)
         valid, request_error = program.validate_request(parameters)
         if not valid:
             return request_error, None
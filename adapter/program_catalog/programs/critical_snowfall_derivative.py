@@ -1,6 +1,11 @@
 # from datetime import datetime
 
+import numpy as np
+
 from program_catalog.tools.loaders import StationLoader
+from program_catalog.tools.metrics import timed
+from program_catalog.tools.units import to_value
+from program_catalog.tools.window_index import WINDOW_INDEX_MIN_WINDOWS, WindowIndex
 
 
 class CriticalSnowfallDerivative:
@@ -45,12 +50,7 @@ class CriticalSnowfallDerivative:
             Parameters: params (dict), dictionary of required contract parameters
             Returns: number, the determined payout (0 if not awarded)
         '''
-        loader = StationLoader(params['dates'],
-                                    params['station_id'],
-                                    params['weather_variable'],
-                                    dataset_name=params['dataset'],
-                                    imperial_units=params.get('imperial_units', True)
-                                    )
+        loader = cls._get_loader(params)
         covered_history = loader.load()
         payout = cls._generate_payouts(data=covered_history,
                                         threshold=params['threshold'],
@@ -60,6 +60,64 @@ class CriticalSnowfallDerivative:
         return payout
 
     @classmethod
+    def history_key(cls, params):
+        ''' Identifies the weather data a contract is evaluated against so that
+            contracts sharing it can be evaluated together
+
+            Parameters: params (dict), dictionary of required contract parameters
+            Returns: tuple, hashable key of the dataset, station, and variable
+        '''
+        return (params['dataset'], params['station_id'], params['weather_variable'], str(params.get('imperial_units', True)))
+
+    @classmethod
+    def history_window(cls, params):
+        ''' Returns: tuple, (start, end) of the weather data the contract needs '''
+        dates = cls._get_loader(params).dates
+        if len(dates) == 0:
+            return (None, None)
+        return (min(dates), max(dates))
+
+    @classmethod
+    def load_history(cls, params, window=None):
+        ''' Loads the station history for the contract's station and variable
+
+            Parameters: params (dict), dictionary of required contract parameters
+                        window (tuple), (start, end) of the data to load, defaults
+                        to the span of the contract's covered dates
+            Returns: Pandas Series, station weather data
+        '''
+        return cls._get_loader(params, window).load_history()
+
+    @classmethod
+    def serve_batch(cls, history, params_list):
+        ''' Computes the payouts of contracts sharing the given station history
+
+            Parameters: history (Pandas Series), station weather data
+                        params_list (list), contract parameters of each contract
+            Returns: list, the determined payouts in the order of the contracts
+        '''
+        return cls._generate_payouts_batch(data=history,
+                                            dates=[cls._get_loader(params).dates for params in params_list],
+                                            thresholds=[params['threshold'] for params in params_list],
+                                            opt_types=[params['opt_type'] for params in params_list],
+                                            limits=[params['limit'] for params in params_list]
+                                            )
+
+    @classmethod
+    def _get_loader(cls, params, window=None):
+        ''' Returns: StationLoader, loader for the contract's station and covered dates '''
+        start, end = window if window is not None else (None, None)
+        return StationLoader(params['dates'],
+                             params['station_id'],
+                             params['weather_variable'],
+                             dataset_name=params['dataset'],
+                             imperial_units=params.get('imperial_units', True),
+                             start=start,
+                             end=end
+                             )
+
+    @classmethod
+    @timed('payout', endpoint='CriticalSnowfallDerivative')
     def _generate_payouts(cls, data, threshold, opt_type, limit):
         ''' Uses the provided contract parameters to calculate a payout and index
 
@@ -76,7 +134,7 @@ class CriticalSnowfallDerivative:
 
         limit = float(limit)
 
-        index_value = data.max().value
+        index_value = to_value(data.max())
         opt_type = opt_type.lower()
         direction = 1 if opt_type == 'call' else -1
         
@@ -85,4 +143,47 @@ class CriticalSnowfallDerivative:
             payout = 0
         if payout > 0:
             payout = limit
-        return int(payout * cls._OUTPUT_MULTIPLIER)
\ No newline at end of file
+        return int(payout * cls._OUTPUT_MULTIPLIER)
+
+    @classmethod
+    @timed('payout_batch', endpoint='CriticalSnowfallDerivative')
+    def _generate_payouts_batch(cls, data, dates, thresholds, opt_types, limits):
+        ''' Computes the payouts of many contracts sharing one station history
+            in a single pass. The index of each distinct set of covered dates is
+            computed once and the payout formula is evaluated over arrays of
+            contract terms
+
+            Batches with many sets of covered dates take their maxima from a
+            WindowIndex over the history instead of selecting the dates each time
+
+            Payouts are identical to calling _generate_payouts for each contract
+
+            Parameters: data (Pandas Series), station weather data
+                        dates (list), covered dates of each contract, or None to use
+                        the whole series
+                        thresholds (list), weather variable thresholds
+                        opt_types (list), option types, either PUT or CALL
+                        limits (list), limit values
+            Returns: list, generated payouts times 10^6 in the order of the contracts
+        '''
+        coverages = [None if covered is None else tuple(covered) for covered in dates]
+        distinct = set(coverages)
+        index = None
+        if len(distinct) >= WINDOW_INDEX_MIN_WINDOWS and WindowIndex.supports(data):
+            index = WindowIndex(data)
+        coverage_values = {}
+        for covered in distinct:
+            value = None if covered is None or index is None else index.max_at(list(covered))
+            if value is None:
+                covered_data = data if covered is None else data.loc[list(covered)]
+                value = covered_data.max()
+            coverage_values[covered] = to_value(value)
+        index_values = np.array([coverage_values[covered] for covered in coverages], dtype=np.float64)
+
+        thresholds = np.array([float(threshold) for threshold in thresholds])
+        limits = np.array([float(limit) for limit in limits])
+        directions = np.array([1 if opt_type.lower() == 'call' else -1 for opt_type in opt_types])
+
+        payouts = (index_values - thresholds) * directions
+        payouts = np.where(payouts > 0, limits, np.where(payouts < 0, 0.0, payouts))
+        return [int(payout * cls._OUTPUT_MULTIPLIER) for payout in payouts.tolist()]
@@ -1,6 +1,22 @@
 # from datetime import datetime
 
-from program_catalog.tools.loaders import GridcellLoader
+import os
+import ast
+import json
+import logging
+import numpy as np
+
+from program_catalog.tools.loaders import GridcellLoader, MultiPointLoader, compare_loaders
+from program_catalog.tools.metrics import timed
+from program_catalog.tools.window_index import WINDOW_INDEX_MIN_WINDOWS, WINDOW_INDEX_SUMS, WindowIndex
+
+# 'gridcell' averages v3 gridcells client side, 'multi_point' reads the average with
+# one v4 query and 'shadow' serves the gridcell average while comparing both
+RAINFALL_HISTORY_SOURCE = os.getenv("RAINFALL_HISTORY_SOURCE", "gridcell")
+# v3 dataset name: v4 dataset name, for datasets whose names differ between the APIs
+MULTI_POINT_DATASETS = json.loads(os.getenv("MULTI_POINT_DATASETS", "{}"))
+
+logger = logging.getLogger(__name__)
 
 
 class RainfallDerivative:
@@ -45,11 +61,7 @@ class RainfallDerivative:
             Parameters: params (dict), dictionary of required contract parameters
             Returns: number, the determined payout (0 if not awarded)
         '''
-        loader = GridcellLoader(params['locations'],
-                                params['dataset'],
-                                imperial_units=True         # force imperial units = true
-                                )
-        avg_history = loader.load()
+        avg_history = cls.load_history(params)
         payout = cls._generate_payouts(data=avg_history,
                                         start=params['start'],
                                         end=params['end'],
@@ -62,6 +74,80 @@ class RainfallDerivative:
         return payout
 
     @classmethod
+    def history_key(cls, params):
+        ''' Identifies the weather data a contract is evaluated against so that
+            contracts sharing it can be evaluated together
+
+            Parameters: params (dict), dictionary of required contract parameters
+            Returns: tuple, hashable key of the dataset and locations
+        '''
+        locations = params['locations']
+        if isinstance(locations, str):
+            locations = ast.literal_eval(locations)
+        return (params['dataset'], tuple((float(lat), float(lon)) for (lat, lon) in locations))
+
+    @classmethod
+    def history_window(cls, params):
+        ''' Returns: tuple, (start, end) of the weather data the contract needs '''
+        return (params['start'], params['end'])
+
+    @classmethod
+    def load_history(cls, params, window=None):
+        ''' Loads the weather data averaged over the contract's locations
+
+            Parameters: params (dict), dictionary of required contract parameters
+                        window (tuple), (start, end) of the data to load, defaults
+                        to the contract's coverage period
+            Returns: Pandas Series, weather data averaged over locations
+        '''
+        start, end = window if window is not None else cls.history_window(params)
+        if RAINFALL_HISTORY_SOURCE == 'multi_point':
+            return cls._get_multi_point_loader(params, start, end).load()
+        loader = GridcellLoader(params['locations'],
+                                params['dataset'],
+                                imperial_units=True,        # force imperial units = true
+                                start=start,
+                                end=end
+                                )
+        history = loader.load()
+        if RAINFALL_HISTORY_SOURCE == 'shadow':
+            try:
+                summary = compare_loaders(history, cls._get_multi_point_loader(params, start, end).load())
+                logger.info('multi point history comparison for %s', params['dataset'], extra={'comparison': summary})
+            except Exception as e:
+                logger.warning('multi point history comparison for %s failed: %s', params['dataset'], e)
+        return history
+
+    @classmethod
+    def _get_multi_point_loader(cls, params, start, end):
+        ''' Returns: MultiPointLoader, loader averaging the contract's locations with one v4 query '''
+        return MultiPointLoader(params['locations'],
+                                MULTI_POINT_DATASETS.get(params['dataset'], params['dataset']),
+                                imperial_units=True,
+                                start=start,
+                                end=end
+                                )
+
+    @classmethod
+    def serve_batch(cls, history, params_list):
+        ''' Computes the payouts of contracts sharing the given weather data
+
+            Parameters: history (Pandas Series), weather data averaged over locations
+                        params_list (list), contract parameters of each contract
+            Returns: list, the determined payouts in the order of the contracts
+        '''
+        return cls._generate_payouts_batch(data=history,
+                                            starts=[params['start'] for params in params_list],
+                                            ends=[params['end'] for params in params_list],
+                                            opt_types=[params['opt_type'] for params in params_list],
+                                            strikes=[params['strike'] for params in params_list],
+                                            limits=[params['limit'] for params in params_list],
+                                            exhausts=[params.get('exhaust', None) for params in params_list],
+                                            ticks=[params.get('tick', None) for params in params_list]
+                                            )
+
+    @classmethod
+    @timed('payout', endpoint='RainfallDerivative')
     def _generate_payouts(cls, data, start, end, opt_type, strike, limit, exhaust, tick):
         ''' Uses the provided contract parameters to calculate a payout and index
 
@@ -76,39 +162,90 @@ class RainfallDerivative:
                         tick (str), tick value for payout or None if exhaust is not None
             Returns: int, generated payout times 10^8 (in order to report back to chain)
         '''
-        print(f'data: {data}', flush=True)
-        print(f'start: {start}', flush=True)
-        print(f'end: {end}', flush=True)
+        logger.debug('generating payout from %s to %s over %d values', start, end, len(data))
 
         strike = float(strike)
         limit = float(limit)
 
-        print(f'strike: {strike}', flush=True)
-        print(f'limit: {limit}', flush=True)
-
         index_value = data.loc[start:end].sum()
         opt_type = opt_type.lower()
         direction = 1 if opt_type == 'call' else -1
 
-        print(f'index_value: {index_value}', flush=True)
-        print(f'opt_type: {opt_type}', flush=True)
-        print(f'direction: {direction}', flush=True)
-
-        print(f'exhaust: {exhaust}', flush=True)
-        print(f'tick: {tick}', flush=True)
         if tick is not None:
             tick = float(tick)
         else:
             exhaust = float(exhaust)
             tick = abs(limit / (strike - exhaust))
-        print(f'exhaust: {exhaust}', flush=True)
-        print(f'tick: {tick}', flush=True)
 
         payout = (index_value - strike) * tick * direction
-        print(f'payout: {payout}', flush=True)
+        logger.debug('index_value: %s, opt_type: %s, strike: %s, limit: %s, exhaust: %s, tick: %s, payout: %s',
+                     index_value, opt_type, strike, limit, exhaust, tick, payout)
         if payout < 0:
             payout = 0
         if payout > limit:
             payout = limit
-        print(f'result: {int(float(round(payout, 2)) * cls._OUTPUT_MULTIPLIER)}', flush=True)
         return int(float(round(payout, 2)) * cls._OUTPUT_MULTIPLIER)
+
+    @classmethod
+    @timed('payout_batch', endpoint='RainfallDerivative')
+    def _generate_payouts_batch(cls, data, starts, ends, opt_types, strikes, limits, exhausts, ticks):
+        ''' Computes the payouts of many contracts sharing one weather data series
+            in a single pass. Each distinct coverage period is summed once and the
+            payout formula is evaluated over arrays of contract terms
+
+            Payouts are identical to calling _generate_payouts for each contract,
+            including the rounding of the payout and the integer conversion. With
+            WINDOW_INDEX_SUMS, batches with many coverage periods sum them from a
+            WindowIndex instead, whose sums can differ from the slices' in the last
+            bits and so move a payout sitting on a rounding boundary by one cent
+
+            Parameters: data (Pandas Series), weather data averaged over locations
+                        starts (list), start dates of the coverage periods
+                        ends (list), end dates of the coverage periods
+                        opt_types (list), option types, either PUT or CALL
+                        strikes (list), strike values
+                        limits (list), limit values
+                        exhausts (list), exhaust values or None where a tick is given
+                        ticks (list), tick values or None where an exhaust is given
+            Returns: list, generated payouts times 10^2 in the order of the contracts
+        '''
+        windows = list(zip(starts, ends))
+        distinct = set(windows)
+        if WINDOW_INDEX_SUMS and len(distinct) >= WINDOW_INDEX_MIN_WINDOWS and WindowIndex.supports(data):
+            index = WindowIndex(data)
+            window_values = {window: index.sum(window[0], window[1]) for window in distinct}
+        else:
+            window_values = {window: data.loc[window[0]:window[1]].sum() for window in distinct}
+        index_values = [window_values[window] for window in windows]
+        index_values = [getattr(value, 'value', value) for value in index_values]
+
+        strikes = np.array([float(strike) for strike in strikes])
+        limits = np.array([float(limit) for limit in limits])
+        has_tick = np.array([tick is not None for tick in ticks])
+        given_ticks = np.array([float(tick) if tick is not None else np.nan for tick in ticks])
+        exhausts = np.array([float(exhaust) if tick is None else np.nan for exhaust, tick in zip(exhausts, ticks)])
+        spreads = strikes - exhausts
+        if np.any(~has_tick & (spreads == 0)):
+            raise ZeroDivisionError('float division by zero')
+        with np.errstate(divide='ignore', invalid='ignore'):
+            derived_ticks = np.abs(limits / spreads)
+        ticks = np.where(has_tick, given_ticks, derived_ticks)
+        directions = np.array([1 if opt_type.lower() == 'call' else -1 for opt_type in opt_types])
+
+        payouts = (np.array(index_values, dtype=np.float64) - strikes) * ticks * directions
+        below = payouts < 0
+        payouts = np.where(below, 0, payouts)
+        above = payouts > limits
+        payouts = np.where(above, limits, payouts)
+
+        results = []
+        for i, payout in enumerate(payouts.tolist()):
+            # keep the scalar types of the single contract path so rounding matches exactly
+            if above[i]:
+                payout = float(limits[i])
+            elif below[i]:
+                payout = 0
+            elif isinstance(index_values[i], np.floating):
+                payout = np.float64(payout)
+            results.append(int(float(round(payout, 2)) * cls._OUTPUT_MULTIPLIER))
+        return results
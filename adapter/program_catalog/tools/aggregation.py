@@ -0,0 +1,110 @@
+import numpy as np
+import pandas as pd
+import astropy.units as u
+
+from program_catalog.tools.units import series_unit, set_unit
+
+
+def latitude_weights(locations):
+    ''' Area weights for gridcells of equal angular size, proportional to the
+        cosine of each cell's latitude
+
+        Parameters: locations (list), lat/lon coordinate pairs
+        Returns: list, weight of each location
+    '''
+    return [float(np.cos(np.radians(float(lat)))) for (lat, _) in locations]
+
+
+class StreamingMean:
+    ''' Averages many time series without holding them all at once. Each series
+        is folded into running sum and count arrays aligned on the union of the
+        indexes seen so far, so memory stays proportional to one history however
+        many series are added
+
+        Missing values are skipped the way DataFrame.mean(axis=1) skips them and
+        series are summed in the order they are added. The unweighted mean of
+        series added in the same order as the columns of a DataFrame agrees with
+        its mean(axis=1) to floating point rounding; from nine columns on Pandas
+        no longer sums each row strictly in column order and the last bits differ
+
+        Series of Quantities are averaged on their values in the unit of the
+        first Quantity seen and, like mean(axis=1), the result holds plain
+        numbers. The unit of the first float history is kept in the result
+    '''
+
+    def __init__(self):
+        self._index = None
+        self._sums = None
+        self._weights = None
+        self._object = False
+        self._unit = None
+        self._unit_attr = None
+
+    def add(self, series, weight=None):
+        ''' Folds a series into the running mean
+
+            Parameters: series (Pandas Series), series to add
+                        weight (float), weight of the series or None for an unweighted mean
+        '''
+        values = self._values(series)
+        if self._index is None:
+            self._unit_attr = series_unit(series)
+        present = ~np.isnan(values)
+        if weight is None:
+            contribution = np.where(present, values, 0.0)
+            counts = present.astype(np.float64)
+        else:
+            contribution = np.where(present, values * weight, 0.0)
+            counts = np.where(present, float(weight), 0.0)
+        if self._index is None:
+            self._index = series.index
+            self._sums = contribution
+            self._weights = counts
+            return
+        if not series.index.equals(self._index):
+            self._align(series.index)
+            positions = self._index.get_indexer(series.index)
+            np.add.at(self._sums, positions, contribution)
+            np.add.at(self._weights, positions, counts)
+            return
+        self._sums += contribution
+        self._weights += counts
+
+    def result(self):
+        ''' Returns: Pandas Series, the mean of the added series, NaN where no
+            series had a value
+        '''
+        if self._index is None:
+            return pd.Series(dtype=np.float64)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = np.where(self._weights > 0, self._sums / self._weights, np.nan)
+        if self._object:
+            return pd.Series(mean.tolist(), index=self._index, dtype=object)
+        return set_unit(pd.Series(mean, index=self._index), self._unit_attr)
+
+    def _values(self, series):
+        if series.dtype != object:
+            return series.to_numpy(dtype=np.float64, copy=True)
+        self._object = True
+        values = np.empty(len(series), dtype=np.float64)
+        for i, value in enumerate(series):
+            if isinstance(value, u.Quantity):
+                if self._unit is None:
+                    self._unit = value.unit
+                values[i] = value.to_value(self._unit)
+            elif value is None or pd.isna(value):
+                values[i] = np.nan
+            else:
+                values[i] = value
+        return values
+
+    def _align(self, index):
+        union = self._index.union(index)
+        if union.equals(self._index):
+            return
+        positions = union.get_indexer(self._index)
+        sums = np.zeros(len(union), dtype=np.float64)
+        weights = np.zeros(len(union), dtype=np.float64)
+        sums[positions] = self._sums
+        weights[positions] = self._weights
+        self._index, self._sums, self._weights = union, sums, weights
@@ -0,0 +1,200 @@
+# Generated by build_routes.py from the swagger files, do not edit
+
+SWAGGER_HASH = 'ed53c6c22d0768514a17f6c48cf43ee79dab7c1492ec3e86f0dc88411e72c281'
+
+API_ROUTES = {'/apiv3': {'basePath': '/apiv3/',
+            'paths': {'australia-station-history': {'name': '/australia-station-history/{station_name}/{weather_variable}',
+                                                    'primary': ['station_name', 'weather_variable'],
+                                                    'secondary': ['desired_units'],
+                                                    'types': {'weather_variable': 'string',
+                                                              'station_name': 'string',
+                                                              'desired_units': 'string'}},
+                      'cme-futures/stations': {'name': '/cme-futures/stations',
+                                               'primary': [],
+                                               'secondary': ['forecast_date'],
+                                               'types': {'forecast_date': 'string'}},
+                      'cme-futures': {'name': '/cme-futures/{station_id}',
+                                      'primary': ['station_id'],
+                                      'secondary': ['forecast_date'],
+                                      'types': {'station_id': 'string', 'forecast_date': 'string'}},
+                      'cme-history': {'name': '/cme-history/{station_id}/{weather_variable}',
+                                      'primary': ['station_id', 'weather_variable'],
+                                      'secondary': ['use_imperial_units', 'desired_units'],
+                                      'types': {'weather_variable': 'string',
+                                                'station_id': 'string',
+                                                'use_imperial_units': 'boolean',
+                                                'desired_units': 'string'}},
+                      'cwv-station-history': {'name': '/cwv-station-history/{station_name}/{weather_variable}',
+                                              'primary': ['station_name', 'weather_variable'],
+                                              'secondary': [],
+                                              'types': {'weather_variable': 'string', 'station_name': 'string'}},
+                      'drought-monitor': {'name': '/drought-monitor/{state}-{county}',
+                                          'primary': ['state', 'county'],
+                                          'secondary': [],
+                                          'types': {'state': 'string', 'county': 'string'}},
+                      'dutch-station-history': {'name': '/dutch-station-history/{station_id}/{weather_variable}',
+                                                'primary': ['station_id', 'weather_variable'],
+                                                'secondary': ['use_imperial_units', 'desired_units'],
+                                                'types': {'weather_variable': 'string',
+                                                          'station_id': 'string',
+                                                          'use_imperial_units': 'boolean',
+                                                          'desired_units': 'string'}},
+                      'eaufrance': {'name': '/eaufrance/{station_id}/{weather_variable}',
+                                    'primary': ['station_id', 'weather_variable'],
+                                    'secondary': ['use_imperial_units', 'desired_units'],
+                                    'types': {'weather_variable': 'string',
+                                              'station_id': 'string',
+                                              'use_imperial_units': 'boolean',
+                                              'desired_units': 'string'}},
+                      'forecasts': {'name': '/forecasts/{dataset}/{lat}_{lon}',
+                                    'primary': ['dataset', 'lat', 'lon'],
+                                    'secondary': ['forecast_date',
+                                                  'also_return_metadata',
+                                                  'use_imperial_units',
+                                                  'desired_units',
+                                                  'also_return_snapped_coordinates',
+                                                  'convert_to_local_time'],
+                                    'types': {'dataset': 'string',
+                                              'lat': 'string',
+                                              'lon': 'string',
+                                              'forecast_date': 'string',
+                                              'also_return_metadata': 'boolean',
+                                              'use_imperial_units': 'boolean',
+                                              'desired_units': 'string',
+                                              'also_return_snapped_coordinates': 'boolean',
+                                              'convert_to_local_time': 'boolean'}},
+                      'german-station-history': {'name': '/german-station-history/{station_id}/{weather_variable}',
+                                                 'primary': ['station_id', 'weather_variable'],
+                                                 'secondary': ['use_imperial_units', 'desired_units'],
+                                                 'types': {'weather_variable': 'string',
+                                                           'station_id': 'string',
+                                                           'use_imperial_units': 'boolean',
+                                                           'desired_units': 'string'}},
+                      'german-station-hourly-history': {'name': '/german-station-hourly-history/{station_id}/{weather_variable}',
+                                                        'primary': ['station_id', 'weather_variable'],
+                                                        'secondary': ['use_imperial_units', 'desired_units'],
+                                                        'types': {'weather_variable': 'string',
+                                                                  'station_id': 'string',
+                                                                  'use_imperial_units': 'boolean',
+                                                                  'desired_units': 'string'}},
+                      'ghcn-history': {'name': '/ghcn-history/{station_id}/{weather_variable}',
+                                       'primary': ['station_id', 'weather_variable'],
+                                       'secondary': ['use_imperial_units',
+                                                     'desired_units',
+                                                     'rounding_method',
+                                                     'dataset'],
+                                       'types': {'weather_variable': 'string',
+                                                 'station_id': 'string',
+                                                 'use_imperial_units': 'boolean',
+                                                 'desired_units': 'string',
+                                                 'rounding_method': 'string',
+                                                 'dataset': 'string'}},
+                      'ghisd-station-history': {'name': '/ghisd-station-history/{station_id}/{weather_variable}',
+                                                'primary': ['station_id', 'weather_variable'],
+                                                'secondary': ['use_imperial_units', 'desired_units'],
+                                                'types': {'weather_variable': 'string',
+                                                          'station_id': 'string',
+                                                          'use_imperial_units': 'boolean',
+                                                          'desired_units': 'string'}},
+                      'grid-history': {'name': '/grid-history/{dataset}/{lat}_{lon}',
+                                       'primary': ['dataset', 'lat', 'lon'],
+                                       'secondary': ['also_return_metadata',
+                                                     'use_imperial_units',
+                                                     'desired_units',
+                                                     'also_return_snapped_coordinates',
+                                                     'convert_to_local_time',
+                                                     'as_of'],
+                                       'types': {'dataset': 'string',
+                                                 'lat': 'string',
+                                                 'lon': 'string',
+                                                 'also_return_metadata': 'boolean',
+                                                 'use_imperial_units': 'boolean',
+                                                 'desired_units': 'string',
+                                                 'also_return_snapped_coordinates': 'boolean',
+                                                 'convert_to_local_time': 'boolean',
+                                                 'as_of': 'string'}},
+                      'inmet': {'name': '/inmet/{station_id}/{weather_variable}',
+                                'primary': ['station_id', 'weather_variable'],
+                                'secondary': ['use_imperial_units', 'desired_units'],
+                                'types': {'weather_variable': 'string',
+                                          'station_id': 'string',
+                                          'use_imperial_units': 'boolean',
+                                          'desired_units': 'string'}},
+                      'irrigation_splits': {'name': '/irrigation_splits/{commodity}',
+                                            'primary': ['commodity'],
+                                            'secondary': [],
+                                            'types': {'commodity': 'string'}},
+                      'japan-station-history': {'name': '/japan-station-history/{station_name}/{weather_variable}',
+                                                'primary': ['station_name', 'weather_variable'],
+                                                'secondary': ['desired_units'],
+                                                'types': {'weather_variable': 'string',
+                                                          'station_name': 'string',
+                                                          'desired_units': 'string'}},
+                      'metadata': {'name': '/metadata/{dataset}',
+                                   'primary': ['dataset'],
+                                   'secondary': ['full_metadata'],
+                                   'types': {'dataset': 'string', 'full_metadata': 'boolean'}},
+                      'power-history/ne_iso/load': {'name': '/power-history/ne_iso/load',
+                                                    'primary': [],
+                                                    'secondary': ['use_imperial_units', 'desired_units'],
+                                                    'types': {'use_imperial_units': 'boolean',
+                                                              'desired_units': 'string'}},
+                      'storms': {'name': '/storms/{source}/{basin}',
+                                 'primary': ['source', 'basin'],
+                                 'secondary': ['radius',
+                                               'lat',
+                                               'lon',
+                                               'min_lat',
+                                               'min_lon',
+                                               'max_lat',
+                                               'max_lon',
+                                               'as_of'],
+                                 'types': {'basin': 'string',
+                                           'source': 'string',
+                                           'radius': 'string',
+                                           'lat': 'string',
+                                           'lon': 'string',
+                                           'min_lat': 'string',
+                                           'min_lon': 'string',
+                                           'max_lat': 'string',
+                                           'max_lon': 'string',
+                                           'as_of': 'string'}},
+                      'teleconnections': {'name': '/teleconnections/{weather_variable}',
+                                          'primary': ['weather_variable'],
+                                          'secondary': [],
+                                          'types': {'weather_variable': 'string'}},
+                      'transitional_yield': {'name': '/transitional_yield/{commodity}_{state}_{county}',
+                                             'primary': ['commodity', 'state', 'county'],
+                                             'secondary': ['impute'],
+                                             'types': {'county': 'string',
+                                                       'state': 'string',
+                                                       'commodity': 'string',
+                                                       'impute': 'boolean'}},
+                      'uk-national-grid/sap': {'name': '/uk-national-grid/sap/',
+                                               'primary': [],
+                                               'secondary': [],
+                                               'types': {}},
+                      'yield': {'name': '/yield/{commodity}_{state}_{county}',
+                                'primary': ['commodity', 'state', 'county'],
+                                'secondary': ['impute', 'fill'],
+                                'types': {'county': 'string',
+                                          'state': 'string',
+                                          'commodity': 'string',
+                                          'impute': 'boolean',
+                                          'fill': 'boolean'}}}},
+ '/apiv4': {'basePath': '/apiv4/',
+            'paths': {'geo_temporal_query': {'name': '/geo_temporal_query/{dataset}',
+                                             'primary': ['dataset'],
+                                             'secondary': ['also_return_metadata',
+                                                           'use_imperial_units',
+                                                           'desired_units',
+                                                           'also_return_snapped_coordinates',
+                                                           'convert_to_local_time',
+                                                           'as_of'],
+                                             'types': {'dataset': 'string',
+                                                       'also_return_metadata': 'boolean',
+                                                       'use_imperial_units': 'boolean',
+                                                       'desired_units': 'string',
+                                                       'also_return_snapped_coordinates': 'boolean',
+                                                       'convert_to_local_time': 'boolean',
+                                                       'as_of': 'string'}}}}}
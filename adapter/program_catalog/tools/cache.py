@@ -0,0 +1,361 @@
+import os
+import json
+import time
+import hmac
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from datetime import date, datetime
+from functools import wraps
+
+import numpy as np
+import pandas as pd
+
+from program_catalog.tools.disk_cache import HISTORY_DISK_CACHE
+from program_catalog.tools.metrics import TAIL_REFRESHES
+from program_catalog.tools.units import series_unit, set_unit
+
+HISTORY_CACHE_SIZE = int(os.getenv("HISTORY_CACHE_SIZE", 256))
+HISTORY_CACHE_TTL = float(os.getenv("HISTORY_CACHE_TTL", 3600))
+# per-dataset overrides, e.g. '{"era5_land_precip-hourly": 900, "ghcnd": 21600}'
+HISTORY_CACHE_TTLS = json.loads(os.getenv("HISTORY_CACHE_TTLS", "{}"))
+RESULT_CACHE_SIZE = int(os.getenv("RESULT_CACHE_SIZE", 4096))
+# extend cached histories with only the records after their last timestamp when a head advances
+HISTORY_TAIL_REFRESH = os.getenv("HISTORY_TAIL_REFRESH", "false").lower() == "true"
+# trailing records refetched to detect revisions of already cached history
+HISTORY_TAIL_OVERLAP = int(os.getenv("HISTORY_TAIL_OVERLAP", 7))
+# decimals the overlap is compared at, absorbing float noise between reads
+HISTORY_TAIL_DECIMALS = int(os.getenv("HISTORY_TAIL_DECIMALS", 6))
+# bearer token required by the cache purge route, which is disabled without one
+CACHE_PURGE_TOKEN = os.getenv("CACHE_PURGE_TOKEN", None)
+
+_DEFAULT_TTL = object()
+
+logger = logging.getLogger(__name__)
+
+
+class TTLCache:
+    ''' Thread safe in-memory cache with least recently used eviction once
+        the maximum size is reached and an optional time to live per entry.
+        Keeps hit, miss, expiration, and eviction counters
+    '''
+
+    def __init__(self, max_size, default_ttl=None):
+        ''' Parameters: max_size (int), maximum number of entries held
+                        default_ttl (float), seconds an entry stays valid when no
+                        ttl is given on insertion, or None to never expire
+        '''
+        self._max_size = max_size
+        self._default_ttl = default_ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.expirations = 0
+        self.evictions = 0
+
+    def get(self, key):
+        ''' Looks up an entry and marks it as most recently used
+
+            Parameters: key (hashable), cache key
+            Returns: bool, whether a live entry was found
+                     object, the cached value or None
+        '''
+        with self._lock:
+            entry = self._entries.get(key, None)
+            if entry is None:
+                self.misses += 1
+                return False, None
+            value, expires = entry
+            if expires is not None and expires <= time.monotonic():
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return False, None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return True, value
+
+    def set(self, key, value, ttl=_DEFAULT_TTL):
+        ''' Inserts an entry, evicting the least recently used entries if the
+            cache is full
+
+            Parameters: key (hashable), cache key
+                        value (object), value to cache
+                        ttl (float), seconds the entry stays valid, None to never
+                        expire, defaults to the cache's default ttl
+        '''
+        if ttl is _DEFAULT_TTL:
+            ttl = self._default_ttl
+        expires = None if ttl is None else time.monotonic() + ttl
+        with self._lock:
+            self._entries[key] = (value, expires)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def purge(self, predicate=None):
+        ''' Removes all entries whose key satisfies the predicate
+
+            Parameters: predicate (function), takes a key and returns whether to
+            remove it, or None to clear the cache
+            Returns: int, number of removed entries
+        '''
+        with self._lock:
+            if predicate is None:
+                removed = len(self._entries)
+                self._entries.clear()
+                return removed
+            keys = [key for key in self._entries if predicate(key)]
+            for key in keys:
+                del self._entries[key]
+            return len(keys)
+
+    def stats(self):
+        ''' Returns: dict, current size and counters of the cache '''
+        with self._lock:
+            return {
+                'size': len(self._entries),
+                'max_size': self._max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'expirations': self.expirations,
+                'evictions': self.evictions,
+            }
+
+
+HISTORY_CACHE = TTLCache(HISTORY_CACHE_SIZE, default_ttl=HISTORY_CACHE_TTL)
+# final /api payloads keyed on (dataset, head, canonical request), only for immutable requests
+RESULT_CACHE = TTLCache(RESULT_CACHE_SIZE, default_ttl=None)
+# (head, result) of the most recent history of each (wrapper key, dataset, args), the base of
+# tail refreshes, only kept with HISTORY_TAIL_REFRESH
+LATEST_HISTORIES = TTLCache(HISTORY_CACHE_SIZE, default_ttl=None)
+
+
+def dataset_ttl(dataset):
+    ''' Returns: float, seconds a non-versioned history of the dataset stays cached '''
+    return float(HISTORY_CACHE_TTLS.get(dataset, HISTORY_CACHE_TTL))
+
+
+def normalize_value(value):
+    ''' Maps equivalent wrapper argument values to the same hashable value so
+        that e.g. 'true' and True or 1.3750 and 1.375 share a cache entry
+    '''
+    if isinstance(value, bool) or value is None:
+        return value
+    if isinstance(value, (int, float)):
+        return round(float(value), 6)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, str):
+        lowered = value.strip().lower()
+        if lowered in ('true', 'false'):
+            return lowered == 'true'
+        return value.strip()
+    if isinstance(value, (list, tuple)):
+        return tuple(normalize_value(v) for v in value)
+    if isinstance(value, dict):
+        return normalize_args(value)
+    return repr(value)
+
+
+def normalize_args(args):
+    ''' Returns: tuple, sorted (name, normalized value) pairs of wrapper arguments '''
+    return tuple(sorted((name, normalize_value(value)) for name, value in args.items()))
+
+
+def copy_result(result):
+    ''' Copies the pandas container of a wrapper result so that callers
+        operating on the data can not alter the cached entry
+    '''
+    data = result.get('data', None)
+    if isinstance(data, (pd.Series, pd.DataFrame)):
+        return {**result, 'data': data.copy()}
+    return dict(result)
+
+
+def slice_result(result, window):
+    ''' Copies a wrapper result keeping only the data inside a time window
+
+        Parameters: result (dict), wrapper result
+                    window (tuple), (start, end) of the data to keep, either may be None
+        Returns: dict, copy of the result
+    '''
+    data = result.get('data', None)
+    if window == (None, None) or not isinstance(data, (pd.Series, pd.DataFrame)):
+        return copy_result(result)
+    index = data.index if isinstance(data.index, pd.DatetimeIndex) else pd.to_datetime(data.index)
+    if not index.is_monotonic_increasing:
+        order = index.argsort()
+        data, index = data.iloc[order], index[order]
+    return {**result, 'data': data.iloc[index.slice_indexer(window[0], window[1])].copy()}
+
+
+def overlap_checksum(series, decimals=HISTORY_TAIL_DECIMALS):
+    ''' Returns: str, digest of a float history's timestamps and rounded values '''
+    digest = hashlib.sha256()
+    digest.update(series.index.values.astype('datetime64[ns]').view(np.int64).tobytes())
+    values = np.round(series.to_numpy(dtype=np.float64), decimals) + 0.0
+    digest.update(values.tobytes())
+    return digest.hexdigest()
+
+
+def append_tail(data, tail, overlap):
+    ''' Extends a cached history with a newer read of its end
+
+        The tail must start at or before the last `overlap` records of the
+        cached history. Those records are compared by checksum with the same
+        records in the tail and only the records after the cached history's
+        last timestamp are appended. If they differ the cached history has been
+        revised, or the tail's source disagrees with it, and None is returned
+        so the caller reads the whole history again
+
+        Parameters: data (Pandas Series), cached float history
+                    tail (Pandas Series), float history from the start of the overlap
+                    overlap (int), number of trailing records compared
+        Returns: Pandas Series, the extended history or None
+    '''
+    if series_unit(data) != series_unit(tail) or data.dtype != np.float64 or tail.dtype != np.float64:
+        return None
+    last = data.index[-1]
+    cached_overlap = data.iloc[max(0, len(data) - overlap):]
+    fetched_overlap = tail.loc[cached_overlap.index[0]:last]
+    if overlap_checksum(cached_overlap) != overlap_checksum(fetched_overlap):
+        return None
+    appended = tail.iloc[tail.index.searchsorted(last, side='right'):]
+    return set_unit(pd.concat([data, appended]), series_unit(data))
+
+
+def refresh_tail(wrapper_key, base_key, head, args, tail_fetcher):
+    ''' Builds a wrapper result for a new head from the history cached for an
+        earlier head, fetching only its tail
+
+        Returns: dict, the refreshed wrapper result or None if it must be read in full
+    '''
+    found, latest = LATEST_HISTORIES.get(base_key)
+    if not found or latest[0] == head:
+        return None
+    previous = latest[1]
+    data = previous.get('data', None)
+    if not isinstance(data, pd.Series) or not isinstance(data.index, pd.DatetimeIndex) or data.empty:
+        return None
+    start = data.index[max(0, len(data) - HISTORY_TAIL_OVERLAP)]
+    try:
+        tail = tail_fetcher(args, start)['data']
+        data = append_tail(data, tail, HISTORY_TAIL_OVERLAP)
+    except Exception as e:
+        logger.warning('could not refresh the tail of %s: %s', wrapper_key, e)
+        TAIL_REFRESHES.inc(wrapper=wrapper_key, outcome='error')
+        return None
+    if data is None:
+        logger.info('cached %s history was revised, reading it in full', wrapper_key)
+        TAIL_REFRESHES.inc(wrapper=wrapper_key, outcome='revised')
+        return None
+    TAIL_REFRESHES.inc(wrapper=wrapper_key, outcome='appended')
+    return {**previous, 'data': data}
+
+
+def cached_history(wrapper_key, dataset=None, head_resolver=None, tail_fetcher=None):
+    ''' Decorator for history wrappers caching their results in HISTORY_CACHE
+
+        Entries are keyed on the wrapper key, the normalized wrapper arguments,
+        and the dataset head (when it can be resolved) so a republished dataset
+        never serves a stale history. Requests pinned with as_of are immutable
+        and never expire; all others expire after the dataset's ttl
+
+        Misses in memory fall through to HISTORY_DISK_CACHE, which is shared by
+        all worker processes and survives restarts
+
+        Callers may pass '_start' and '_end' in the args to receive only the
+        history inside that window. The full history is still what gets cached,
+        so contracts with different windows share entries, and a disk hit reads
+        the full history into HISTORY_CACHE so later windows are served from memory
+
+        With HISTORY_TAIL_REFRESH, a wrapper given a tail_fetcher builds the
+        history of a new head from the one cached for the previous head and only
+        the records published since, see append_tail
+
+        Parameters: wrapper_key (str), API endpoint key of the wrapper
+                    dataset (str), dataset the wrapper reads when not given in the args
+                    head_resolver (function), maps a dataset name to its current head
+                    tail_fetcher (function), takes the wrapper args and a start time
+                        and returns a wrapper result from that time on
+    '''
+    def decorator(func):
+        @wraps(func)
+        def wrapper(args):
+            args = dict(args)
+            window = (args.pop('_start', None), args.pop('_end', None))
+            dataset_name = args.get('dataset', dataset)
+            as_of = args.get('as_of', None)
+            head = None
+            if as_of is None and head_resolver is not None and dataset_name is not None:
+                head = head_resolver(dataset_name)
+            normalized = normalize_args(args)
+            key = (wrapper_key, dataset_name, head, normalized)
+            hit, result = HISTORY_CACHE.get(key)
+            if hit:
+                return slice_result(result, window)
+            ttl = None if as_of is not None else dataset_ttl(dataset_name)
+            if HISTORY_DISK_CACHE is not None:
+                hit, result = HISTORY_DISK_CACHE.get(key, version=head)
+            versioned = head is not None and as_of is None
+            if not hit and versioned and tail_fetcher is not None and HISTORY_TAIL_REFRESH:
+                result = refresh_tail(wrapper_key, (wrapper_key, dataset_name, normalized), head, args, tail_fetcher)
+                if result is not None:
+                    hit = True
+                    if HISTORY_DISK_CACHE is not None:
+                        HISTORY_DISK_CACHE.set(key, result, version=head, ttl=ttl, dataset=dataset_name)
+            if not hit:
+                result = func(args)
+                if HISTORY_DISK_CACHE is not None:
+                    HISTORY_DISK_CACHE.set(key, result, version=head, ttl=ttl, dataset=dataset_name)
+            HISTORY_CACHE.set(key, result, ttl=ttl)
+            if versioned and tail_fetcher is not None and HISTORY_TAIL_REFRESH:
+                LATEST_HISTORIES.set((wrapper_key, dataset_name, normalized), (head, result))
+            return slice_result(result, window)
+        return wrapper
+    return decorator
+
+
+def purge_head(dataset, head):
+    ''' Removes the cached histories and results read from a superseded head
+        of a dataset, which can no longer be looked up once the head moves
+
+        Parameters: dataset (str), name of the dataset
+                    head (str), the superseded head
+        Returns: dict, number of entries removed from each cache
+    '''
+    return {
+        'history_cache': HISTORY_CACHE.purge(lambda key: key[1] == dataset and key[2] == head),
+        'result_cache': RESULT_CACHE.purge(lambda key: key[0] == dataset and key[1] == head),
+    }
+
+
+def purge_dataset(dataset, disk=True):
+    ''' Removes every cached history and result of a dataset, e.g. after it
+        has been republished
+
+        Parameters: dataset (str), name of the dataset
+                    disk (bool), whether to also purge the disk cache shared by
+                    the workers
+        Returns: dict, number of entries removed from each cache
+    '''
+    removed = {
+        'history_cache': HISTORY_CACHE.purge(lambda key: key[1] == dataset),
+        'result_cache': RESULT_CACHE.purge(lambda key: key[0] == dataset),
+        'latest_histories': LATEST_HISTORIES.purge(lambda key: key[1] == dataset),
+    }
+    if disk and HISTORY_DISK_CACHE is not None:
+        removed['history_disk_cache'] = HISTORY_DISK_CACHE.purge(dataset)
+    return removed
+
+
+def purge_authorized(authorization):
+    ''' Returns: bool, whether an Authorization header carries CACHE_PURGE_TOKEN '''
+    if not CACHE_PURGE_TOKEN or not authorization:
+        return False
+    scheme, _, token = authorization.partition(' ')
+    return scheme.lower() == 'bearer' and hmac.compare_digest(token.strip().encode(), CACHE_PURGE_TOKEN.encode())
@@ -0,0 +1,67 @@
+import threading
+
+
+class _Call:
+    ''' An in-flight call that concurrent identical requests wait on '''
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    ''' Coalesces concurrent calls with the same key so that only the first
+        caller executes the call and every other caller waiting at the same time
+        receives its result (or its exception). Keeps counters of all calls and
+        of the calls that were coalesced into another
+    '''
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.calls = 0
+        self.coalesced = 0
+
+    def do(self, key, func):
+        ''' Executes func unless a call with the same key is already in flight,
+            in which case waits for that call instead
+
+            Parameters: key (hashable), identifies identical calls
+                        func (function), takes no arguments and performs the call
+            Returns: object, the result of the call
+                     bool, whether the result is shared with another caller
+        '''
+        with self._lock:
+            self.calls += 1
+            call = self._calls.get(key, None)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+            else:
+                self.coalesced += 1
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+        try:
+            call.result = func()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+        return call.result, False
+
+    def stats(self):
+        ''' Returns: dict, call counters and number of calls in flight '''
+        with self._lock:
+            return {
+                'calls': self.calls,
+                'coalesced': self.coalesced,
+                'in_flight': len(self._calls),
+            }
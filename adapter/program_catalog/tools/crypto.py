@@ -1,8 +1,13 @@
 import os
 import json
+import time
 import base64
 import hashlib
 import hmac
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 
 from coincurve import PrivateKey, PublicKey
 from coincurve.utils import get_valid_secret
@@ -10,13 +15,228 @@ from coincurve.utils import get_valid_secret
 from Crypto.Cipher import AES
 from Crypto.Util.Padding import pad, unpad
 
+from program_catalog.tools.metrics import timed
+
 ADAPTER_SECRETS = os.getenv("ADAPTER_SECRETS", None)
 NODE_PRIVATE_KEY = os.getenv("NODE_PRIVATE_KEY", None)
-if ADAPTER_SECRETS is not None:
-    NODE_PRIVATE_KEY = bytes.fromhex(json.loads(ADAPTER_SECRETS).get("NODE_PRIVATE_KEY", NODE_PRIVATE_KEY))
-else:
-    NODE_PRIVATE_KEY = bytes.fromhex(NODE_PRIVATE_KEY)
-print(f'NODE PRIVATE KEY (length): {len(NODE_PRIVATE_KEY)}', flush=True)
+# file holding the node private key as hex or as JSON like ADAPTER_SECRETS, reloaded when it changes
+NODE_KEY_FILE = os.getenv("NODE_KEY_FILE", None)
+NODE_KEY_RELOAD_INTERVAL = float(os.getenv("NODE_KEY_RELOAD_INTERVAL", 30))
+
+logger = logging.getLogger(__name__)
+
+# decrypted access keys and contract terms are only ever held in memory, set to false to never cache them
+CRYPTO_CACHE_ENABLED = os.getenv("CRYPTO_CACHE_ENABLED", "true").strip().lower() == "true"
+CRYPTO_CACHE_SIZE = int(os.getenv("CRYPTO_CACHE_SIZE", 256))
+CRYPTO_CACHE_TTL = float(os.getenv("CRYPTO_CACHE_TTL", 300))
+# threads encrypting batch re-encryptions, batches of at most REENCRYPTION_INLINE_SIZE keys run inline
+REENCRYPTION_MAX_WORKERS = int(os.getenv("REENCRYPTION_MAX_WORKERS", os.cpu_count() or 1))
+REENCRYPTION_INLINE_SIZE = int(os.getenv("REENCRYPTION_INLINE_SIZE", 4))
+
+
+class SecretCache:
+    ''' Bounded in-memory LRU cache of secrets keyed on digests of the
+        ciphertexts they were decrypted from. Entries expire after a TTL. Every
+        get and set sweeps out all expired entries, and an entry's bytes are
+        overwritten with zeros when it is swept, evicted or cleared, so an
+        expired secret stays in memory until the cache is next used
+    '''
+
+    def __init__(self, max_size, ttl):
+        ''' Parameters: max_size (int), maximum number of entries
+                        ttl (float), seconds an entry stays valid
+        '''
+        self._max_size = max_size
+        self._ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        ''' Returns: bytes, copy of the cached secret or None if absent or expired '''
+        with self._lock:
+            self._sweep()
+            entry = self._entries.get(key, None)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return bytes(entry[0])
+
+    def set(self, key, secret):
+        ''' Caches a copy of the secret, evicting the least recently used entries
+            beyond the maximum size
+
+            Parameters: key (bytes), digest identifying the secret
+                        secret (bytes), secret to cache
+        '''
+        if self._max_size <= 0:
+            return
+        with self._lock:
+            self._sweep()
+            if key in self._entries:
+                self._discard(key)
+            self._entries[key] = (bytearray(secret), time.monotonic() + self._ttl)
+            while len(self._entries) > self._max_size:
+                self._discard(next(iter(self._entries)))
+                self.evictions += 1
+
+    def clear(self):
+        ''' Zeroizes and removes every entry '''
+        with self._lock:
+            for key in list(self._entries):
+                self._discard(key)
+
+    def stats(self):
+        ''' Returns: dict, current size and counters of the cache '''
+        with self._lock:
+            return {
+                'size': len(self._entries),
+                'max_size': self._max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
+
+    def _sweep(self):
+        ''' Zeroizes and removes every expired entry '''
+        now = time.monotonic()
+        for key in [key for key, (_, expires) in self._entries.items() if expires <= now]:
+            self._discard(key)
+
+    def _discard(self, key):
+        secret, _ = self._entries.pop(key)
+        secret[:] = bytes(len(secret))
+
+
+# node key ciphertext digest: access key
+ACCESS_KEY_CACHE = SecretCache(CRYPTO_CACHE_SIZE, CRYPTO_CACHE_TTL)
+# (uri digest, node key digest): decrypted contract terms
+URI_CACHE = SecretCache(CRYPTO_CACHE_SIZE, CRYPTO_CACHE_TTL)
+
+
+def secret_digest(*parts):
+    ''' Returns: bytes, sha256 digest identifying the given ciphertexts '''
+    m = hashlib.sha256()
+    for part in parts:
+        m.update(hashlib.sha256(part).digest())
+    return m.digest()
+
+
+def clear_secret_caches():
+    ''' Zeroizes every cached access key and contract, e.g. after a key rotation '''
+    ACCESS_KEY_CACHE.clear()
+    URI_CACHE.clear()
+
+
+def read_node_private_key(path=None):
+    ''' Reads the node private key from the key file if one is given, otherwise
+        from ADAPTER_SECRETS or NODE_PRIVATE_KEY
+
+        Parameters: path (str), key file holding the key as hex or as JSON with
+                    a NODE_PRIVATE_KEY entry
+        Returns: bytes, the node private key
+    '''
+    if path is not None:
+        with open(path, 'r') as key_file:
+            key = key_file.read().strip()
+        if key.startswith('{'):
+            key = json.loads(key)['NODE_PRIVATE_KEY']
+    elif ADAPTER_SECRETS is not None:
+        key = json.loads(ADAPTER_SECRETS).get("NODE_PRIVATE_KEY", NODE_PRIVATE_KEY)
+    else:
+        key = NODE_PRIVATE_KEY
+    if key is None:
+        raise ValueError('node private key is not configured')
+    return bytes.fromhex(key)
+
+
+class NodeKeyManager:
+    ''' Holds the node's private key as a validated coincurve PrivateKey, built
+        once per process instead of on every decryption. The secp256k1 context
+        tables are warmed when a key is loaded so the first request does not pay
+        for them
+
+        When the key is read from a key file, the file is checked at most every
+        reload interval and a rotated key is swapped in without restarting the
+        worker, calling on_rotate so that secrets derived from the old key can
+        be discarded
+    '''
+
+    def __init__(self, path=NODE_KEY_FILE, reload_interval=NODE_KEY_RELOAD_INTERVAL, on_rotate=None):
+        ''' Parameters: path (str), key file to load and watch or None to read the environment
+                        reload_interval (float), seconds between checks of the key file
+                        on_rotate (function), called without arguments after the key changes
+        '''
+        self._path = path
+        self._reload_interval = reload_interval
+        self._on_rotate = on_rotate
+        self._lock = threading.Lock()
+        self._mtime = None
+        self._next_check = 0
+        self._private_key, self._fingerprint = self._load()
+        logger.info('node private key loaded (length %d)', len(self._private_key.secret))
+
+    def current(self):
+        ''' Returns: PrivateKey, the node private key
+                     bytes, sha256 fingerprint of the key
+        '''
+        self._check_rotation()
+        with self._lock:
+            return self._private_key, self._fingerprint
+
+    @property
+    def private_key(self):
+        return self.current()[0]
+
+    def reload(self):
+        ''' Loads the key again, keeping the current key if the new one is invalid
+
+            Returns: bool, whether the key changed
+        '''
+        try:
+            private_key, fingerprint = self._load()
+        except Exception as e:
+            logger.error('could not reload node private key, keeping current key: %s', e)
+            return False
+        with self._lock:
+            rotated = fingerprint != self._fingerprint
+            self._private_key, self._fingerprint = private_key, fingerprint
+        if rotated:
+            logger.info('node private key rotated')
+            if self._on_rotate is not None:
+                self._on_rotate()
+        return rotated
+
+    def _check_rotation(self):
+        if self._path is None or time.monotonic() < self._next_check:
+            return
+        self._next_check = time.monotonic() + self._reload_interval
+        try:
+            mtime = os.stat(self._path).st_mtime_ns
+        except OSError as e:
+            logger.warning('could not check node key file: %s', e)
+            return
+        if mtime != self._mtime:
+            self.reload()
+
+    def _load(self):
+        if self._path is not None:
+            self._mtime = os.stat(self._path).st_mtime_ns
+        secret = read_node_private_key(self._path)
+        if len(secret) != 32:
+            raise ValueError(f'node private key must be 32 bytes, got {len(secret)}')
+        private_key = PrivateKey(secret)
+        # warm the context with the operations used on the request path
+        private_key.public_key.multiply(private_key.secret)
+        PublicKey(private_key.public_key.format(compressed=False)).format(compressed=True)
+        return private_key, hashlib.sha256(secret).digest()
+
+
+NODE_KEY_MANAGER = NodeKeyManager(on_rotate=clear_secret_caches)
 
 
 def get_shared_key(public_key, private_key):
@@ -31,7 +251,7 @@ def get_shared_key(public_key, private_key):
         Returns: bytes, the derived shared key
                  bytes, the derived MAC key
     '''
-    print('get_shared_key', flush=True)
+    logger.debug('get_shared_key')
     shared_point = public_key.multiply(private_key.secret)
     x = shared_point.format(compressed=True)[1:]
     m = hashlib.sha512()
@@ -53,7 +273,7 @@ def verify_mac(tag, key, mac_data):
                     ciphertext: remaining bytes
         Returns: bool, the result of the comparison
     '''
-    print('verify_mac', flush=True)
+    logger.debug('verify_mac')
     mac = hmac.new(key, msg=mac_data, digestmod=hashlib.sha256).hexdigest()
     return mac == tag.hex()
 
@@ -74,7 +294,7 @@ def compress_public_key(public_key: bytes):
         Parameters: public_key (bytes), bytestring of public key
         Returns: bytes, the compressed public key
     '''
-    print('compress_public_key', flush=True)
+    logger.debug('compress_public_key')
     if (public_key[0] == 2 or public_key[0] == 3) and len(public_key) >= 33:
         return public_key[:33]
     elif public_key[0] == 4 and len(public_key) == 65:
@@ -103,19 +323,15 @@ def decompress_public_key(public_key: bytes):
         Returns: int, the length of the initially supplied public key after its compression
         state has been determined
     '''
-    print('decompress_public_key', flush=True)
-    print(f'public_key {public_key}', flush=True)
+    logger.debug('decompress_public_key %s', public_key)
     if (public_key[0] == 2 or public_key[0] == 3) and len(public_key) >= 33:
-        print(f'public_key {public_key[:33]}', flush=True)
         return PublicKey(public_key[:33]).format(compressed=False), 33
     elif public_key[0] == 4 and len(public_key) == 65:
-        print(f'public_key {public_key}', flush=True)
         return public_key, 65
     elif len(public_key) == 64:
-        print(f'public_key {bytes.fromhex("04") + public_key}', flush=True)
         return bytes.fromhex('04') + public_key, 64
     else:
-        print('failed', flush=True)
+        logger.debug('could not decompress public key of length %d', len(public_key))
         return f'cannot decompress invalid public key', 0
 
 
@@ -133,10 +349,9 @@ def parse_key_cipher(cipher_bytes: bytes):
                         ciphertext: remaining bytes
         Returns: dict, mapping of encryption components to their bytes representations
     '''
-    print('parse_key_cipher', flush=True)
+    logger.debug('parse_key_cipher')
     public_key, initial_length = decompress_public_key(cipher_bytes[16:81])
-    print(f'public_key {public_key}', flush=True)
-    print(f'initial_length {initial_length}', flush=True)
+    logger.debug('parsed ephemeral public key of initial length %d', initial_length)
     if type(public_key) is not bytes:
         return {'error': public_key}
     else:
@@ -169,14 +384,13 @@ def encrypt_access_key(access_key: bytes, public_key: bytes):
         Parameters: public_key (bytes), bytestring of public key to use in encryption
         Returns: bytes, combined bytestring of iv + ephemeral_public_key (compressed) + mac + ciphertext
     '''
-    print('encrypt_access_key', flush=True)
+    logger.debug('encrypt_access_key')
     iv = os.urandom(16)
 
     ephemeral_private_key = PrivateKey(get_valid_secret())
     ephemeral_public_key = ephemeral_private_key.public_key.format(compressed=False)
 
     decompressed, _ = decompress_public_key(public_key)
-    print(f'decompressed {decompressed}', flush=True)
     if type(decompressed) is not bytes:
         return {'error': decompressed}
     public_key = PublicKey(decompressed)
@@ -191,7 +405,7 @@ def encrypt_access_key(access_key: bytes, public_key: bytes):
     return iv + compress_public_key(ephemeral_public_key) + bytes.fromhex(mac.hexdigest()) + ciphertext
 
 
-def decrypt_access_key(node_key: bytes, private_key: bytes=NODE_PRIVATE_KEY):
+def decrypt_access_key(node_key: bytes, private_key=None):
     ''' Retrieves the contract access key from the node key cipher
 
         The node key is an encrypted payload containing the contract
@@ -214,20 +428,22 @@ def decrypt_access_key(node_key: bytes, private_key: bytes=NODE_PRIVATE_KEY):
 
         Parameters: node_key (bytes), bytestring of contract access key encrypted
         for the Chainlink node
-        Parameters: private_key (bytes), bytestring of private key for decryption of node_key
+        Parameters: private_key (PrivateKey or bytes), private key for decryption of node_key,
+                    defaults to the node private key held by NODE_KEY_MANAGER
         Returns: bytes, bytestring of access key for decrypting contract URI
     '''
-    print('decrypt_access_key', flush=True)
+    logger.debug('decrypt_access_key')
     cipher_args = parse_key_cipher(node_key)
     if 'error' in cipher_args:
         return cipher_args['error']
 
-    print(f'cipher_args {cipher_args}', flush=True)
-    print(f'ephemPublicKey type {type(cipher_args["ephemPublicKey"])}', flush=True)
-    print(f'private_key type {type(private_key)}', flush=True)
+    logger.debug('parsed node key cipher with %d byte ciphertext', len(cipher_args['ciphertext']))
 
     ephemeral_public_key = PublicKey(cipher_args['ephemPublicKey'])
-    private_key = PrivateKey(private_key)
+    if private_key is None:
+        private_key = NODE_KEY_MANAGER.private_key
+    elif not isinstance(private_key, PrivateKey):
+        private_key = PrivateKey(private_key)
 
     shared_key, mac_key = get_shared_key(ephemeral_public_key, private_key)
 
@@ -240,6 +456,35 @@ def decrypt_access_key(node_key: bytes, private_key: bytes=NODE_PRIVATE_KEY):
     return bytes.fromhex(access_key.decode('utf-8'))
 
 
+def get_access_key(node_key: bytes, private_key=None):
+    ''' Decrypts the node key like decrypt_access_key, reusing the access key
+        decrypted from the same node key within CRYPTO_CACHE_TTL seconds unless
+        CRYPTO_CACHE_ENABLED is false. Failed decryptions are never cached
+
+        Parameters: node_key (bytes), bytestring of contract access key encrypted
+        for the Chainlink node
+        Parameters: private_key (PrivateKey or bytes), private key for decryption of node_key,
+                    defaults to the node private key held by NODE_KEY_MANAGER
+        Returns: bytes, bytestring of access key for decrypting contract URI
+    '''
+    if private_key is None:
+        private_key, fingerprint = NODE_KEY_MANAGER.current()
+    else:
+        if not isinstance(private_key, PrivateKey):
+            private_key = PrivateKey(private_key)
+        fingerprint = hashlib.sha256(private_key.secret).digest()
+    if not CRYPTO_CACHE_ENABLED:
+        return decrypt_access_key(node_key, private_key)
+    key = secret_digest(node_key, fingerprint)
+    access_key = ACCESS_KEY_CACHE.get(key)
+    if access_key is None:
+        access_key = decrypt_access_key(node_key, private_key)
+        if type(access_key) is bytes:
+            ACCESS_KEY_CACHE.set(key, access_key)
+    return access_key
+
+
+@timed('reencrypt')
 def reencrypt(node_key: bytes, public_key: bytes):
     ''' Decrypts the encrypted node key and re-encrypts it 
         with the given public key and returns the encrypted string. 
@@ -248,9 +493,9 @@ def reencrypt(node_key: bytes, public_key: bytes):
         Parameters: public_key (str), base 64 encoded string of public key to be used for encryption
         Returns: bytes, bytestring of re-encrypted contract access key
     '''
-    print('reencrypt', flush=True)
+    logger.debug('reencrypt')
     node_key_bytes = base64.b64decode(node_key)
-    access_key = decrypt_access_key(node_key_bytes)
+    access_key = get_access_key(node_key_bytes)
     if type(access_key) is not bytes:
         return {'error': access_key}
     public_key_bytes = base64.b64decode(public_key)
@@ -258,6 +503,56 @@ def reencrypt(node_key: bytes, public_key: bytes):
     return encryption
 
 
+_REENCRYPTION_POOL = None
+_REENCRYPTION_POOL_LOCK = threading.Lock()
+
+
+def get_reencryption_pool():
+    ''' Returns: ThreadPoolExecutor, the thread pool shared by batch re-encryptions,
+        started on first use. The access key never leaves the process. Under
+        gevent's monkey patching the pool's threads are greenlets, so a batch is
+        encrypted cooperatively rather than in parallel
+    '''
+    global _REENCRYPTION_POOL
+    with _REENCRYPTION_POOL_LOCK:
+        if _REENCRYPTION_POOL is None:
+            _REENCRYPTION_POOL = ThreadPoolExecutor(max_workers=max(1, REENCRYPTION_MAX_WORKERS),
+                                                    thread_name_prefix='reencryption')
+        return _REENCRYPTION_POOL
+
+
+def encrypt_access_key_b64(access_key: bytes, public_key: bytes):
+    ''' Encrypts the access key for the public key and returns the base 64
+        encoded encryption, the format returned by Reencryption
+    '''
+    return base64.b64encode(encrypt_access_key(access_key, public_key)).decode()
+
+
+@timed('batch_reencrypt')
+def batch_reencrypt(node_key: str, public_keys: list):
+    ''' Decrypts the encrypted node key once and re-encrypts it with each of the
+        given public keys. Batches larger than REENCRYPTION_INLINE_SIZE are
+        encrypted on the re-encryption thread pool
+
+        Parameters: node_key (str), base 64 encoded string of access key encrypted for the Chainlink node
+        Parameters: public_keys (list), base 64 encoded strings of public keys to be used for encryption
+        Returns: list, base 64 encoded re-encrypted access keys in the order of the public keys
+    '''
+    logger.debug('batch_reencrypt')
+    public_key_bytes = [base64.b64decode(public_key) for public_key in public_keys]
+    invalid = [str(i) for i, public_key in enumerate(public_key_bytes) if type(decompress_public_key(public_key)[0]) is not bytes]
+    if invalid:
+        raise ValueError(f'invalid public keys at positions {", ".join(invalid)}')
+    access_key = get_access_key(base64.b64decode(node_key))
+    if type(access_key) is not bytes:
+        raise ValueError(access_key)
+    if len(public_key_bytes) <= REENCRYPTION_INLINE_SIZE or REENCRYPTION_MAX_WORKERS <= 1:
+        return [encrypt_access_key_b64(access_key, public_key) for public_key in public_key_bytes]
+    pool = get_reencryption_pool()
+    return list(pool.map(encrypt_access_key_b64, [access_key] * len(public_key_bytes), public_key_bytes))
+
+
+@timed('decrypt')
 def decrypt(node_key: str, uri: str):
     ''' Accepts 2 encrypted objects, the first of which should be an AES-GCM 
         encryption key encrypted with ECIES (using AES-CBC) with the public key of the 
@@ -274,20 +569,29 @@ def decrypt(node_key: str, uri: str):
         payload containing contract terms
         Returns: dict, the unencrypted contents of the NFT URI
     '''
-    print('decrypt', flush=True)
+    logger.debug('decrypt')
     node_key_bytes = base64.b64decode(node_key)
-    access_key = decrypt_access_key(node_key_bytes)
+    uri_bytes = base64.b64decode(uri)
+    private_key, fingerprint = NODE_KEY_MANAGER.current()
+    if CRYPTO_CACHE_ENABLED:
+        uri_key = secret_digest(uri_bytes, node_key_bytes, fingerprint)
+        plaintext = URI_CACHE.get(uri_key)
+        if plaintext is not None:
+            return json.loads(plaintext.decode('utf-8'))
+
+    access_key = get_access_key(node_key_bytes, private_key)
     if type(access_key) is not bytes:
         return {'error': access_key}
 
-    uri_bytes = base64.b64decode(uri)
     iv = uri_bytes[:32]
     ciphertext = uri_bytes[32:-16]
     mac = uri_bytes[-16:]
 
     aes_cipher = AES.new(access_key, AES.MODE_GCM, nonce=iv)
-    uri = aes_cipher.decrypt_and_verify(ciphertext, mac).decode('utf-8')
-    return json.loads(uri)
+    plaintext = aes_cipher.decrypt_and_verify(ciphertext, mac)
+    if CRYPTO_CACHE_ENABLED:
+        URI_CACHE.set(uri_key, plaintext)
+    return json.loads(plaintext.decode('utf-8'))
 
 
 class Reencryption:
@@ -324,4 +628,44 @@ class Reencryption:
         '''
         reencrypted_bytes = reencrypt(params["node_key"], params["public_key"])
         reencrypted_string = base64.b64encode(reencrypted_bytes)
-        return reencrypted_string.decode()
\ No newline at end of file
+        return reencrypted_string.decode()
+
+
+class BatchReencryption:
+    ''' Program class for re-encrypting the access key of an Arbol NFT contract
+        for many viewers in one request. Decrypts (encrypted) node key once with
+        the private key and then re-encrypts it with each supplied public key
+    '''
+    _PROGRAM_PARAMETERS = ['node_key', 'public_keys']
+
+
+    @classmethod
+    def validate_request(cls, params):
+        ''' Asserts that the Chainlink request includes the necessary parameters to
+            execute a batch contract re-encryption
+
+            Parameters: params (dict), parameters to be checked against the
+            requirements
+            Returns: bool, whether the request format is valid
+                     str, error message in the event that the request is not valid
+        '''
+        result = True
+        result_msg = ""
+        for param in cls._PROGRAM_PARAMETERS:
+            if params.get(param, None) is None:
+                result_msg += f'missing {param} parameter\n'
+                result = False
+        public_keys = params.get('public_keys', None)
+        if public_keys is not None and (not isinstance(public_keys, list) or len(public_keys) == 0):
+            result_msg += 'public_keys must be a non-empty list\n'
+            result = False
+        return result, result_msg
+
+    @classmethod
+    def serve_request(cls, params):
+        ''' Encrypts the access key with each of the given public keys
+
+            Parameters: params (dict), dictionary of required parameters
+            Returns: list, the re-encrypted access keys in the order of the public keys
+        '''
+        return batch_reencrypt(params["node_key"], params["public_keys"])
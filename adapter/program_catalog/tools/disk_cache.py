@@ -0,0 +1,255 @@
+import os
+import json
+import time
+import shutil
+import hashlib
+import logging
+import tempfile
+import threading
+
+import numpy as np
+import pandas as pd
+import astropy.units as u
+
+from program_catalog.tools.units import series_unit, set_unit
+
+HISTORY_DISK_CACHE_DIR = os.getenv("HISTORY_DISK_CACHE_DIR", os.path.join(tempfile.gettempdir(), "adapter-history-cache"))
+HISTORY_DISK_CACHE_BYTES = int(os.getenv("HISTORY_DISK_CACHE_BYTES", 2 * 1024**3))
+# writes between scans of the whole cache, which also count other workers' entries
+HISTORY_DISK_CACHE_SCAN_WRITES = int(os.getenv("HISTORY_DISK_CACHE_SCAN_WRITES", 64))
+
+_INDEX_FILE = 'index.npy'
+_VALUES_FILE = 'values.npy'
+_META_FILE = 'meta.json'
+
+logger = logging.getLogger(__name__)
+
+
+def encode_series(series):
+    ''' Splits a history into int64 nanosecond timestamps, float64 values and
+        the metadata needed to rebuild it, including the unit of float histories.
+        Histories of Quantities are stored as their values when every element
+        shares one unit
+
+        Parameters: series (Pandas Series), history with a DatetimeIndex
+        Returns: tuple, (index array, values array, metadata dict) or None if
+                 the series can not be stored in columnar form
+    '''
+    if not isinstance(series, pd.Series) or not isinstance(series.index, pd.DatetimeIndex):
+        return None
+    quantity_unit = None
+    if series.dtype == np.float64:
+        values = series.to_numpy()
+        unit = series_unit(series)
+    elif series.dtype == object and len(series) > 0:
+        first = series.iloc[0]
+        if not isinstance(first, u.Quantity):
+            return None
+        quantity_unit = first.unit
+        if not all(isinstance(v, u.Quantity) and v.unit == quantity_unit for v in series):
+            return None
+        values = np.fromiter((v.value for v in series), dtype=np.float64, count=len(series))
+        unit = quantity_unit.to_string()
+    else:
+        return None
+    index = series.index.values.astype('datetime64[ns]').view(np.int64)
+    meta = {
+        'name': series.name,
+        'tz': None if series.index.tz is None else str(series.index.tz),
+        'unit': unit,
+    }
+    return index, values, meta
+
+
+def decode_series(index, values, meta, window=None):
+    ''' Rebuilds a history from the arrays and metadata produced by encode_series
+
+        Histories are rebuilt as float64 with meta['unit'] in attrs['unit'] and
+        keep the (memory mapped) values array without copying.
+        If a window is given only the values inside it are read, with the same
+        (partial date string) semantics as Series.loc[start:end]
+
+        Parameters: index (numpy array), int64 nanosecond timestamps
+                    values (numpy array), float64 values
+                    meta (dict), metadata from encode_series
+                    window (tuple), (start, end) of the values to read, either may be None
+        Returns: Pandas Series, float64 history with its unit in attrs['unit']
+    '''
+    datetimes = pd.DatetimeIndex(index.view('datetime64[ns]'))
+    if meta['tz'] is not None:
+        datetimes = datetimes.tz_localize('UTC').tz_convert(meta['tz'])
+    if window is not None:
+        selection = datetimes.slice_indexer(window[0], window[1])
+        datetimes = datetimes[selection]
+        values = values[selection]
+    # entries written before histories were float64 kept their unit as quantity_unit
+    unit = meta.get('unit', meta.get('quantity_unit', None))
+    return set_unit(pd.Series(values, index=datetimes, name=meta['name'], copy=False), unit)
+
+
+def _entry_size(path):
+    ''' Returns: int, total bytes of the files of a cache entry '''
+    return sum(os.path.getsize(os.path.join(path, f)) for f in os.listdir(path))
+
+
+class DiskHistoryCache:
+    ''' On-disk cache of wrapper histories shared by every worker process on
+        the host. Each entry is a directory holding an int64 timestamp array and
+        a float64 values array as .npy files, memory mapped on read, and a json
+        file with the rest of the wrapper result. Entries are written to a temporary
+        directory and renamed into place so readers never see partial entries
+
+        The total size is capped by evicting the least recently read entries.
+        Each worker keeps a running total of the cache's size from its own
+        writes and only scans the directory when that total passes the cap or
+        every scan_writes writes, which also counts the other workers' entries
+    '''
+
+    def __init__(self, directory, max_bytes, scan_writes=HISTORY_DISK_CACHE_SCAN_WRITES):
+        ''' Parameters: directory (str), root directory of the cache
+                        max_bytes (int), maximum total size of cached arrays
+                        scan_writes (int), writes between scans of the whole cache
+        '''
+        self._directory = directory
+        self._max_bytes = max_bytes
+        self._scan_writes = max(1, scan_writes)
+        self._lock = threading.Lock()
+        self._size = None
+        self._writes = 0
+        self.scans = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def _entry_path(self, key):
+        digest = hashlib.sha256(repr(key).encode('utf-8')).hexdigest()
+        return os.path.join(self._directory, digest)
+
+    def get(self, key, version=None, window=None):
+        ''' Looks up a cached wrapper result
+
+            Parameters: key (tuple), normalized cache key
+                        version (str), dataset head the entry must have been written for
+                        window (tuple), (start, end) to read only part of the history
+            Returns: bool, whether a valid entry was found
+                     dict, the wrapper result or None
+        '''
+        path = self._entry_path(key)
+        try:
+            with open(os.path.join(path, _META_FILE), 'r') as f:
+                meta = json.load(f)
+            if meta['version'] != version:
+                return False, None
+            if meta['expires'] is not None and meta['expires'] <= time.time():
+                shutil.rmtree(path, ignore_errors=True)
+                return False, None
+            index = np.load(os.path.join(path, _INDEX_FILE), mmap_mode='r')
+            values = np.load(os.path.join(path, _VALUES_FILE), mmap_mode='r')
+            data = decode_series(index, values, meta, window)
+            os.utime(os.path.join(path, _META_FILE))
+        except (OSError, ValueError, KeyError):
+            return False, None
+        return True, {**meta['result'], 'data': data}
+
+    def set(self, key, result, version=None, ttl=None, dataset=None):
+        ''' Writes a wrapper result to the cache if its data is a float or
+            single-unit Quantity history, then enforces the size cap
+
+            Parameters: key (tuple), normalized cache key
+                        result (dict), wrapper result with a Pandas Series "data"
+                        version (str), dataset head the result was read from
+                        ttl (float), seconds the entry stays valid or None to never expire
+                        dataset (str), dataset name recorded for purging
+        '''
+        encoded = encode_series(result.get('data', None))
+        if encoded is None:
+            return
+        index, values, meta = encoded
+        meta.update({
+            'version': version,
+            'dataset': dataset,
+            'expires': None if ttl is None else time.time() + ttl,
+            'result': {k: v for k, v in result.items() if k != 'data'},
+        })
+        path = self._entry_path(key)
+        staging = None
+        try:
+            staging = tempfile.mkdtemp(dir=self._directory, prefix='.staging-')
+            np.save(os.path.join(staging, _INDEX_FILE), index)
+            np.save(os.path.join(staging, _VALUES_FILE), values)
+            with open(os.path.join(staging, _META_FILE), 'w') as f:
+                json.dump(meta, f, default=str)
+            written = _entry_size(staging)
+            replaced = 0
+            if os.path.exists(path):
+                replaced = _entry_size(path)
+                shutil.rmtree(path, ignore_errors=True)
+            os.rename(staging, path)
+        except OSError as e:
+            logger.warning('could not write history cache entry: %s', e)
+            if staging is not None:
+                shutil.rmtree(staging, ignore_errors=True)
+            return
+        self._account(written - replaced)
+
+    def purge(self, dataset=None):
+        ''' Removes all entries of a dataset, or every entry if no dataset is given
+
+            Returns: int, number of removed entries
+        '''
+        removed = 0
+        for name in os.listdir(self._directory):
+            path = os.path.join(self._directory, name)
+            if dataset is not None:
+                try:
+                    with open(os.path.join(path, _META_FILE), 'r') as f:
+                        if json.load(f).get('dataset', None) != dataset:
+                            continue
+                except (OSError, ValueError):
+                    continue
+            shutil.rmtree(path, ignore_errors=True)
+            removed += 1
+        with self._lock:
+            self._size = None
+        return removed
+
+    def _account(self, change):
+        ''' Adds the bytes a write changed to the running total and scans the
+            cache if the total passed the cap, is unknown or is due for a scan
+        '''
+        with self._lock:
+            self._writes += 1
+            if self._size is not None:
+                self._size += change
+            scan = self._size is None or self._size > self._max_bytes or self._writes >= self._scan_writes
+            if scan:
+                self._writes = 0
+        if scan:
+            self._enforce_size()
+
+    def _enforce_size(self):
+        ''' Evicts least recently read entries until the cache fits in max_bytes
+            and resets the running total to what is left
+        '''
+        self.scans += 1
+        entries = []
+        total = 0
+        for name in os.listdir(self._directory):
+            if name.startswith('.staging-'):
+                continue
+            path = os.path.join(self._directory, name)
+            try:
+                size = _entry_size(path)
+                last_read = os.path.getmtime(os.path.join(path, _META_FILE))
+            except OSError:
+                continue
+            entries.append((last_read, size, path))
+            total += size
+        for _, size, path in sorted(entries):
+            if total <= self._max_bytes:
+                break
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+        with self._lock:
+            self._size = total
+
+
+HISTORY_DISK_CACHE = DiskHistoryCache(HISTORY_DISK_CACHE_DIR, HISTORY_DISK_CACHE_BYTES) if HISTORY_DISK_CACHE_DIR else None
@@ -0,0 +1,461 @@
+import os
+import json
+import time
+import fcntl
+import hashlib
+import logging
+import tempfile
+import threading
+from datetime import datetime
+
+import pandas as pd
+from dweather_client import client as v3_client
+from dclimate_zarr_client import client as v4_client
+
+try:
+    from dclimate_zarr_client.ipfs_retrieval import get_ipns_name_hash
+except ImportError:
+    get_ipns_name_hash = None
+
+HEADS_REFRESH_INTERVAL = float(os.getenv("HEADS_REFRESH_INTERVAL", os.getenv("HEADS_TTL", 60)))
+# file the refreshing worker publishes heads and metadata to, empty to keep them per process
+HEADS_FILE = os.getenv("HEADS_FILE", os.path.join(tempfile.gettempdir(), "adapter-dataset-heads.json"))
+# datasets whose metadata is always kept current, others are added when first requested
+HEADS_METADATA_DATASETS = json.loads(os.getenv("HEADS_METADATA_DATASETS", '["cme_futures-daily"]'))
+# most datasets whose metadata, and most v4 datasets whose version, is kept current
+HEADS_MAX_WATCHED = int(os.getenv("HEADS_MAX_WATCHED", 64))
+
+logger = logging.getLogger(__name__)
+
+
+def valid_dataset_name(dataset):
+    ''' Returns: bool, whether a dataset name can be used as a marker file name '''
+    return (isinstance(dataset, str) and dataset != '' and not dataset.startswith('.')
+            and os.sep not in dataset and '/' not in dataset and '\0' not in dataset)
+
+
+def read_v4_version(dataset, previous=None):
+    ''' Reads the latest publication of a v4 dataset. Its version is the CID
+        the dataset's IPNS name resolves to, which changes whenever the dataset
+        is republished, so an unchanged dataset costs one name resolution and is
+        never opened. Clients that cannot resolve names fall back to a digest of
+        the zarr attributes and time coordinate, read by opening the dataset
+
+        Parameters: dataset (str), name of the v4 dataset
+                    previous (dict), the version last read or None
+        Returns: dict, "head" version and ISO formatted "end" of the time coordinate
+    '''
+    head = get_ipns_name_hash(dataset) if get_ipns_name_hash is not None else None
+    if head is not None and previous is not None and previous['head'] == head:
+        return previous
+    ds = v4_client.load_ipfs(dataset)
+    times = ds['time'].values
+    end = pd.Timestamp(times.max()).isoformat()
+    if head is None:
+        digest = json.dumps({'attrs': ds.attrs, 'times': len(times), 'end': end}, sort_keys=True, default=str)
+        head = hashlib.sha256(digest.encode('utf-8')).hexdigest()
+    return {'head': head, 'end': end}
+
+
+class DatasetHeads:
+    ''' Registry of the current IPFS head of every v3 dataset, the metadata
+        of the datasets whose metadata is used and the version of the v4
+        datasets whose version is used, kept current by a background refresher
+        so requests only ever read from memory
+
+        With a heads file, one worker per host holds a lock on it and polls the
+        client every refresh interval, writing what it reads to the file; every
+        other worker reloads the file when it changes and takes over polling if
+        the refreshing worker goes away. Metadata is only fetched again when a
+        dataset's head changes. Subscribers are called with (dataset, old head,
+        new head) in every worker whenever a head or v4 version changes
+
+        The heads file also carries cache purges to every worker on the host,
+        see broadcast_purge
+    '''
+
+    def __init__(self, path=HEADS_FILE, interval=HEADS_REFRESH_INTERVAL, metadata_datasets=HEADS_METADATA_DATASETS):
+        ''' Parameters: path (str), shared heads file or None to poll in every process
+                        interval (float), seconds between polls of the client
+                        metadata_datasets (list), datasets whose metadata is kept from the start
+        '''
+        self._path = path or None
+        self._interval = interval
+        self._lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._heads = {}
+        self._metadata = {}
+        self._watched = set(metadata_datasets)
+        self._v4 = {}
+        self._v4_watched = set()
+        self._subscribers = []
+        self._purge_subscribers = []
+        self._purged = {}
+        self._thread = None
+        self._lock_file = None
+        self._mtime = None
+        self._updated = None
+        self._polled = 0
+        self.refreshes = 0
+        self.refresh_errors = 0
+        self.notifications = 0
+        self.purges = 0
+
+    def subscribe(self, callback):
+        ''' Registers a function called with (dataset, old head, new head)
+            after a dataset's head changes
+        '''
+        self._subscribers.append(callback)
+
+    def subscribe_purge(self, callback):
+        ''' Registers a function called with a dataset's name when another
+            worker broadcasts a purge of the dataset
+        '''
+        self._purge_subscribers.append(callback)
+
+    def head(self, dataset):
+        ''' Returns: str, the current head of a dataset or None if unknown '''
+        self.start()
+        with self._lock:
+            return self._heads.get(dataset, None)
+
+    def metadata(self, dataset):
+        ''' Returns the metadata of a dataset's current head. Datasets in the
+            heads listing whose metadata has not been requested before are
+            watched from now on, up to HEADS_MAX_WATCHED of them, and have their
+            metadata from the next refresh
+
+            Returns: dict, metadata or None if not yet known
+        '''
+        self.start()
+        with self._lock:
+            entry = self._metadata.get(dataset, None)
+            watch = (dataset not in self._watched and dataset in self._heads
+                     and len(self._watched) < HEADS_MAX_WATCHED and valid_dataset_name(dataset))
+            if watch:
+                self._watched.add(dataset)
+        if watch:
+            self._request_watch(dataset)
+        if entry is None or entry['head'] != self.head(dataset):
+            return None
+        return entry['metadata']
+
+    def require_metadata(self, dataset):
+        ''' Returns the metadata of a dataset's current head like metadata,
+            reading it for the current head now if the refresher has not yet,
+            and keeping what is read in the registry
+
+            Returns: dict, metadata
+        '''
+        metadata = self.metadata(dataset)
+        if metadata is not None:
+            return metadata
+        head = self.head(dataset)
+        if head is None:
+            raise ValueError(f'head of {dataset} is not known yet')
+        metadata = v3_client.get_metadata(head)
+        with self._lock:
+            if self._heads.get(dataset, None) == head:
+                self._metadata[dataset] = {'head': head, 'metadata': metadata}
+        return metadata
+
+    def end(self, dataset):
+        ''' Returns: datetime, last date covered by a dataset's current head or None if unknown '''
+        metadata = self.metadata(dataset)
+        if metadata is None:
+            return None
+        try:
+            return datetime.fromisoformat(str(metadata["date range"][1]))
+        except (KeyError, IndexError, TypeError, ValueError):
+            return None
+
+    def v4_version(self, dataset):
+        ''' Returns the version of a v4 dataset's latest publication and the
+            last time it covers. Datasets whose version has not been requested
+            before are watched from now on, up to HEADS_MAX_WATCHED of them, and
+            are known from the next refresh if the client can read them
+
+            Returns: str, version or None if not yet known
+                     datetime, last time covered or None if not yet known
+        '''
+        self.start()
+        with self._lock:
+            entry = self._v4.get(dataset, None)
+            watch = (dataset not in self._v4_watched and len(self._v4_watched) < HEADS_MAX_WATCHED
+                     and valid_dataset_name(dataset))
+            if watch:
+                self._v4_watched.add(dataset)
+        if watch:
+            self._request_watch(dataset, '.watch-v4')
+        if entry is None:
+            return None, None
+        return entry['head'], datetime.fromisoformat(entry['end'])
+
+    def broadcast_purge(self, dataset):
+        ''' Asks every other worker sharing the heads file to purge a dataset
+            from its caches, within a few seconds. The calling worker purges its
+            own caches itself
+
+            Returns: bool, whether the purge was broadcast
+        '''
+        if self._path is None or not valid_dataset_name(dataset):
+            return False
+        marker = os.path.join(self._path + '.purge', dataset)
+        try:
+            os.makedirs(self._path + '.purge', exist_ok=True)
+            with open(marker, 'a'):
+                pass
+            os.utime(marker)
+            mtime = os.stat(marker).st_mtime_ns
+        except OSError as e:
+            logger.warning('could not broadcast purge of %s: %s', dataset, e)
+            return False
+        with self._lock:
+            self._purged[dataset] = mtime
+        return True
+
+    def start(self):
+        ''' Loads the heads and starts the background refresher, once per process '''
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is not None:
+                return
+            if not self._load_file(max_age=self._interval):
+                self._load_initial()
+            self._apply_purges(notify=False)
+            self._thread = threading.Thread(target=self._run, name='dataset-heads', daemon=True)
+            self._thread.start()
+
+    def refresh(self):
+        ''' Polls the client now if this process is the refresher, otherwise
+            reloads the shared file
+
+            Returns: bool, whether any head changed
+        '''
+        if self._path is None or self._acquire_refresher():
+            return self._poll()
+        return self._load_file()
+
+    def stats(self):
+        ''' Returns: dict, registry size, counters and seconds since the last update '''
+        with self._lock:
+            return {
+                'datasets': len(self._heads),
+                'metadata': len(self._metadata),
+                'watched': len(self._watched),
+                'v4_datasets': len(self._v4),
+                'refresher': int(self._lock_file is not None or self._path is None),
+                'refreshes': self.refreshes,
+                'refresh_errors': self.refresh_errors,
+                'notifications': self.notifications,
+                'purges': self.purges,
+                'age_seconds': -1 if self._updated is None else round(time.time() - self._updated, 3),
+            }
+
+    def _run(self):
+        while True:
+            time.sleep(self._interval if self._path is None else min(self._interval, 5))
+            try:
+                if self._lock_file is None or time.time() - self._polled >= self._interval:
+                    self.refresh()
+                self._apply_purges()
+            except Exception as e:
+                logger.warning('could not refresh dataset heads: %s', e)
+
+    def _load_initial(self):
+        ''' Polls the client if the shared file is missing or stale and this
+            process can become the refresher, otherwise takes what the file has
+        '''
+        if self._path is not None and not self._acquire_refresher():
+            self._load_file()
+            return
+        try:
+            self._poll()
+        except Exception as e:
+            logger.warning('could not load dataset heads: %s', e)
+
+    def _poll(self):
+        ''' Reads the heads from the client, the metadata of watched datasets
+            whose head changed and the versions of watched v4 datasets, then
+            publishes them
+        '''
+        self._polled = time.time()
+        try:
+            heads = dict(v3_client.get_heads())
+        except Exception as e:
+            self.refresh_errors += 1
+            logger.warning('could not get dataset heads: %s', e)
+            return False
+        requested = self._watch_requests()
+        v4_requested = self._watch_requests('.watch-v4')
+        with self._lock:
+            for dataset in sorted(requested - self._watched):
+                if dataset in heads and len(self._watched) < HEADS_MAX_WATCHED:
+                    self._watched.add(dataset)
+            watched = set(self._watched)
+            metadata = dict(self._metadata)
+            for dataset in sorted(v4_requested - self._v4_watched):
+                if len(self._v4_watched) < HEADS_MAX_WATCHED:
+                    self._v4_watched.add(dataset)
+            v4_watched = set(self._v4_watched)
+            v4 = dict(self._v4)
+        for dataset in watched:
+            head = heads.get(dataset, None)
+            if head is None or metadata.get(dataset, {}).get('head', None) == head:
+                continue
+            try:
+                metadata[dataset] = {'head': head, 'metadata': v3_client.get_metadata(head)}
+            except Exception as e:
+                self.refresh_errors += 1
+                logger.warning('could not get metadata of %s: %s', dataset, e)
+        for dataset in v4_watched:
+            try:
+                v4[dataset] = read_v4_version(dataset, v4.get(dataset, None))
+            except Exception as e:
+                self.refresh_errors += 1
+                logger.warning('could not get v4 version of %s: %s', dataset, e)
+                if dataset not in v4:
+                    self._unwatch_v4(dataset)
+        self.refreshes += 1
+        changed = self._publish(heads, metadata, time.time(), v4)
+        if self._path is not None:
+            self._write_file(heads, metadata, v4)
+        return changed
+
+    def _publish(self, heads, metadata, updated, v4):
+        with self._lock:
+            previous, self._heads = self._heads, heads
+            previous_v4, self._v4 = self._v4, v4
+            self._metadata = metadata
+            self._updated = updated
+        changes = [(dataset, previous[dataset], head) for dataset, head in heads.items()
+                   if dataset in previous and previous[dataset] != head]
+        changes += [(dataset, previous_v4[dataset]['head'], entry['head']) for dataset, entry in v4.items()
+                    if dataset in previous_v4 and previous_v4[dataset]['head'] != entry['head']]
+        for dataset, old_head, new_head in changes:
+            logger.info('dataset %s moved to head %s', dataset, new_head)
+            self.notifications += 1
+            for callback in self._subscribers:
+                try:
+                    callback(dataset, old_head, new_head)
+                except Exception as e:
+                    logger.warning('dataset head subscriber failed for %s: %s', dataset, e)
+        return len(changes) > 0
+
+    def _acquire_refresher(self):
+        ''' Returns: bool, whether this process holds the refresher lock '''
+        if self._lock_file is not None:
+            return True
+        try:
+            lock_file = open(self._path + '.lock', 'a')
+        except OSError as e:
+            logger.warning('could not open dataset heads lock: %s', e)
+            return False
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        self._lock_file = lock_file
+        logger.info('refreshing dataset heads for this host')
+        return True
+
+    def _write_file(self, heads, metadata, v4):
+        directory = os.path.dirname(os.path.abspath(self._path))
+        try:
+            with tempfile.NamedTemporaryFile('w', dir=directory, prefix='.heads-', delete=False) as f:
+                json.dump({'updated': time.time(), 'heads': heads, 'metadata': metadata, 'v4': v4}, f, default=str)
+            os.replace(f.name, self._path)
+            self._mtime = os.stat(self._path).st_mtime_ns
+        except OSError as e:
+            logger.warning('could not write dataset heads file: %s', e)
+
+    def _load_file(self, max_age=None):
+        ''' Reloads the shared file if it changed since it was last read
+
+            Parameters: max_age (float), ignore the file if it is older than this many seconds
+            Returns: bool, whether the file was read
+        '''
+        if self._path is None:
+            return False
+        try:
+            stat = os.stat(self._path)
+            if stat.st_mtime_ns == self._mtime:
+                return False
+            if max_age is not None and time.time() - stat.st_mtime > max_age:
+                return False
+            with open(self._path, 'r') as f:
+                shared = json.load(f)
+        except (OSError, ValueError):
+            return False
+        self._mtime = stat.st_mtime_ns
+        self._publish(shared['heads'], shared['metadata'], shared['updated'], shared.get('v4', {}))
+        return True
+
+    def _request_watch(self, dataset, suffix='.watch'):
+        ''' Asks the refreshing worker to keep a dataset's metadata, or with the
+            '.watch-v4' suffix a v4 dataset's version, current
+        '''
+        if self._path is None or self._lock_file is not None or not valid_dataset_name(dataset):
+            return
+        try:
+            os.makedirs(self._path + suffix, exist_ok=True)
+            with open(os.path.join(self._path + suffix, dataset), 'a'):
+                pass
+        except OSError as e:
+            logger.warning('could not watch %s: %s', dataset, e)
+
+    def _watch_requests(self, suffix='.watch'):
+        if self._path is None:
+            return set()
+        try:
+            return set(filter(valid_dataset_name, os.listdir(self._path + suffix)))
+        except OSError:
+            return set()
+
+    def _unwatch_v4(self, dataset):
+        ''' Stops watching a v4 dataset the client has never been able to read '''
+        with self._lock:
+            self._v4_watched.discard(dataset)
+        if self._path is None:
+            return
+        try:
+            os.remove(os.path.join(self._path + '.watch-v4', dataset))
+        except OSError:
+            pass
+
+    def _apply_purges(self, notify=True):
+        ''' Calls the purge subscribers for every dataset whose purge marker
+            changed since it was last seen
+
+            Parameters: notify (bool), whether to call the subscribers or only
+                        note the current markers
+        '''
+        if self._path is None:
+            return
+        directory = self._path + '.purge'
+        try:
+            datasets = list(filter(valid_dataset_name, os.listdir(directory)))
+        except OSError:
+            return
+        for dataset in datasets:
+            try:
+                mtime = os.stat(os.path.join(directory, dataset)).st_mtime_ns
+            except OSError:
+                continue
+            with self._lock:
+                seen = self._purged.get(dataset, None)
+                self._purged[dataset] = mtime
+            if not notify or seen == mtime:
+                continue
+            logger.info('purging %s as broadcast by another worker', dataset)
+            self.purges += 1
+            for callback in self._purge_subscribers:
+                try:
+                    callback(dataset)
+                except Exception as e:
+                    logger.warning('dataset purge subscriber failed for %s: %s', dataset, e)
+
+
+DATASET_HEADS = DatasetHeads()
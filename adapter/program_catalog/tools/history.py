@@ -0,0 +1,78 @@
+from datetime import date, datetime
+from operator import attrgetter
+
+import numpy as np
+import pandas as pd
+
+from program_catalog.tools.units import series_unit, set_unit, to_float_values
+
+_NS_PER_DAY = 86_400_000_000_000
+_EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+
+def _epoch_index(keys, utc):
+    ''' Builds a DatetimeIndex in one pass over the keys, for keys that are all
+        dates or all datetimes. Dates and aware datetimes are turned into int64
+        nanoseconds since the epoch instead of being parsed one at a time
+
+        Returns: Pandas DatetimeIndex, or None if the keys need Pandas' parser
+    '''
+    key_types = set(map(type, keys))
+    if len(key_types) != 1:
+        return None
+    key_type = key_types.pop()
+    if key_type is date:
+        ordinals = np.fromiter((key.toordinal() for key in keys), dtype=np.int64, count=len(keys))
+        index = pd.DatetimeIndex((ordinals - _EPOCH_ORDINAL) * _NS_PER_DAY)
+        return index.tz_localize('UTC') if utc else index
+    if key_type is not datetime:
+        return None
+    tzinfos = set(map(attrgetter('tzinfo'), keys))
+    if tzinfos == {None}:
+        # Pandas converts naive datetimes in C faster than epoch values can be computed
+        index = pd.DatetimeIndex(keys)
+        return index.tz_localize('UTC') if utc else index
+    if None in tzinfos or (len(tzinfos) > 1 and not utc):
+        return None
+    seconds = np.fromiter(map(datetime.timestamp, keys), dtype=np.float64, count=len(keys))
+    index = pd.DatetimeIndex(np.round(seconds * 1e6).astype(np.int64) * 1000, tz='UTC')
+    return index if utc else index.tz_convert(tzinfos.pop())
+
+
+def normalize_history(data, utc=False):
+    ''' Turns a client history into a float64 Series on a sorted DatetimeIndex
+        in one pass. The index is built from epoch nanoseconds rather than by
+        parsing each key, and the values and index are only reordered when the
+        keys are not already in time order. The result is what the wrappers
+        used to build with Series(data).set_axis(to_datetime(index)).sort_index(),
+        with the unit of Quantity values kept in attrs
+
+        Parameters: data (dict or Pandas Series), values keyed on date or datetime
+                    utc (bool), whether to convert the index to UTC, localizing
+                    naive keys as UTC
+        Returns: Pandas Series, normalized history
+        Raises: ValueError, if the history is empty
+    '''
+    if isinstance(data, pd.Series):
+        keys, values = list(data.index), data.to_numpy()
+    else:
+        keys, values = list(data.keys()), list(data.values())
+    if len(keys) == 0:
+        raise ValueError('No data returned for request')
+    index = _epoch_index(keys, utc)
+    if index is None:
+        index = pd.DatetimeIndex(pd.to_datetime(keys, utc=utc))
+    if isinstance(values, np.ndarray) and values.dtype.kind in 'fiu':
+        converted = values.astype(np.float64, copy=False), series_unit(data)
+    else:
+        converted = to_float_values(values)
+    unit = None
+    if converted is None:
+        values = pd.Series(values, dtype=object).to_numpy()
+    else:
+        values, unit = converted
+    if not index.is_monotonic_increasing:
+        order = index.argsort()
+        index, values = index[order], values[order]
+    series = pd.Series(values, index=index, copy=False)
+    return series if converted is None else set_unit(series, unit)
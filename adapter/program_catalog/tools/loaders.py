@@ -1,9 +1,20 @@
+import os
 import ast
+import time
+import numpy as np
 import pandas as pd
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 from datetime import datetime, timedelta
 
 import program_catalog.tools.wrappers as client
+from program_catalog.tools.aggregation import StreamingMean, latitude_weights
+from program_catalog.tools.metrics import timed
+from program_catalog.tools.units import series_unit, set_unit
 
+LOADER_MAX_WORKERS = int(os.getenv("LOADER_MAX_WORKERS", 8))
+LOADER_CELL_TIMEOUT = os.getenv("LOADER_CELL_TIMEOUT", None)
+LOADER_CELL_TIMEOUT = float(LOADER_CELL_TIMEOUT) if LOADER_CELL_TIMEOUT else None
+LOADER_AGGREGATION = os.getenv("LOADER_AGGREGATION", "concat")
 
 
 def parse_timestamp(timestamp):
@@ -23,18 +34,34 @@ class DClimateLoader:
         in the case of contract evaluation requests computes a single time series 
         for a specified station or averaged over a number of locations
     '''
-    def __init__(self, dataset_name, imperial_units=False, **kwargs):
+    def __init__(self, dataset_name, imperial_units=False, start=None, end=None, **kwargs):
         ''' On initialization each Loader instance sets the dataset to pull from
             and any additional request parameters
 
             Parameters: dataset_name (str), the name of the dataset on IPFS
                         imperial_units (bool), whether to use imperial units
+                        start (str), start of the window of data to load or None
+                        end (str), end of the window of data to load or None
                         kwargs (dict), additional request parameters
         '''
         if isinstance(imperial_units, str):
             imperial_units = ast.literal_eval(imperial_units)
         self._dataset_name = dataset_name
         self._request_params = {'use_imperial_units': imperial_units, **kwargs}
+        self._window = (None, None)
+        self._set_window(start, end)
+
+    def _set_window(self, start, end):
+        ''' Restricts loaded histories to the given window. The window is passed
+            down to the wrappers so only data inside it is materialized
+        '''
+        self._window = (start, end)
+        self._request_params.pop('_start', None)
+        self._request_params.pop('_end', None)
+        if start is not None:
+            self._request_params['_start'] = start
+        if end is not None:
+            self._request_params['_end'] = end
 
     def load(self):
         ''' Loading function to be implemented by subclasses '''
@@ -46,13 +73,25 @@ class GridcellLoader(DClimateLoader):
         to get historical gridcell data from IPFS for specified locations and
         computes single time series averaged over all locations
     '''
-    def __init__(self, locations, dataset_name, imperial_units=True, **kwargs):
+    def __init__(self, locations, dataset_name, imperial_units=True, max_workers=LOADER_MAX_WORKERS,
+                 cell_timeout=LOADER_CELL_TIMEOUT, aggregation=LOADER_AGGREGATION, weights=None, **kwargs):
         ''' On initialization each Loader instance sets the locations for which to
             get the historical weather data and the dataset to pull from
 
             Parameters: locations (str), string of list of lat/lon coordinate pairs as strings
                         dataset_name (str), the name of the dataset on IPFS
                         imperial_units (bool), whether to use imperial units
+                        max_workers (int), number of locations to fetch concurrently,
+                            1 fetches each location sequentially
+                        cell_timeout (float), seconds any single location may take
+                            to load, counted from when its fetch starts, or None to
+                            wait indefinitely
+                        aggregation (str), 'concat' to average a DataFrame of all
+                            locations or 'streaming' to fold each location into a
+                            running mean as it arrives
+                        weights (str or list), None for an unweighted average, 'latitude'
+                            to weight locations by area or a weight for each location.
+                            Weighted averages always use the streaming aggregation
                         kwargs (dict), additional request parameters
         '''
         super().__init__(dataset_name, imperial_units=imperial_units, **kwargs)
@@ -60,38 +99,220 @@ class GridcellLoader(DClimateLoader):
             self._locations = ast.literal_eval(locations)
         else:
             self._locations = locations
+        self._max_workers = max(1, int(max_workers))
+        self._cell_timeout = cell_timeout
+        if aggregation not in ('concat', 'streaming'):
+            raise ValueError(f'unsupported aggregation {aggregation}')
+        if weights == 'latitude':
+            weights = latitude_weights(self._locations)
+        elif isinstance(weights, str):
+            weights = ast.literal_eval(weights)
+        if weights is not None and len(weights) != len(self._locations):
+            raise ValueError('weights must have one value per location')
+        self._weights = weights
+        self._aggregation = 'streaming' if weights is not None else aggregation
 
     def load(self):
         ''' Loads the weather data time series from IPFS for each specified
             location and averages the desired quantities to produce a single
             time series of historical averages
 
+            Histories are always combined in the order the locations were given
+            so that the concurrent and sequential paths produce identical averages.
+            The streaming aggregation keeps only the running mean and the histories
+            not yet folded into it, instead of every location's history
+
             Returns: Pandas Series, time series for desired weather data averaged
             across all locations specified during initialization
         '''
-        gridcell_histories = []
-        for (lat, lon) in self._locations:
-            series = self._load_series(lat, lon)
-            gridcell_histories.append(series)
-        df = pd.concat(gridcell_histories, axis=1)
-        result = pd.Series(df.mean(axis=1))
-        return result
+        with timed('load_history', endpoint='grid-history', dataset=self._dataset_name):
+            if self._max_workers == 1 or len(self._locations) <= 1:
+                histories = self._load_sequential()
+            else:
+                histories = self._load_concurrent()
+            if self._aggregation == 'streaming':
+                mean = StreamingMean()
+                for i, history in histories:
+                    mean.add(history, None if self._weights is None else self._weights[i])
+                return mean.result()
+            histories = [history for _, history in histories]
+            df = pd.concat(histories, axis=1)
+            result = pd.Series(df.mean(axis=1))
+            return set_unit(result, series_unit(histories[0]))
+
+    def _load_sequential(self):
+        ''' Loads each location one after another
+
+            Returns: generator, (position, Pandas Series) for each location in the given order
+        '''
+        errors = []
+        for i, (lat, lon) in enumerate(self._locations):
+            try:
+                history = self._load_series(lat, lon)
+            except Exception as e:
+                errors.append(f'({lat}, {lon}): {e}')
+                continue
+            yield i, history
+        if errors:
+            raise ValueError(f'failed to load {len(errors)} of {len(self._locations)} locations: {"; ".join(errors)}')
+
+    def _load_concurrent(self):
+        ''' Loads locations on a bounded thread pool. Every location is given
+            the configured timeout from when its fetch starts, so locations
+            loading at the same time time out together rather than one after
+            another, and any failures are collected per location and reported together
+
+            Locations are only submitted up to twice the number of workers ahead
+            of the one being yielded, so at most that many finished histories
+            wait to be folded however many locations there are
+
+            Returns: generator, (position, Pandas Series) for each location in the given order
+        '''
+        workers = min(self._max_workers, len(self._locations))
+        ahead = 2 * workers
+        executor = ThreadPoolExecutor(max_workers=workers)
+        try:
+            futures = {}
+            submitted = 0
+            errors = []
+            for i, (lat, lon) in enumerate(self._locations):
+                while submitted < min(i + ahead, len(self._locations)):
+                    started = [None]
+                    futures[submitted] = (executor.submit(self._load_started, started, *self._locations[submitted]), started)
+                    submitted += 1
+                future, started = futures.pop(i)
+                try:
+                    history = self._result_by_deadline(future, started)
+                except FutureTimeoutError:
+                    future.cancel()
+                    errors.append(f'({lat}, {lon}): timed out after {self._cell_timeout} seconds')
+                    continue
+                except Exception as e:
+                    errors.append(f'({lat}, {lon}): {e}')
+                    continue
+                del future
+                yield i, history
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+        if errors:
+            raise ValueError(f'failed to load {len(errors)} of {len(self._locations)} locations: {"; ".join(errors)}')
+
+    def _load_started(self, started, lat, lon):
+        ''' Notes when a location's fetch starts in started[0] and loads it '''
+        started[0] = time.monotonic()
+        return self._load_series(lat, lon)
+
+    def _result_by_deadline(self, future, started):
+        ''' Waits for a location's history until cell_timeout seconds after its
+            fetch started, however long it was queued before that
+
+            Parameters: future (Future), the location's fetch
+                        started (list), the fetch's start time once it started
+            Returns: Pandas Series, the location's history
+        '''
+        if self._cell_timeout is None:
+            return future.result()
+        while True:
+            start = started[0]
+            remaining = self._cell_timeout if start is None else start + self._cell_timeout - time.monotonic()
+            try:
+                return future.result(timeout=max(0.0, remaining))
+            except FutureTimeoutError:
+                if started[0] is not None and time.monotonic() >= started[0] + self._cell_timeout:
+                    raise
 
     def _load_series(self, lat, lon):
         ''' Loads a Pandas Series from IPFS for a given lat/lon coordinate pair
 
             Parameters: lat (float), latitude of location
                         lon (float), longitude of location
-            Returns: Pandas Series, historical weather data for the given location
+            Returns: Pandas Series, historical weather data for the given location,
+                     already on a sorted UTC DatetimeIndex from the wrapper
         '''
-        data = client.get_gridcell_history_wrapper(lat, lon, self._dataset_name, **self._request_params)
+        with timed('fetch', endpoint='grid-history', dataset=self._dataset_name):
+            data = client.get_gridcell_history_wrapper({'lat': lat, 'lon': lon, 'dataset': self._dataset_name, **self._request_params})
         series = data['data']
-        if series.empty:
+        if series.empty and self._window == (None, None):
             raise ValueError('No data returned for request')
-        series = series.set_axis(pd.to_datetime(series.index, utc=True)).sort_index()
         return series
 
 
+class MultiPointLoader(DClimateLoader):
+    ''' Loader class for zarr datasets. Uses the dClimate zarr client to get
+        the history averaged over the specified locations with a single v4 query,
+        restricted to the loader's window, instead of one IPFS lookup per location
+    '''
+    def __init__(self, locations, dataset_name, imperial_units=True, epsg_crs=4326, **kwargs):
+        ''' On initialization each Loader instance sets the locations for which to
+            get the historical weather data and the dataset to pull from
+
+            Parameters: locations (str), string of list of lat/lon coordinate pairs as strings
+                        dataset_name (str), the name of the v4 dataset
+                        imperial_units (bool), whether to use imperial units
+                        epsg_crs (int), coordinate reference system of the locations
+                        kwargs (dict), additional request parameters
+        '''
+        super().__init__(dataset_name, imperial_units=imperial_units, **kwargs)
+        if (type(locations) == str):
+            locations = ast.literal_eval(locations)
+        self._locations = [(float(lat), float(lon)) for (lat, lon) in locations]
+        self._epsg_crs = epsg_crs
+
+    def load(self):
+        ''' Loads the weather data time series averaged over all locations
+
+            Returns: Pandas Series, time series for desired weather data averaged
+            across all locations specified during initialization
+        '''
+        args = {key: value for key, value in self._request_params.items() if key not in ('_start', '_end')}
+        args.update({
+            'locations': self._locations,
+            'dataset': self._dataset_name,
+            'epsg_crs': self._epsg_crs,
+            'time_range': None if None in self._window else self._window,
+        })
+        with timed('load_history', endpoint='multi-point-history', dataset=self._dataset_name):
+            data = client.get_multi_point_history_wrapper(args)
+        series = data['data']
+        start, end = self._window
+        if (start is not None) != (end is not None):
+            series = series.loc[start:end]
+        return series
+
+
+def compare_loaders(expected, actual, rtol=1e-9, atol=1e-12):
+    ''' Compares the averaged histories of two loaders side by side, e.g. the
+        per-location GridcellLoader against the MultiPointLoader, on their
+        shared timestamps
+
+        Parameters: expected (Pandas Series), history of the reference loader
+                    actual (Pandas Series), history of the loader being checked
+                    rtol (float), relative tolerance of each value
+                    atol (float), absolute tolerance of each value
+        Returns: dict, summary of the differences and whether the histories
+                 are equivalent
+    '''
+    expected = pd.Series([getattr(v, 'value', v) for v in expected], index=expected.index, dtype=float)
+    actual = pd.Series([getattr(v, 'value', v) for v in actual], index=actual.index, dtype=float)
+    shared = expected.index.intersection(actual.index)
+    left = expected.loc[shared].to_numpy()
+    right = actual.loc[shared].to_numpy()
+    both = ~(np.isnan(left) | np.isnan(right))
+    differences = np.abs(left[both] - right[both])
+    close = np.isclose(left, right, rtol=rtol, atol=atol, equal_nan=True)
+    summary = {
+        'shared': len(shared),
+        'only_expected': len(expected.index.difference(actual.index)),
+        'only_actual': len(actual.index.difference(expected.index)),
+        'mismatched': int((~close).sum()),
+        'max_abs_difference': float(differences.max()) if len(differences) > 0 else 0.0,
+        'expected_total': float(np.nansum(left)),
+        'actual_total': float(np.nansum(right)),
+    }
+    summary['equivalent'] = summary['only_expected'] == 0 and summary['only_actual'] == 0 and summary['mismatched'] == 0
+    return summary
+
+
 class StationLoader(DClimateLoader):
     ''' Loader class for GHCN station datasets. Uses dWeather Python client
         to get historical GHCN data from IPFS for specified weather station
@@ -116,6 +337,13 @@ class StationLoader(DClimateLoader):
         dates = ast.literal_eval(dates)
         start_date = datetime(2022, 2, 18)
         self._dates = [date for date in dates if datetime.strptime(date, '%Y-%m-%d') < (start_date + timedelta(days=15))]
+        if self._window == (None, None) and len(self._dates) > 0:
+            self._set_window(min(self._dates), max(self._dates))
+
+    @property
+    def dates(self):
+        ''' Returns: list, covered dates of the contract as strings '''
+        return self._dates
 
     def load(self):
         ''' Loads the dataset history from IPFS for the specified station ID
@@ -123,10 +351,23 @@ class StationLoader(DClimateLoader):
 
             Returns: Pandas Series, time series for station weather data for covered dates
         '''
-        data = client.get_station_history_wrapper(self._station_id, self._weather_variable, **self._request_params)
+        series = self.load_history()
+        covered_dates = series.loc[self._dates]
+        return covered_dates
+
+    def load_history(self):
+        ''' Loads the dataset history from IPFS for the specified station ID
+            and weather variable, limited to the loader's window which defaults
+            to the span of the covered dates
+
+            Returns: Pandas Series, time series for station weather data
+        '''
+        with timed('load_history', endpoint='ghcn-history', dataset=self._dataset_name):
+            data = client.get_station_history_wrapper({'station_id': self._station_id,
+                                                       'weather_variable': self._weather_variable,
+                                                       'dataset': self._dataset_name,
+                                                       **self._request_params})
         series = data['data']
-        if series.empty:
+        if series.empty and self._window == (None, None):
             raise ValueError('No data returned for request')
-        series = series.set_axis(pd.to_datetime(series.index)).sort_index()
-        covered_dates = series.loc[self._dates]
-        return covered_dates
\ No newline at end of file
+        return series
\ No newline at end of file
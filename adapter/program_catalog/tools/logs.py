@@ -0,0 +1,97 @@
+import os
+import sys
+import json
+import time
+import queue
+import atexit
+import random
+import logging
+import logging.handlers
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# logger name: level, e.g. {"program_catalog.tools.crypto": "DEBUG"}
+LOG_LEVELS = json.loads(os.getenv("LOG_LEVELS", "{}"))
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", 10000))
+# fraction of requests whose headers and body are logged at debug level
+REQUEST_LOG_SAMPLE_RATE = float(os.getenv("REQUEST_LOG_SAMPLE_RATE", 0.01))
+
+_LISTENER = None
+_RECORD_FIELDS = set(logging.makeLogRecord({}).__dict__) | {'message', 'asctime'}
+
+
+class StructuredFormatter(logging.Formatter):
+    ''' Formats records as single line JSON objects holding the time, level,
+        logger and message along with any fields passed in `extra`
+    '''
+
+    def format(self, record):
+        entry = {
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(record.created)) + f'.{int(record.msecs):03d}Z',
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for name, value in record.__dict__.items():
+            if name not in _RECORD_FIELDS:
+                entry[name] = value
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    ''' Queue handler that drops records instead of blocking the request when
+        the queue is full, and leaves formatting to the listener thread
+    '''
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def configure_logging(level=LOG_LEVEL, levels=LOG_LEVELS, log_format=LOG_FORMAT):
+    ''' Routes all logging through a bounded queue drained by a background
+        thread, so request threads only enqueue records and never write. Records
+        below the configured levels are discarded before their message is
+        formatted. Safe to call more than once, later calls only update levels
+
+        Parameters: level (str), level of the root logger
+                    levels (dict), levels of individual loggers keyed on logger name
+                    log_format (str), 'json' for structured records or 'text'
+    '''
+    global _LISTENER
+    root = logging.getLogger()
+    root.setLevel(level)
+    for name, logger_level in levels.items():
+        logging.getLogger(name).setLevel(str(logger_level).upper())
+    if _LISTENER is not None:
+        return
+    stream = logging.StreamHandler(sys.stdout)
+    if log_format == 'json':
+        stream.setFormatter(StructuredFormatter())
+    else:
+        stream.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(name)s: %(message)s'))
+    log_queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(DroppingQueueHandler(log_queue))
+    _LISTENER = logging.handlers.QueueListener(log_queue, stream, respect_handler_level=True)
+    _LISTENER.start()
+    atexit.register(_LISTENER.stop)
+
+
+def sample_request(logger, rate=REQUEST_LOG_SAMPLE_RATE):
+    ''' Returns: bool, whether to log the current request's details, true for
+        a `rate` fraction of requests when the logger is enabled for debug
+    '''
+    return logger.isEnabledFor(logging.DEBUG) and random.random() < rate
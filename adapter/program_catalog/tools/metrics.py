@@ -0,0 +1,137 @@
+import time
+import bisect
+import threading
+from contextlib import contextmanager
+
+# upper bounds in seconds of the latency histogram buckets
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 240.0)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra is not None:
+        pairs.append(f'{extra[0]}="{extra[1]}"')
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Histogram:
+    ''' Labelled histogram of observed values with cumulative buckets, counts
+        and sums in the Prometheus exposition format
+    '''
+
+    def __init__(self, name, documentation, label_names, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._series = {}
+
+    def observe(self, value, **labels):
+        ''' Records a value for the given label values '''
+        key = tuple(str(labels.get(name, '')) for name in self.label_names)
+        position = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key, None)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][position] += 1
+            series[1] += value
+
+    def render(self):
+        ''' Returns: list, lines of the histogram in the exposition format '''
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            series = [(key, list(counts), total) for key, (counts, total) in sorted(self._series.items())]
+        for key, counts, total in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append(f'{self.name}_bucket{_format_labels(self.label_names, key, ("le", le))} {cumulative}')
+            lines.append(f'{self.name}_sum{_format_labels(self.label_names, key)} {total}')
+            lines.append(f'{self.name}_count{_format_labels(self.label_names, key)} {cumulative}')
+        return lines
+
+
+class Counter:
+    ''' Labelled monotonically increasing counter '''
+
+    def __init__(self, name, documentation, label_names):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def inc(self, amount=1, **labels):
+        ''' Increments the counter for the given label values '''
+        key = tuple(str(labels.get(name, '')) for name in self.label_names)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        ''' Returns: list, lines of the counter in the exposition format '''
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} counter']
+        with self._lock:
+            values = sorted(self._values.items())
+        for key, value in values:
+            lines.append(f'{self.name}{_format_labels(self.label_names, key)} {value}')
+        return lines
+
+
+STAGE_SECONDS = Histogram('adapter_stage_seconds', 'Time spent in each stage of serving a request',
+                          ['stage', 'endpoint', 'dataset'])
+STAGE_ERRORS = Counter('adapter_stage_errors_total', 'Stages that raised an exception',
+                       ['stage', 'endpoint', 'dataset'])
+REQUEST_SECONDS = Histogram('adapter_request_seconds', 'Time spent serving each request', ['route'])
+REQUESTS = Counter('adapter_requests_total', 'Requests served', ['route', 'status'])
+TAIL_REFRESHES = Counter('adapter_tail_refreshes_total', 'Cached histories extended with only their tail',
+                         ['wrapper', 'outcome'])
+
+_COLLECTORS = {}
+
+
+@contextmanager
+def timed(stage, endpoint='', dataset=''):
+    ''' Times the enclosed block as a stage of the current request, counting
+        it as an error if it raises
+
+        Parameters: stage (str), name of the stage, e.g. fetch
+                    endpoint (str), API endpoint key or program the stage serves
+                    dataset (str), dataset the stage reads
+    '''
+    start = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        STAGE_ERRORS.inc(stage=stage, endpoint=endpoint, dataset=dataset)
+        raise
+    finally:
+        STAGE_SECONDS.observe(time.perf_counter() - start, stage=stage, endpoint=endpoint, dataset=dataset)
+
+
+def register_collector(name, collect):
+    ''' Exposes the numeric values of a stats dict, e.g. TTLCache.stats, as gauges
+
+        Parameters: name (str), metric name prefix after adapter_
+                    collect (function), returns a flat dict of numbers
+    '''
+    _COLLECTORS[name] = collect
+
+
+def render_metrics():
+    ''' Returns: str, all metrics of this process in the Prometheus text exposition format '''
+    lines = []
+    for metric in (REQUESTS, REQUEST_SECONDS, STAGE_SECONDS, STAGE_ERRORS, TAIL_REFRESHES):
+        lines += metric.render()
+    for name, collect in sorted(_COLLECTORS.items()):
+        for key, value in sorted(collect().items()):
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                metric = f'adapter_{name}_{key}'
+                lines += [f'# TYPE {metric} gauge', f'{metric} {value}']
+    return '\n'.join(lines) + '\n'
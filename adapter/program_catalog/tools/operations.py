@@ -0,0 +1,229 @@
+import ast
+import logging
+from datetime import date, datetime, time, timezone
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+import astropy.units as u
+from pandas.tseries.frequencies import to_offset
+
+from program_catalog.tools.units import parse_unit
+
+PRECISION = 1e18
+
+logger = logging.getLogger(__name__)
+
+# operation name: (required argument types, optional argument types)
+OPERATIONS = {
+    'last': ((str,), ()),
+    'first': ((str,), ()),
+    'head': ((), (int,)),
+    'tail': ((), (int,)),
+    'resample': ((str,), ()),
+    'rolling': ((int,), ()),
+    'diff': ((), (int,)),
+    'shift': ((), (int,)),
+    'pct_change': ((), (int,)),
+    'quantile': ((), (float,)),
+    'dropna': ((), ()),
+    'abs': ((), ()),
+    'cumsum': ((), ()),
+    'count': ((), ()),
+    'idxmax': ((), ()),
+    'idxmin': ((), ()),
+    'mean': ((), ()),
+    'median': ((), ()),
+    'max': ((), ()),
+    'min': ((), ()),
+    'sum': ((), ()),
+    'std': ((), ()),
+    'var': ((), ()),
+}
+# reductions that can run directly on the float64 values of a series
+_FUSABLE_REDUCTIONS = {'mean', 'max', 'min', 'sum'}
+# operations returning counts or times rather than values in the unit of the data
+_UNITLESS_RESULTS = {'count', 'idxmax', 'idxmin'}
+
+
+def last(data, offset):
+    ''' Selects the final periods of a time series based on a date offset,
+        the same selection as Pandas' (deprecated) Series.last
+
+        Parameters: data (Pandas Series or DataFrame), data with a DatetimeIndex
+                    offset (str), date offset, e.g. '1M'
+        Returns: Pandas Series or DataFrame, the selected periods
+    '''
+    return data.iloc[_last_start(data.index, offset):]
+
+
+def _last_start(index, offset):
+    if not isinstance(index, pd.DatetimeIndex):
+        raise TypeError("'last' only supports a DatetimeIndex index")
+    if len(index) == 0:
+        return 0
+    return index.searchsorted(index[-1] - to_offset(offset), side='right')
+
+
+def _reduce(values, op):
+    ''' Applies a reduction to float64 values skipping NaNs the way Pandas does,
+        so results are identical to the equivalent Series method
+    '''
+    mask = np.isnan(values)
+    if op in ('sum', 'mean'):
+        if mask.any():
+            values = np.where(mask, 0.0, values)
+        total = values.sum(dtype=np.float64)
+        if op == 'sum':
+            return np.float64(total)
+        count = len(values) - int(mask.sum())
+        return np.float64(total / count) if count > 0 else np.float64(np.nan)
+    if len(values) == 0 or mask.all():
+        return np.float64(np.nan)
+    valid = values[~mask] if mask.any() else values
+    return np.float64(valid.max() if op == 'max' else valid.min())
+
+
+class Plan:
+    ''' A compiled operation chain. Steps are (name, args) pairs where fused
+        steps apply a slice and a reduction in one pass over the float64 values
+        of a series, and generic steps call the whitelisted Pandas method
+    '''
+
+    def __init__(self, steps):
+        self.steps = steps
+
+    def execute(self, data):
+        ''' Applies the chain to the data
+
+            Parameters: data (Pandas Series or DataFrame), requested data
+            Returns: object, the result of the final operation
+        '''
+        for name, args in self.steps:
+            if name == 'last+reduce':
+                offset, op = args
+                if isinstance(data, pd.Series) and data.dtype == np.float64:
+                    start = _last_start(data.index, offset)
+                    data = _reduce(data.to_numpy()[start:], op)
+                else:
+                    data = getattr(last(data, offset), op)()
+            elif name == 'reduce':
+                op, = args
+                if isinstance(data, pd.Series) and data.dtype == np.float64:
+                    data = _reduce(data.to_numpy(), op)
+                else:
+                    data = getattr(data, op)()
+            elif name == 'last':
+                data = last(data, *args)
+            else:
+                data = getattr(data, name)(*args)
+        return data
+
+    def result_unit(self, unit):
+        ''' Returns the unit of the chain's result for data in the given unit,
+            the unit the same operations give on a series of Quantities
+
+            Parameters: unit (str), unit of the data
+            Returns: str, unit of the result or None if the result has no unit
+        '''
+        for name, args in self.steps:
+            op = args[1] if name == 'last+reduce' else args[0] if name == 'reduce' else name
+            if op in _UNITLESS_RESULTS:
+                return None
+            if op == 'var':
+                unit = (parse_unit(unit) ** 2).to_string() if unit else unit
+            elif op == 'pct_change':
+                unit = u.dimensionless_unscaled.to_string()
+        return unit
+
+
+def _parse_arguments(op, params):
+    ''' Parses and type checks the arguments of an operation against its schema '''
+    if op not in OPERATIONS:
+        raise ValueError(f'unsupported operation {op}')
+    try:
+        args = ast.literal_eval(params) if isinstance(params, str) else params
+    except (ValueError, SyntaxError):
+        raise ValueError(f'could not parse parameters {params} for operation {op}')
+    if not isinstance(args, (list, tuple)):
+        raise ValueError(f'parameters for operation {op} must be a list')
+    required, optional = OPERATIONS[op]
+    if len(args) < len(required) or len(args) > len(required) + len(optional):
+        raise ValueError(f'operation {op} takes {len(required)} to {len(required) + len(optional)} parameters')
+    for arg, arg_type in zip(args, required + optional):
+        valid = isinstance(arg, arg_type) and not isinstance(arg, bool)
+        if arg_type is float:
+            valid = isinstance(arg, (int, float)) and not isinstance(arg, bool)
+        if not valid:
+            raise ValueError(f'parameter {arg!r} for operation {op} must be {arg_type.__name__}')
+    return tuple(args)
+
+
+@lru_cache(maxsize=1024)
+def _compile(ops, params):
+    steps = [(op, _parse_arguments(op, params[i] if i < len(params) else '[]')) for i, op in enumerate(ops)]
+    fused = []
+    i = 0
+    while i < len(steps):
+        name, args = steps[i]
+        following = steps[i + 1][0] if i + 1 < len(steps) else None
+        if name == 'last' and following in _FUSABLE_REDUCTIONS:
+            fused.append(('last+reduce', (args[0], following)))
+            i += 2
+            continue
+        if name in _FUSABLE_REDUCTIONS:
+            fused.append(('reduce', (name,)))
+        else:
+            fused.append((name, args))
+        i += 1
+    return Plan(fused)
+
+
+def compile_plan(ops, params):
+    ''' Compiles request operations and their parameters into a cached Plan,
+        rejecting operations and parameters that are not in OPERATIONS
+
+        Parameters: ops (list), names of the operations
+                    params (list), string representations of each operation's arguments
+        Returns: Plan, the compiled chain
+        Raises: ValueError, if an operation or its parameters are not supported
+    '''
+    if len(ops) == 0:
+        raise ValueError('no operations requested')
+    return _compile(tuple(ops), tuple(params or []))
+
+
+def to_chain_value(result, unit=None, quantity_unit=None):
+    ''' Converts the result of an operation chain to the integer value and
+        unit written back on chain. Series and DataFrames are averaged,
+        times are returned as ms since epoch and numbers are scaled by PRECISION
+
+        Parameters: result (object), result of the operation chain
+                    unit (str), unit of the requested data, if known
+                    quantity_unit (str), unit of a float result computed from
+                        Quantity values, reported the way Quantity results are
+        Returns: int, value to return on chain
+                 str, unit of the value
+                 str, error message or None
+    '''
+    no_unit = "n/a"
+    if isinstance(result, (pd.Series, pd.DataFrame)):
+        result = result.mean()
+    if type(result) is time:
+        result = datetime.combine(date(1970, 1, 1), result)
+    elif type(result) is date:
+        result = datetime(result.year, result.month, result.day)
+    if isinstance(result, datetime):
+        return int(result.replace(tzinfo=timezone.utc).timestamp() * 1000), "ms since epoch", None
+    if isinstance(result, u.Quantity):
+        return int(float(result.value) * PRECISION), f'{result.unit} * {PRECISION}', None
+    elif isinstance(result, (float, np.floating)) and quantity_unit is not None:
+        return int(float(result) * PRECISION), f'{quantity_unit} * {PRECISION}', None
+    elif isinstance(result, (int, float, np.integer, np.floating)) and not isinstance(result, bool):
+        if not unit:
+            return int(float(result) * PRECISION), f'* {PRECISION}', None
+        else:
+            return int(float(result) * PRECISION), f'{unit} * {PRECISION}', None
+    else:
+        logger.info('incompatible result type %s', type(result).__name__)
+        return 0, no_unit, "Incompatible return type"
@@ -0,0 +1,188 @@
+import os
+import re
+import json
+import pprint
+import hashlib
+import logging
+from urllib.parse import urlparse
+
+SWAGGER_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), 'swaggers')
+ROUTES_MODULE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'api_routes.py')
+
+FLOAT_PARAMS = ['lat', 'lon', 'radius', 'max_lat', 'max_lon', 'min_lat', 'min_lon']
+_ENDPOINT = object()
+
+logger = logging.getLogger(__name__)
+
+
+def hash_swaggers(swagger_dir=SWAGGER_DIR):
+    ''' Computes a digest over the names and contents of all swagger files
+
+        Parameters: swagger_dir (str), directory containing the swagger files
+        Returns: str, hex sha256 digest
+    '''
+    m = hashlib.sha256()
+    for file in sorted(os.listdir(swagger_dir)):
+        m.update(file.encode('utf-8'))
+        with open(os.path.join(swagger_dir, file), 'rb') as swagger:
+            m.update(swagger.read())
+    return m.hexdigest()
+
+
+def parse_swaggers(swagger_dir=SWAGGER_DIR):
+    ''' Parses the swagger files into a route table mapping each API base path
+        to its endpoints and their primary (URL path) parameters, secondary (query)
+        parameters, and parameter types
+
+        Parameters: swagger_dir (str), directory containing the swagger files
+        Returns: dict, route table keyed on API base path
+    '''
+    api_versions = {}
+    for file in sorted(os.listdir(swagger_dir)):
+        file_path = os.path.join(swagger_dir, file)
+        with open(file_path, 'r') as swagger:
+            api = json.load(swagger)
+        # parse swagger and get parameters and url endpoints
+        api_map = {'basePath': api['basePath'] + '/', 'paths': {}}
+        for path in api['paths'].keys():
+            if 'user' in path or 'valid' in path or 'biomass' in path:
+                continue
+            key = path[:path.find('/{')][1:] if '/{' in path else path[1:]
+            key = key.rstrip('/')
+            types = {}
+            primary = re.findall(r'(?<=\{).+?(?=\})', path) if '/{' in path else []
+            secondary = []
+            for param in api['paths'][path].get('parameters', []):
+                types[param['name']] = param['type']
+            for param in api['paths'][path].get('get', {}).get('parameters', []):
+                if param['name'] != 'Authorization':
+                    secondary.append(param['name'])
+                    types[param['name']] = param['type']
+            api_map['paths'][key] = {'name': path, 'primary': primary, 'secondary': secondary, 'types': types}
+        api_versions[api['basePath']] = api_map
+    return api_versions
+
+
+def write_routes_module(swagger_dir=SWAGGER_DIR, path=ROUTES_MODULE):
+    ''' Compiles the swagger files into a Python module holding the route
+        table and the digest of the swaggers it was built from
+
+        Parameters: swagger_dir (str), directory containing the swagger files
+                    path (str), destination of the generated module
+    '''
+    routes = parse_swaggers(swagger_dir)
+    with open(path, 'w') as module:
+        module.write('# Generated by build_routes.py from the swagger files, do not edit\n\n')
+        module.write(f'SWAGGER_HASH = {hash_swaggers(swagger_dir)!r}\n\n')
+        module.write(f'API_ROUTES = {pprint.pformat(routes, indent=1, width=120, sort_dicts=False)}\n')
+
+
+def load_api_routes(swagger_dir=SWAGGER_DIR):
+    ''' Returns the precompiled route table if it was built from the current
+        swagger files, otherwise parses the swagger files
+
+        Parameters: swagger_dir (str), directory containing the swagger files
+        Returns: dict, route table keyed on API base path
+    '''
+    try:
+        from program_catalog.tools.api_routes import SWAGGER_HASH, API_ROUTES
+    except ImportError:
+        logger.info('precompiled routes not found, parsing swaggers')
+        return parse_swaggers(swagger_dir)
+    if SWAGGER_HASH != hash_swaggers(swagger_dir):
+        logger.info('precompiled routes are out of date, parsing swaggers')
+        return parse_swaggers(swagger_dir)
+    return API_ROUTES
+
+
+class Route:
+    ''' A request URL resolved against the route table: the API version, the
+        endpoint and its wrapper function, the typed primary parameters and
+        the raw query string
+    '''
+
+    def __init__(self, base_path, key, endpoint, args, query):
+        ''' Parameters: base_path (str), API version base path, e.g. /apiv3
+                        key (str), endpoint key, e.g. grid-history
+                        endpoint (dict), route table entry of the endpoint
+                        args (dict), primary parameters parsed from the URL path
+                        query (str), query string of the URL
+        '''
+        self.base_path = base_path
+        self.key = key
+        self.endpoint = endpoint
+        self.args = args
+        self.query = query
+
+    @property
+    def function(self):
+        return self.endpoint['function']
+
+    def __repr__(self):
+        return f'Route({self.base_path}/{self.key}, {self.args})'
+
+
+class Router:
+    ''' Resolves request URLs with a trie of URL path segments built once from
+        the route table, so a request is matched to its API version, endpoint
+        (including endpoints spanning several segments such as power-history/ne_iso/load)
+        and typed primary parameters in a single pass over its path
+    '''
+
+    def __init__(self, api_maps):
+        ''' Parameters: api_maps (dict), route table keyed on API base path whose
+            endpoints carry their wrapper functions
+        '''
+        self._root = {}
+        for base_path, api_map in api_maps.items():
+            version = self._root.setdefault(base_path.strip('/'), {})
+            for key, endpoint in api_map['paths'].items():
+                node = version
+                for segment in key.split('/'):
+                    node = node.setdefault(segment, {})
+                node[_ENDPOINT] = (base_path, key, endpoint)
+
+    def resolve(self, url):
+        ''' Matches a request URL to the longest endpoint in the trie and parses
+            the remaining path segments as the endpoint's primary parameters
+
+            Dataset endpoints take the segment after the endpoint as the dataset
+            and split the following segments on underscores (e.g. {lat}_{lon}),
+            other endpoints split all remaining segments on underscores
+
+            Parameters: url (str), request URL excluding the root domain
+            Returns: Route, the resolved route or None if no endpoint matches
+                     str, error message if the URL could not be resolved
+        '''
+        parsed = urlparse(url)
+        segments = [segment for segment in parsed.path.split('/') if segment != '']
+        if len(segments) == 0 or segments[0] not in self._root:
+            return None, 'Improperly formatted request URL, API version not found'
+        node = self._root[segments[0]]
+        match = None
+        for i, segment in enumerate(segments[1:], start=2):
+            node = node.get(segment, None)
+            if node is None:
+                break
+            if _ENDPOINT in node:
+                match = (node[_ENDPOINT], i)
+        if match is None:
+            return None, 'Improperly formatted request URL, endpoint not found'
+        (base_path, key, endpoint), matched = match
+
+        remaining = segments[matched:]
+        primaries = endpoint['primary']
+        if 'dataset' in primaries and len(remaining) > 0:
+            params = [remaining[0]]
+            for segment in remaining[1:]:
+                params += segment.split('_')
+        else:
+            params = [param for segment in remaining for param in segment.split('_')]
+        if len(params) != len(primaries):
+            return None, 'Improperly formatted request URL, incompatible parameters'
+
+        # cast floats and set primary args
+        args = {}
+        for param, value in zip(primaries, params):
+            args[param] = float(value) if param in FLOAT_PARAMS else value
+        return Route(base_path, key, endpoint, args, parsed.query), None
@@ -0,0 +1,106 @@
+from operator import attrgetter
+
+import numpy as np
+import pandas as pd
+import astropy.units as u
+
+# key in Series.attrs holding the unit of a float history
+UNIT_ATTR = 'unit'
+
+
+def to_float_series(data):
+    ''' Converts client output to a float64 Series with the unit carried once
+        in attrs instead of on every element. Quantities are read in the unit
+        of the first Quantity and missing values become NaN. Histories holding
+        anything else, e.g. GUSTDIR strings, are returned as an object Series
+
+        Parameters: data (dict or Pandas Series), values keyed on time
+        Returns: Pandas Series, float64 history with attrs['unit'] set to the
+                 unit string of its Quantities, or None if it held plain numbers
+    '''
+    series = data if isinstance(data, pd.Series) else pd.Series(data)
+    if series.dtype != object:
+        return series
+    converted = to_float_values(series.to_numpy())
+    if converted is None:
+        return series
+    values, unit = converted
+    return set_unit(pd.Series(values, index=series.index, name=series.name), unit)
+
+
+def to_float_values(values):
+    ''' Reads a sequence of Quantities or numbers into a float64 array in
+        the unit of the first Quantity, with missing values as NaN
+
+        Parameters: values (iterable), values of a history
+        Returns: tuple, (float64 array, unit string or None) or None if a
+                 value is neither a Quantity nor a number
+    '''
+    values = values if isinstance(values, (list, np.ndarray)) else list(values)
+    value_types = set(map(type, values))
+    if value_types == {u.Quantity} and len(set(map(id, map(attrgetter('unit'), values)))) == 1:
+        # one unit throughout, read each value without going through astropy
+        result = np.fromiter(map(np.ndarray.item, values), dtype=np.float64, count=len(values))
+        return result, values[0].unit.to_string()
+    if value_types == {float}:
+        return np.fromiter(values, dtype=np.float64, count=len(values)), None
+    result = np.empty(len(values), dtype=np.float64)
+    unit = None
+    for i, value in enumerate(values):
+        if isinstance(value, u.Quantity):
+            if unit is None:
+                unit = value.unit
+            result[i] = value.value if value.unit is unit else value.to_value(unit)
+        elif value is None or (isinstance(value, float) and np.isnan(value)):
+            result[i] = np.nan
+        elif isinstance(value, (int, float, np.integer, np.floating)) and not isinstance(value, bool):
+            result[i] = value
+        else:
+            return None
+    return result, None if unit is None else unit.to_string()
+
+
+def series_unit(data):
+    ''' Returns: str, unit of a float history set by to_float_series or None '''
+    if not isinstance(data, (pd.Series, pd.DataFrame)):
+        return None
+    return data.attrs.get(UNIT_ATTR, None)
+
+
+def set_unit(data, unit):
+    ''' Records the unit of a float history in place
+
+        Returns: Pandas Series, the same series
+    '''
+    data.attrs[UNIT_ATTR] = unit
+    return data
+
+
+def parse_unit(unit):
+    ''' Returns: astropy Unit, parsed with the imperial units enabled '''
+    with u.imperial.enable():
+        return u.Unit(unit)
+
+
+def convert_series(data, target, equivalencies=None):
+    ''' Converts a float history to another unit in one vectorized operation
+
+        Parameters: data (Pandas Series), float64 history with a unit in attrs
+                    target (str or astropy Unit), unit to convert to
+                    equivalencies (list), astropy equivalencies, e.g. u.temperature()
+        Returns: Pandas Series, converted float64 history with the target unit
+        Raises: ValueError, if the history has no unit
+    '''
+    unit = series_unit(data)
+    if unit is None:
+        raise ValueError('history has no unit to convert from')
+    source, target = parse_unit(unit), parse_unit(target)
+    values = source.to(target, data.to_numpy(dtype=np.float64), equivalencies=equivalencies or [])
+    return set_unit(pd.Series(values, index=data.index, name=data.name), target.to_string())
+
+
+def to_value(value):
+    ''' Returns: float, the number of a Quantity or plain number '''
+    if isinstance(value, u.Quantity):
+        return float(value.value)
+    return float(value)
@@ -0,0 +1,167 @@
+import os
+import re
+
+import numpy as np
+import pandas as pd
+
+# distinct windows over one history from which building a WindowIndex pays off
+WINDOW_INDEX_MIN_WINDOWS = int(os.getenv("WINDOW_INDEX_MIN_WINDOWS", 16))
+# answer window sums from prefix sums, which can differ from Series.sum in the last bits
+WINDOW_INDEX_SUMS = os.getenv("WINDOW_INDEX_SUMS", "false").lower() == "true"
+# values per block of the min/max sparse table
+WINDOW_INDEX_BLOCK = int(os.getenv("WINDOW_INDEX_BLOCK", 32))
+
+# date strings whose bounds are computed directly, with the period each one covers
+_DATE_LABELS = [
+    (re.compile(r'^\d{4}-\d{2}-\d{2}$'), pd.DateOffset(days=1)),
+    (re.compile(r'^\d{4}-\d{2}$'), pd.DateOffset(months=1)),
+    (re.compile(r'^\d{4}$'), pd.DateOffset(years=1)),
+]
+
+
+class WindowIndex:
+    ''' Precomputed aggregates of a float history answering window queries
+        without slicing it. Windows are located with two binary searches on the
+        DatetimeIndex, with the same (partial date string) semantics as
+        Series.loc[start:end] but without its per call overhead, after which
+
+            sums, counts and means come from cumulative sums in O(1)
+            maxima and minima come from a sparse table over blocks of
+            WINDOW_INDEX_BLOCK values, scanning at most two partial blocks
+
+        Missing values are skipped the way the Series methods skip them. Maxima
+        and minima are exact; sums are differences of cumulative sums and so
+        may differ from Series.sum by floating point rounding
+    '''
+
+    def __init__(self, series, block_size=WINDOW_INDEX_BLOCK):
+        ''' Parameters: series (Pandas Series), float64 history on a sorted DatetimeIndex
+                        block_size (int), values per sparse table block
+        '''
+        if not self.supports(series):
+            raise ValueError('WindowIndex needs a float64 series on a sorted DatetimeIndex')
+        self._index = series.index
+        self._bounds = {}
+        self._values = series.to_numpy()
+        present = ~np.isnan(self._values)
+        self._sums = np.concatenate(([0.0], np.cumsum(np.where(present, self._values, 0.0))))
+        self._counts = np.concatenate(([0], np.cumsum(present, dtype=np.int64)))
+        self._block_size = max(1, int(block_size))
+        self._max_table = self._sparse_table(np.fmax)
+        self._min_table = self._sparse_table(np.fmin)
+
+    @staticmethod
+    def supports(series):
+        ''' Returns: bool, whether a WindowIndex can be built over the series '''
+        return (isinstance(series, pd.Series) and series.dtype == np.float64
+                and isinstance(series.index, pd.DatetimeIndex) and series.index.is_monotonic_increasing)
+
+    def positions(self, start, end):
+        ''' Returns: tuple, (first, last + 1) positions of the values in Series.loc[start:end] '''
+        first, stop = self._bound(start, 'left'), self._bound(end, 'right')
+        return first, max(first, stop)
+
+    def sum(self, start, end):
+        ''' Returns: numpy float64, sum of the values from start to end, 0 if there are none '''
+        first, stop = self.positions(start, end)
+        return np.float64(self._sums[stop] - self._sums[first])
+
+    def count(self, start, end):
+        ''' Returns: int, number of values present from start to end '''
+        first, stop = self.positions(start, end)
+        return int(self._counts[stop] - self._counts[first])
+
+    def mean(self, start, end):
+        ''' Returns: numpy float64, mean of the values from start to end, NaN if there are none '''
+        first, stop = self.positions(start, end)
+        count = self._counts[stop] - self._counts[first]
+        if count == 0:
+            return np.float64(np.nan)
+        return np.float64((self._sums[stop] - self._sums[first]) / count)
+
+    def max(self, start, end):
+        ''' Returns: numpy float64, maximum of the values from start to end, NaN if there are none '''
+        return self._range(*self.positions(start, end), np.fmax, self._max_table)
+
+    def min(self, start, end):
+        ''' Returns: numpy float64, minimum of the values from start to end, NaN if there are none '''
+        return self._range(*self.positions(start, end), np.fmin, self._min_table)
+
+    def max_at(self, labels):
+        ''' Maximum of the values at the given times, as Series.loc[labels].max()
+
+            Parameters: labels (list), times of the values
+            Returns: numpy float64, the maximum or None if a time is not in the history
+        '''
+        try:
+            positions = self._index.get_indexer(pd.DatetimeIndex(pd.to_datetime(labels)))
+        except (TypeError, ValueError):
+            return None
+        if len(positions) == 0:
+            return np.float64(np.nan)
+        if (positions < 0).any():
+            return None
+        first, last = positions.min(), positions.max()
+        if last - first + 1 == len(positions) and len(np.unique(positions)) == len(positions):
+            return self._range(first, last + 1, np.fmax, self._max_table)
+        return np.float64(np.fmax.reduce(self._values[positions]))
+
+    def _bound(self, label, side):
+        ''' Position of a slice bound, as DatetimeIndex.get_slice_bound. Day, month
+            and year strings and timestamps are searched for directly, anything
+            else is left to Pandas
+        '''
+        if label is None:
+            return 0 if side == 'left' else len(self._values)
+        key = (label, side)
+        if key not in self._bounds:
+            bound = self._label_bound(label, side)
+            self._bounds[key] = self._index.get_slice_bound(label, side) if bound is None else bound
+        return self._bounds[key]
+
+    def _label_bound(self, label, side):
+        if isinstance(label, str):
+            period = next((period for pattern, period in _DATE_LABELS if pattern.match(label)), None)
+            if period is None:
+                return None
+            # a string's period ends just before the next one starts
+            bound = pd.Timestamp(label)
+            if side == 'right':
+                bound, side = bound + period, 'left'
+        elif isinstance(label, pd.Timestamp):
+            bound = label
+        else:
+            return None
+        if (bound.tzinfo is None) != (self._index.tz is None):
+            if bound.tzinfo is not None:
+                return None
+            bound = bound.tz_localize(self._index.tz)
+        return int(self._index.searchsorted(bound, side=side))
+
+    def _sparse_table(self, combine):
+        ''' Returns: list, level k holding the combination of 2**k consecutive blocks from each block '''
+        starts = np.arange(0, len(self._values), self._block_size)
+        if len(starts) == 0:
+            return []
+        table = [combine.reduceat(self._values, starts)]
+        width = 1
+        while width * 2 <= len(table[0]):
+            previous = table[-1]
+            table.append(combine(previous[:-width], previous[width:]))
+            width *= 2
+        return table
+
+    def _range(self, first, stop, combine, table):
+        if stop <= first:
+            return np.float64(np.nan)
+        size = self._block_size
+        first_block, stop_block = -(-first // size), stop // size
+        if stop_block - first_block < 1:
+            return np.float64(combine.reduce(self._values[first:stop]))
+        level = int(stop_block - first_block).bit_length() - 1
+        result = combine(table[level][first_block], table[level][stop_block - (1 << level)])
+        if first < first_block * size:
+            result = combine(result, combine.reduce(self._values[first:first_block * size]))
+        if stop_block * size < stop:
+            result = combine(result, combine.reduce(self._values[stop_block * size:stop]))
+        return np.float64(result)
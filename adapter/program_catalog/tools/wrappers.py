@@ -1,20 +1,28 @@
-import os
 import io
-import json
-import re
 import ast
-import astropy.units as u
+import numpy as np
 import pandas as pd
-from datetime import timezone, datetime, date, time
-from urllib.parse import urlparse
+import astropy.units as u
+from datetime import datetime
 
 # from dweather_client import http_queries
 from dweather_client import client as v3_client
 from dclimate_zarr_client import client as v4_client
 
-import time
+from program_catalog.tools.cache import cached_history, copy_result, normalize_args, purge_dataset, purge_head
+from program_catalog.tools.coalesce import SingleFlight
+from program_catalog.tools.heads import DATASET_HEADS
+from program_catalog.tools.history import normalize_history
+from program_catalog.tools.metrics import timed
+from program_catalog.tools.operations import PRECISION, compile_plan, to_chain_value
+from program_catalog.tools.routes import SWAGGER_DIR, FLOAT_PARAMS, Router, load_api_routes
+from program_catalog.tools.units import convert_series, parse_unit, series_unit, set_unit, to_float_series
+
+import logging
+
+REQUEST_FLIGHT = SingleFlight()
 
-PRECISION = 1e18
+logger = logging.getLogger(__name__)
 
 '''
 UNSUPPORTED API ENDPOINTS:
@@ -34,10 +42,50 @@ yield
 '''
 
 
+def get_dataset_head(dataset):
+    ''' Returns the current IPFS head of a v3 dataset from DATASET_HEADS, or
+        None if it is not known
+    '''
+    return DATASET_HEADS.head(dataset)
+
+
+def get_dataset_end(dataset):
+    ''' Returns the last date covered by the current head of a dataset according
+        to its metadata in DATASET_HEADS, or None if it is not known yet
+    '''
+    return DATASET_HEADS.end(dataset)
+
+
+def get_v4_dataset_head(dataset):
+    ''' Returns the version of a v4 dataset's latest publication from
+        DATASET_HEADS, or None if it is not known yet
+    '''
+    return DATASET_HEADS.v4_version(dataset)[0]
+
+
+def purge_superseded_head(dataset, old_head, new_head):
+    ''' Frees cached histories and results of a dataset's previous head '''
+    removed = purge_head(dataset, old_head)
+    logger.info('purged %s cached entries of %s head %s', sum(removed.values()), dataset, old_head)
+
+
+def purge_broadcast_dataset(dataset):
+    ''' Frees the cached histories and results of a dataset another worker
+        purged, which also purged the shared disk cache
+    '''
+    removed = purge_dataset(dataset, disk=False)
+    logger.info('purged %s cached entries of %s', sum(removed.values()), dataset)
+
+
+DATASET_HEADS.subscribe(purge_superseded_head)
+DATASET_HEADS.subscribe_purge(purge_broadcast_dataset)
+
+
 # def convert_quantity(quant):
 #     return None if quant is None else str(quant)
 
 
+@cached_history('australia-station-history', head_resolver=get_dataset_head)
 def get_australia_station_history_wrapper(args):
     ''' Returns dict with pd.Series "data" and string "unit"
 
@@ -48,10 +96,7 @@ def get_australia_station_history_wrapper(args):
     default_args = {"desired_units": None, "ipfs_timeout": None}
     default_args.update(args)
     data, unit = v3_client.get_australia_station_history(**default_args)
-    data = pd.Series(data)
-    if data.empty:
-        raise ValueError('No data returned for request')
-    data = data.set_axis(pd.to_datetime(data.index)).sort_index()
+    data = normalize_history(data)
     return {"data": data, "unit": unit}
 
 
@@ -67,6 +112,7 @@ def get_australia_station_history_wrapper(args):
 #     return data
 
 
+@cached_history('cme-futures', dataset='cme_futures-daily', head_resolver=get_dataset_head)
 def get_cme_station_futures_wrapper(args):
     ''' Returns dict with pd.Series "data" 
     
@@ -76,17 +122,15 @@ def get_cme_station_futures_wrapper(args):
     default_args = {"dataset": "cme_futures-daily", "desired_units": None, "ipfs_timeout": None}
     default_args.update(args)
     if default_args.get("forecast_date", None) is None:
-        most_recent_metadata = v3_client.get_metadata(v3_client.get_heads()["cme_futures-daily"])
-        forecast_date = datetime.datetime.strptime(most_recent_metadata["date range"][0], '%Y-%m-%d').date()
+        most_recent_metadata = DATASET_HEADS.require_metadata("cme_futures-daily")
+        forecast_date = datetime.strptime(most_recent_metadata["date range"][0], '%Y-%m-%d').date()
         default_args["forecast_date"] = forecast_date
     data = v3_client.get_station_forecast_history(**default_args)
-    data = pd.Series(data)
-    if data.empty:
-        raise ValueError('No data returned for request')
-    data = data.set_axis(pd.to_datetime(data.index)).sort_index()
+    data = normalize_history(data)
     return {"data": data}
 
  
+@cached_history('cme-history', head_resolver=get_dataset_head)
 def get_cme_station_history_wrapper(args):
     ''' Returns dict with pd.Series "data" and string "unit" 
 
@@ -98,13 +142,11 @@ def get_cme_station_history_wrapper(args):
     default_args.update(args)
     data, unit = v3_client.get_cme_station_history(**default_args)
     # data = {k.__str__(): convert_quantity(v) for (k, v) in data.items()}
-    data = pd.Series(data)
-    if data.empty:
-        raise ValueError('No data returned for request')
-    data = data.set_axis(pd.to_datetime(data.index)).sort_index()
+    data = normalize_history(data)
     return {"data": data, "unit": unit}
 
 
+@cached_history('cwv-station-history', head_resolver=get_dataset_head)
 def get_cwv_station_history_wrapper(args):
     ''' Returns dict with pd.Series "data" 
     
@@ -115,10 +157,7 @@ def get_cwv_station_history_wrapper(args):
     default_args.update(args)
     # CWV is a proprietary unscaled unit from the UK National Grid
     data = v3_client.get_cwv_station_history(**default_args)
-    data = pd.Series(data)
-    if data.empty:
-        raise ValueError('No data returned for request')
-    data = data.set_axis(pd.to_datetime(data.index)).sort_index()
+    data = normalize_history(data)
     return {"data": data}
 
 
@@ -134,6 +173,7 @@ def get_cwv_station_history_wrapper(args):
 #     return {"data": data}
     
 
+@cached_history('dutch-station-history', dataset='dutch_stations-daily', head_resolver=get_dataset_head)
 def get_dutch_station_history_wrapper(args):
     ''' Returns dict with pd.Series "data" and string "unit" 
     
@@ -146,13 +186,11 @@ def get_dutch_station_history_wrapper(args):
     # print(f'default_args: {default_args}')
     data, unit = v3_client.get_european_station_history(**default_args)
     # data = {k.__str__(): convert_quantity(v) for (k, v) in data.items()}
-    data = pd.Series(data)
-    if data.empty:
-        raise ValueError('No data returned for request')
-    data = data.set_axis(pd.to_datetime(data.index)).sort_index()
+    data = normalize_history(data)
     return {"data": data, "unit": unit}
 
 
+@cached_history('eaufrance', head_resolver=get_dataset_head)
 def get_eaufrance_history_wrapper(args):
     ''' Returns dict with pd.Series "data" and string "unit" 
     
@@ -164,13 +202,11 @@ def get_eaufrance_history_wrapper(args):
     default_args.update(args)
     data, unit = v3_client.get_eaufrance_history(**default_args)
     # data = {k.__str__(): convert_quantity(v) for (k, v) in data.items()}
-    data = pd.Series(data)
-    if data.empty:
-        raise ValueError('No data returned for request')
-    data = data.set_axis(pd.to_datetime(data.index)).sort_index()
+    data = normalize_history(data)
     return {"data": data, "unit": unit}
 
 
+@cached_history('forecasts', head_resolver=get_dataset_head)
 def get_forecasts_wrapper(args):
     ''' Returns dict with pd.Series "data" and string "unit" 
     
@@ -181,13 +217,14 @@ def get_forecasts_wrapper(args):
     default_args = {"also_return_metadata": False, "also_return_snapped_coordinates": True, "use_imperial_units": True, "desired_units": None, "ipfs_timeout": None, "convert_to_local_time": True}
     default_args.update(args)
     data, unit = v3_client.get_forecast(**default_args)
-    data = pd.Series(data)
+    data = to_float_series(data)
     if data.empty:
         raise ValueError('No data returned for request')
     # data = data.set_axis(pd.to_datetime(data.index, utc=True)).sort_index()
     return {"data": data, "unit": unit}
 
 
+@cached_history('german-station-history', dataset='dwd_stations-daily', head_resolver=get_dataset_head)
 def get_german_station_history_wrapper(args):
     ''' Returns dict with pd.Series "data" and string "unit" 
     
@@ -199,13 +236,11 @@ def get_german_station_history_wrapper(args):
     default_args.update(args)
     data, unit = v3_client.get_european_station_history(**default_args)
     # data = {k.__str__(): convert_quantity(v) for (k, v) in data.items()}
-    data = pd.Series(data)
-    if data.empty:
-        raise ValueError('No data returned for request')
-    data = data.set_axis(pd.to_datetime(data.index)).sort_index()
+    data = normalize_history(data)
     return {"data": data, "unit": unit}
 
 
+@cached_history('german-station-hourly-history', dataset='dwd_hourly-hourly', head_resolver=get_dataset_head)
 def get_german_hourly_station_history_wrapper(args):
     ''' Returns dict with pd.Series "data" and string "unit" 
     
@@ -217,13 +252,11 @@ def get_german_hourly_station_history_wrapper(args):
     default_args.update(args)
     data, unit = v3_client.get_hourly_station_history(**default_args)
     # data = {k.__str__(): convert_quantity(v) for (k, v) in data.items()}
-    data = pd.Series(data)
-    if data.empty:
-        raise ValueError('No data returned for request')
-    data = data.set_axis(pd.to_datetime(data.index)).sort_index()
+    data = normalize_history(data)
     return {"data": data, "unit": unit}
 
 
+@cached_history('ghcn-history', dataset='ghcnd', head_resolver=get_dataset_head)
 def get_station_history_wrapper(args):
     ''' Returns dict with pd.Series "data" and string "unit" 
     
@@ -234,13 +267,11 @@ def get_station_history_wrapper(args):
     default_args = {"desired_units": None, "ipfs_timeout": None}
     default_args.update(args)
     data, unit = v3_client.get_station_history(**default_args)
-    data = pd.Series(data)
-    if data.empty:
-        raise ValueError('No data returned for request')
-    data = data.set_axis(pd.to_datetime(data.index)).sort_index()
+    data = normalize_history(data)
     return {"data": data, "unit": unit}
 
 
+@cached_history('ghisd-station-history', dataset='ghisd-sub_hourly', head_resolver=get_dataset_head)
 def get_ghisd_station_history_wrapper(args):
     ''' Returns dict with pd.Series "data" and string "unit" 
     
@@ -252,13 +283,11 @@ def get_ghisd_station_history_wrapper(args):
     default_args.update(args)
     data, unit = v3_client.get_hourly_station_history(**default_args)
     # data = {k.__str__(): convert_quantity(v) for (k, v) in data.items()}
-    data = pd.Series(data)
-    if data.empty:
-        raise ValueError('No data returned for request')
-    data = data.set_axis(pd.to_datetime(data.index)).sort_index()
+    data = normalize_history(data)
     return {"data": data, "unit": unit}
 
 
+@cached_history('grid-history', head_resolver=get_dataset_head)
 def get_gridcell_history_wrapper(args):
     ''' Returns dict with pd.Series "data" and string "unit"
      
@@ -269,13 +298,11 @@ def get_gridcell_history_wrapper(args):
     default_args = {"also_return_metadata": False, "also_return_snapped_coordinates": False, "use_imperial_units": True, "desired_units": None, "ipfs_timeout": None, "as_of": None, "convert_to_local_time": True}
     default_args.update(args)
     data, unit = v3_client.get_gridcell_history(**default_args)
-    data = pd.Series(data)
-    if data.empty:
-        raise ValueError('No data returned for request')
-    data = data.set_axis(pd.to_datetime(data.index, utc=True)).sort_index()
+    data = normalize_history(data, utc=True)
     return {"data": data, "unit": unit}
 
 
+@cached_history('inmet', dataset='inmet_brazil-hourly', head_resolver=get_dataset_head)
 def get_inmet_station_history_wrapper(args):
     ''' Returns dict with pd.Series "data" and string "unit" 
     
@@ -287,10 +314,7 @@ def get_inmet_station_history_wrapper(args):
     default_args.update(args)
     data, unit = v3_client.get_csv_station_history(**default_args)
     # data = {k.__str__(): convert_quantity(v) for (k, v) in data.items()}
-    data = pd.Series(data)
-    if data.empty:
-        raise ValueError('No data returned for request')
-    data = data.set_axis(pd.to_datetime(data.index)).sort_index()
+    data = normalize_history(data)
     return {"data": data, "unit": unit}
 
 
@@ -306,6 +330,7 @@ def get_inmet_station_history_wrapper(args):
 #     return data
 
 
+@cached_history('japan-station-history', head_resolver=get_dataset_head)
 def get_japan_station_history_wrapper(args):
     ''' Returns dict with pd.Series "data" and string "unit" 
     
@@ -316,10 +341,7 @@ def get_japan_station_history_wrapper(args):
     default_args = {"ipfs_timeout": None}
     default_args.update(args)
     data, unit = v3_client.get_japan_station_history(**default_args)
-    data = pd.Series(data)
-    if data.empty:
-        raise ValueError('No data returned for request')
-    data = data.set_axis(pd.to_datetime(data.index)).sort_index()
+    data = normalize_history(data)
     return {"data": data, "unit": unit}
 
 
@@ -349,6 +371,7 @@ def get_japan_station_history_wrapper(args):
 #     return metadata
 
 
+@cached_history('power-history/ne_iso/load', dataset='ne_iso-hourly', head_resolver=get_dataset_head)
 def get_power_history_wrapper(args):
     ''' Returns dict with pd.Series "data" and string "unit" 
     
@@ -360,13 +383,11 @@ def get_power_history_wrapper(args):
     default_args.update(args)
     data, unit = v3_client.get_csv_station_history(**default_args)
     # data = {k.__str__(): convert_quantity(v) for (k, v) in data.items()}
-    data = pd.Series(data)
-    if data.empty:
-        raise ValueError('No data returned for request')
-    data = data.set_axis(pd.to_datetime(data.index)).sort_index()
+    data = normalize_history(data)
     return {"data": data, "unit": unit}
 
 
+@cached_history('storms', head_resolver=get_dataset_head)
 def get_tropical_storms_wrapper(args):
     ''' Returns dict with pd.DataFrame "data"
     
@@ -379,6 +400,7 @@ def get_tropical_storms_wrapper(args):
     return {"data": data}
 
 
+@cached_history('teleconnections', head_resolver=get_dataset_head)
 def get_teleconnections_history_wrapper(args):
     ''' Returns dict with pd.Series "data"
     
@@ -388,10 +410,7 @@ def get_teleconnections_history_wrapper(args):
     default_args = {"desired_units": None, "ipfs_timeout": None}
     default_args.update(args)
     data = v3_client.get_teleconnections_history(**default_args)
-    data = pd.Series(data)
-    if data.empty:
-        raise ValueError('No data returned for request')
-    data = data.set_axis(pd.to_datetime(data.index)).sort_index()
+    data = normalize_history(data)
     return {"data": data}
 
 
@@ -411,6 +430,7 @@ def get_teleconnections_history_wrapper(args):
 #     return data
 
 
+@cached_history('uk-national-grid/sap', head_resolver=get_dataset_head)
 def get_sap_station_history_wrapper(args):
     ''' Returns dict with pd.Series "data"
     
@@ -420,10 +440,7 @@ def get_sap_station_history_wrapper(args):
     default_args = {"desired_units": None, "ipfs_timeout": None}
     default_args.update(args)
     data = v3_client.get_sap_station_history(**default_args)
-    data = pd.Series(data)
-    if data.empty:
-        raise ValueError('No data returned for request')
-    data = data.set_axis(pd.to_datetime(data.index)).sort_index()
+    data = normalize_history(data)
     return {"data": data}
 
 
@@ -453,19 +470,107 @@ def geo_temporal_query_wrapper(args):
     '''
     default_args = {"as_of": None, "point_limit": None}
     default_args.update(args)
-    start = time.time()
     try:
         result = v4_client.geo_temporal_query(**default_args)
-        print(f'geo_temporal_query took {time.time() - start} seconds')
         if type(result) is dict:
             result["data"] = int(float(result["data"][0]) * PRECISION)
             result["unit"] = f'{result.get("unit of measurement", None)} * {PRECISION}'
         return result
     except Exception as e:
-        print(f'error caught in geo_temporal_query_wrapper: {e}')
+        logger.warning('error caught in geo_temporal_query_wrapper: %s', e)
         raise ValueError('Request errored')
 
 
+def multi_point_spatial_args(args):
+    ''' Returns: dict, geo_temporal_query arguments averaging the multi-point wrapper's locations '''
+    import geopandas as gpd
+    lats, lons = zip(*args['locations'])
+    return {
+        "multiple_points_kwargs": {"points_mask": gpd.points_from_xy(lons, lats), "epsg_crs": args.get('epsg_crs', 4326)},
+        "spatial_agg_kwargs": {"agg_method": "mean"},
+    }
+
+
+def get_multi_point_history_tail(args, start):
+    ''' Returns dict with pd.Series "data" and string "unit" holding the
+        multi-point wrapper's history from start on, read with the same v4 query
+        as the wrapper, to extend its cached history for a new dataset version
+
+        Parameters: args (dict), multi-point-history wrapper arguments
+                    start (Pandas Timestamp), first time to read
+    '''
+    time_range = args.get('time_range', None)
+    end = datetime.fromisoformat(str(time_range[1])) if time_range is not None else DATASET_HEADS.v4_version(args['dataset'])[1]
+    if end is None:
+        raise ValueError(f'end of {args["dataset"]} is not known')
+    start = start.tz_convert('UTC').tz_localize(None) if start.tzinfo is not None else start
+    return query_v4_history(args['dataset'], multi_point_spatial_args(args), [start.to_pydatetime(), end],
+                            use_imperial_units=args.get('use_imperial_units', True))
+
+
+@cached_history('multi-point-history', head_resolver=get_v4_dataset_head, tail_fetcher=get_multi_point_history_tail)
+def get_multi_point_history_wrapper(args):
+    ''' Returns dict with pd.Series "data" and string "unit" holding the
+        mean over a set of points, read with a single v4 query
+
+        wrapped function returns:
+            dict with the spatially averaged values, their times and unit
+    '''
+    time_range = args.get('time_range', None)
+    time_range = None if time_range is None else [datetime.fromisoformat(str(t)) for t in time_range]
+    return query_v4_history(args['dataset'], multi_point_spatial_args(args), time_range, as_of=args.get('as_of', None),
+                            use_imperial_units=args.get('use_imperial_units', True))
+
+
+def query_v4_history(dataset, spatial_args, time_range=None, as_of=None, use_imperial_units=True):
+    ''' Reads a float history with a v4 query
+
+        Parameters: dataset (str), name of the v4 dataset
+                    spatial_args (dict), geo_temporal_query spatial arguments, e.g. point_kwargs
+                    time_range (list), [start, end] datetimes or None for the whole history
+                    as_of (datetime), version of the dataset to read or None for the latest
+                    use_imperial_units (bool), whether to convert to the v3 client's imperial units
+        Returns: dict with pd.Series "data" and string "unit"
+    '''
+    query_args = {
+        "dataset_name": dataset,
+        **spatial_args,
+        "time_range": time_range,
+        "as_of": as_of,
+        "point_limit": None,
+        "output_format": "array",
+    }
+    result = v4_client.geo_temporal_query(**query_args)
+    unit = result.get("unit of measurement", None)
+    values = np.asarray(result["data"], dtype=np.float64).reshape(-1)
+    data = set_unit(pd.Series(values, index=pd.to_datetime(result["times"], utc=True)), unit)
+    if data.empty:
+        raise ValueError('No data returned for request')
+    if use_imperial_units and unit is not None:
+        data, unit = to_imperial(data, unit)
+    return {"data": data.sort_index(), "unit": unit}
+
+
+def to_imperial(data, unit):
+    ''' Converts a float history of lengths or temperatures to the imperial
+        units returned by the v3 client
+
+        Parameters: data (Pandas Series), float values
+                    unit (str), unit of the values
+        Returns: Pandas Series, converted values with their unit in attrs
+                 str, unit of the converted values
+    '''
+    source = parse_unit(unit)
+    if source.physical_type == 'length':
+        target, equivalencies = u.imperial.inch, []
+    elif source.physical_type == 'temperature':
+        target, equivalencies = u.imperial.deg_F, u.temperature()
+    else:
+        return data, unit
+    data = convert_series(set_unit(data, unit), target, equivalencies)
+    return data, series_unit(data)
+
+
 def get_api_mapping(swagger_dir):
     supported_client_wrappers = {
         'australia-station-history': get_australia_station_history_wrapper,
@@ -500,104 +605,64 @@ def get_api_mapping(swagger_dir):
         'geo_temporal_query': geo_temporal_query_wrapper,
     }
     api_versions = {}
-    for file in os.listdir(swagger_dir):
-        file_path = os.path.join(swagger_dir, file)
-        with open(file_path, 'r') as swagger:
-            api = json.load(swagger)
-            swagger.close()
-        # parse swagger and get parameters and url endpoints
-        api_map = {'basePath': api['basePath'] + '/', 'paths': {}}
-        for path in api['paths'].keys():
-            if 'user' in path or 'valid' in path or 'biomass' in path:
-                continue
-            key = path[:path.find('/{')][1:] if '/{' in path else path[1:]
+    for base_path, api_routes in load_api_routes(swagger_dir).items():
+        api_map = {'basePath': api_routes['basePath'], 'paths': {}}
+        for key, endpoint in api_routes['paths'].items():
             if not key in supported_client_wrappers:
                 continue
-            types = {}
-            primary = re.findall(r'(?<=\{).+?(?=\})', path) if '/{' in path else []
-            secondary = []
-            for param in api['paths'][path].get('parameters', []):
-                types[param['name']] = param['type']
-            for param in api['paths'][path].get('get', {}).get('parameters', []):
-                if param['name'] != 'Authorization':
-                    secondary.append(param['name'])
-                    types[param['name']] = param['type']
-            api_map['paths'][key] = {'name': path, 'primary': primary, 'secondary': secondary, 'types': types, 'function': supported_client_wrappers[key]}
-        api_versions[api['basePath']] = api_map
+            api_map['paths'][key] = {**endpoint, 'function': supported_client_wrappers[key]}
+        api_versions[base_path] = api_map
     
     return api_versions
 
 
-def parse_v3_request(data, req, map):
-    # get endpoint
-    request_parsed = list(urlparse(data))
-    print(f'request_parsed: {request_parsed}')
-    request_paths = request_parsed[2].split('/')
-    print(f'request_paths: {request_paths}')
-    key = request_paths[1]
-    if key == 'drought-monitor':
-        print('replacing "-" separator with "_" in drought-monitor parameters')
-        request_paths[1] = request_paths[1].replace('-', '_')
-        print(f'new request_paths: {request_paths}')
-    api_endpoint = map['paths'].get(key, None)
-    if api_endpoint is None:
-        print(f'api_endpoint not found for key {key} and map {list(map["paths"].keys())}')
-        return 'Improperly formatted request URL, endpoint not found', False, None, []
-
-    # get primary parameters
-    args = {}
-    endpoint_primaries = api_endpoint['primary']
-    endpoint_secondaries = api_endpoint['secondary']
-    if 'dataset' in endpoint_primaries:
-        params = [request_paths[2]]
-        try:
-            for req_path in request_paths[3:]:
-                params += req_path.split('_')
-        except IndexError as e:
-            print(f'IndexError caught: {e}')
-            pass
-    else:
-        params = re.split('_|/', request_parsed[2])[2:]
-    if request_parsed[4] == '':
-        queries = []
-    else:
-        queries = request_parsed[4].split('&')
-    # print(f'params: {params}, queries: {queries}')
-    if len(params) != len(endpoint_primaries):
-        print(f'params: {params}, endpoint_primaries: {endpoint_primaries}')
-        return 'Improperly formatted request URL, incompatible parameters', False, None, []
-
-    # cast floats and set primary args
-    floats = ['lat', 'lon', 'radius', 'max_lat', 'max_lon', 'min_lat', 'min_lon']
-    for i in range(len(endpoint_primaries)):
-        param = endpoint_primaries[i]
-        if param in floats:
-            args[param] = float(params[i])
-        else:
-            args[param] = params[i]
+def parse_v3_request(route, req):
+    ''' Builds wrapper arguments for a resolved v3 route from its primary
+        parameters and its type checked query parameters
+
+        Parameters: route (Route), the resolved request route
+                    req (dict), the received request data
+        Returns: dict (or string), wrapper arguments or error message
+                 bool, whether the request is valid
+                 list, request operations
+                 list, request operation parameters
+    '''
+    args = dict(route.args)
+    endpoint_secondaries = route.endpoint['secondary']
+    queries = [] if route.query == '' else route.query.split('&')
 
     # parse secondary parameters
-    for j in range(len(queries)):
-        param = queries[j][:queries[j].find('=')]
-        value = queries[j][queries[j].find('='):][1:]
-        param_type = map['paths'][key]['types'][param]
+    for query in queries:
+        param = query[:query.find('=')]
+        value = query[query.find('='):][1:]
         if not param in endpoint_secondaries:
             return 'Improperly formatted request URL, incompatible parameters', False, None, []
 
         # type check parameters and set secondary args
-        if param in floats:
-            args[param] = float(params[i])
-        if param_type != 'string':
+        param_type = route.endpoint['types'][param]
+        if param in FLOAT_PARAMS:
+            value = float(value)
+        elif param_type != 'string':
             if param_type == 'boolean':
                 value = value.capitalize()
             value = ast.literal_eval(value)
         args[param] = value
-    args['_key'] = key
+    args['_key'] = route.key
+    args['_route'] = route
     return args, True, req.get('request_ops', None), req.get('request_params', [])
 
 
+def parse_v4_request(route, req):
+    ''' Builds geo_temporal_query arguments for a resolved v4 route from the
+        request's spatial and temporal parameters
 
-def parse_v4_request(data, req, map):
+        Parameters: route (Route), the resolved request route
+                    req (dict), the received request data
+        Returns: dict, wrapper arguments
+                 bool, whether the request is valid
+                 None, v4 requests take no operations
+                 list, empty operation parameters
+    '''
     geo_temporal_parameters = {
         'point_params': (["lat", "lon"], [float, float]),
         'circle_params': (["center_lat", "center_lon", "radius"], [float, float, float]),
@@ -609,19 +674,14 @@ def parse_v4_request(data, req, map):
         'temporal_agg_params': (["time_period", "agg_method", "time_unit"], [str, str, int]),
         'rolling_add_params': (["window_size", "agg_method"], [int, str]),
     }
-    request_data = list(urlparse(data))
-    print(f'request_data: {request_data}')
-    request_paths = request_data[2].split('/')
-    print(f'request_paths: {request_paths}')
-    key = request_paths[1]
-    dataset_name = request_paths[2]
-    if request_data[4] != '':
-        output_format = request_data[4].split('=')[1]
+    if route.query != '':
+        output_format = route.query.split('=')[1]
     else:
         output_format = 'array'
     args = {
-        '_key': key,
-        'dataset_name': dataset_name,
+        '_key': route.key,
+        '_route': route,
+        'dataset_name': route.args['dataset'],
         'output_format': output_format
     }
     spatial_parameters = req.get('spatial_parameters', [])
@@ -653,35 +713,107 @@ def parse_v4_request(data, req, map):
     return args, True, None, []
 
 
-API_MAPS = get_api_mapping('./swaggers')
+API_MAPS = get_api_mapping(SWAGGER_DIR)
+ROUTER = Router(API_MAPS)
 
 
 def parse_request(data, req):
+    ''' Resolves the request URL and parses the request into wrapper arguments
+        with the parser of the URL's API version
+
+        Parameters: data (str), request URL excluding the root domain
+                    req (dict), the received request data
+        Returns: dict (or string), wrapper arguments including the resolved
+                    route or error message
+                 bool, whether the request is valid
+                 list, request operations
+                 list, request operation parameters
+    '''
     parsers = {
         "/apiv3": parse_v3_request,
         "/apiv4": parse_v4_request,
     }
-    # check basePath version
-    for base_path in API_MAPS.keys():
-        if data.startswith(base_path):
-            return parsers[base_path](data.removeprefix(base_path), req, API_MAPS[base_path])
+    with timed('parse_request'):
+        route, msg = ROUTER.resolve(data)
+        if route is None:
+            logger.info('could not resolve %s: %s', data, msg)
+            return msg, False, None, []
+        return parsers[route.base_path](route, req)
+
+
+def request_key(route, args):
+    ''' Returns: tuple, hashable key identifying identical requests from their
+        resolved route and wrapper arguments
+    '''
+    return (route.base_path, route.key, normalize_args(args))
+
+
+def get_result_cache_key(args, req):
+    ''' Returns the key under which the final result of a request may be cached,
+        or None if the result may still change. Results are cacheable when the
+        request is pinned to a version with as_of, or when its time range ends
+        before the last date of the dataset's current head. v3 heads and ends
+        come from the v3 heads listing and v4 ones from the v4 dataset's latest
+        publication
+
+        Parameters: args (dict), wrapper arguments as returned by parse_request
+                    req (dict), the received request data
+        Returns: tuple, (dataset, head, canonical request) or None
+    '''
+    route = args.get('_route', None)
+    if route is None:
+        return None
+    wrapper_args = {k: v for k, v in args.items() if not k.startswith('_')}
+    v4 = 'dataset_name' in wrapper_args
+    dataset = wrapper_args.get('dataset_name' if v4 else 'dataset', None)
+    if wrapper_args.get('as_of', None) is not None:
+        head = None
+    else:
+        time_range = wrapper_args.get('time_range', None)
+        if dataset is None or time_range is None:
+            return None
+        if v4:
+            head, end = DATASET_HEADS.v4_version(dataset)
+        else:
+            head, end = get_dataset_head(dataset), get_dataset_end(dataset)
+        if head is None or end is None or time_range[1].replace(tzinfo=None) >= end.replace(tzinfo=None):
+            return None
+    canonical = (
+        route.base_path,
+        route.key,
+        normalize_args(wrapper_args),
+        tuple(req.get('request_ops', None) or []),
+        tuple(req.get('request_params', None) or []),
+    )
+    return (dataset, head, canonical)
 
 
 def get_request_data(args):
-    key = args.pop('_key')
-    for base_path in API_MAPS.keys():
-        if key in API_MAPS[base_path]['paths'].keys():
-            api_endpoint = API_MAPS[base_path]['paths'][key]
-            # print(f'api_endpoint: {api_endpoint}, args: {args}')
-            data = api_endpoint['function'](args)
-            # print(f'data: {data}')
-            if "unit" not in data:
-                data["unit"] = None
-            return data
-    raise ValueError('Request not supported')
-
-
-def operate_on_data(data, ops, args):
+    ''' Calls the wrapper function of the resolved route with the remaining
+        wrapper arguments. Identical requests arriving while a call is in flight
+        wait for that call. Every caller, the one that made the call included,
+        receives its own copy of the result, since callers operate on it in place
+
+        Parameters: args (dict), wrapper arguments as returned by parse_request
+        Returns: dict, wrapper result with "data" and "unit"
+    '''
+    args.pop('_key', None)
+    route = args.pop('_route', None)
+    if route is None:
+        raise ValueError('Request not supported')
+
+    def call():
+        with timed('fetch', endpoint=route.key, dataset=args.get('dataset', args.get('dataset_name', ''))):
+            data = route.function(args)
+        if "unit" not in data:
+            data["unit"] = None
+        return data
+
+    data, _ = REQUEST_FLIGHT.do(request_key(route, args), call)
+    return copy_result(data)
+
+
+def operate_on_data(data, ops, args, unit=None):
     ''' 
         data is dict iff metadata and BytesIO iff CEDA (basically not supported)
             and pd.Series/pd.DataFrame otherwise 
@@ -689,62 +821,19 @@ def operate_on_data(data, ops, args):
         times are returned as timestamps starting at beginning of unix epoch
         dates are returned as timestamps starting at beginning of unix epoch to start of date
         ms on timestamps
+
+        ops and args are compiled into a cached plan of whitelisted operations,
+        see program_catalog.tools.operations. Float histories carrying a unit
+        report results in the unit the equivalent Quantity operations give
     '''
     no_unit = "n/a"
     if type(data) is dict or type(data) is io.BytesIO:
         return 0, no_unit, "Request not supported"
-    # print(f'ops: {ops}, args: {args}, data: {data}')
-    # reset = data
-    for i, op in enumerate(ops):
-        pandas_op = getattr(data, op)
-        op_params = ast.literal_eval(args[i])
-        # print(f'pandas_op: {pandas_op}, op_params: {op_params}')
-        # return_result = op_params.pop(-1)
-        # carry_forward = op_params.pop(0)
-        result = pandas_op(*op_params)
-        data = result
-        # print(f'result: {result}')
-        # if return_result:
-        #     if type(result) is pd.Series or type(result) is pd.DataFrame:
-        #         result = result.mean()
-        #     if type(result) is date:
-        #         result = datetime(result.year, result.month, result.day)
-        #     if type(result) is time:
-        #         result = datetime(0, 0, 0, result.hour, result.minute, result.second, result.microsecond)
-        #     if type(result) is datetime:
-        #         return int(result.replace(tzinfo=timezone.utc).timestamp() * 1000), "ms since epoch", None
-        #     if type(result) is u.quantity.Quantity:
-        #         return int(float(result.value) * PRECISION), f'{result.unit} * {PRECISION}', None
-        #     elif 'float' in str(type(result)) or 'int' in str(type(result)):
-        #         if not data["unit"]:
-        #             return int(float(result) * PRECISION), f'* {PRECISION}', None
-        #         else:
-        #             return int(float(result) * PRECISION), f'{data["unit"]} * {PRECISION}', None
-        #     else:
-        #         print(f'result: {result}, type: {type(result)}')
-        #         return 0, no_unit, "Incompatible return type"
-        # # if carry_forward:
-        # else:
-        #     data = result
-        # else:
-        #     data = reset
-    if type(result) is pd.Series or type(result) is pd.DataFrame:
-        result = result.mean()
-    if type(result) is date:
-        result = datetime(result.year, result.month, result.day)
-    if type(result) is time:
-        result = datetime(0, 0, 0, result.hour, result.minute, result.second, result.microsecond)
-    if type(result) is datetime:
-        return int(result.replace(tzinfo=timezone.utc).timestamp() * 1000), "ms since epoch", None
-    if type(result) is u.quantity.Quantity:
-        return int(float(result.value) * PRECISION), f'{result.unit} * {PRECISION}', None
-    elif 'float' in str(type(result)) or 'int' in str(type(result)):
-        if not data["unit"]:
-            return int(float(result) * PRECISION), f'* {PRECISION}', None
-        else:
-            return int(float(result) * PRECISION), f'{data["unit"]} * {PRECISION}', None
-    else:
-        print(f'result: {result}, type: {type(result)}')
-        return 0, no_unit, "Incompatible return type"
-    # always return the last result from now on
-    # return 0, no_unit, "No return specified"
\ No newline at end of file
+    try:
+        plan = compile_plan(ops, args)
+    except ValueError as e:
+        return 0, no_unit, f'Unsupported operations: {e}'
+    data_unit = series_unit(data)
+    result = plan.execute(data)
+    quantity_unit = None if data_unit is None else plan.result_unit(data_unit)
+    return to_chain_value(result, unit, quantity_unit=quantity_unit)
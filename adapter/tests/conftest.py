@@ -0,0 +1,70 @@
+''' Shared test setup. The v3 and v4 clients are replaced by the benchmark
+    stand-ins before anything imports program_catalog, histories are only
+    cached in memory, and the node is keyed with a fixed test key
+
+    Run from the adapter directory with `python -m pytest tests`
+'''
+import asyncio
+import os
+import sys
+
+import pytest
+
+ADAPTER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ADAPTER_DIR not in sys.path:
+    sys.path.insert(0, ADAPTER_DIR)
+
+TEST_NODE_KEY = '5c' * 32
+
+os.environ.setdefault('HISTORY_DISK_CACHE_DIR', '')
+os.environ.setdefault('HEADS_FILE', '')
+os.environ.setdefault('LOG_LEVEL', 'WARNING')
+os.environ.setdefault('NODE_PRIVATE_KEY', TEST_NODE_KEY)
+
+from benchmarks.fakes import SyntheticData, install_fake_clients
+
+SYNTHETIC = SyntheticData(start='2019-01-01', end='2021-12-31 23:00')
+install_fake_clients(SYNTHETIC)
+
+
+def asgi_exchange(app, method, path, body=b''):
+    ''' Sends one request through an ASGI application, leaving the connection
+        open until the response has been sent
+
+        Returns: int, the response status
+                 bytes, the response body
+    '''
+    async def exchange():
+        sent = []
+        messages = [{'type': 'http.request', 'body': body, 'more_body': False}]
+
+        async def receive():
+            if messages:
+                return messages.pop(0)
+            await asyncio.sleep(3600)
+
+        async def send(message):
+            sent.append(message)
+
+        await app({'type': 'http', 'method': method, 'path': path, 'headers': []}, receive, send)
+        return sent[0]['status'], sent[1]['body']
+
+    return asyncio.run(exchange())
+
+
+@pytest.fixture
+def synthetic():
+    ''' Returns: SyntheticData, source of the histories served by the stand-in clients '''
+    return SYNTHETIC
+
+
+@pytest.fixture(autouse=True)
+def empty_caches():
+    ''' Starts every test with empty history, result and secret caches '''
+    from program_catalog.tools.cache import HISTORY_CACHE, LATEST_HISTORIES, RESULT_CACHE
+    from program_catalog.tools.crypto import clear_secret_caches
+    HISTORY_CACHE.purge()
+    RESULT_CACHE.purge()
+    LATEST_HISTORIES.purge()
+    clear_secret_caches()
+    yield
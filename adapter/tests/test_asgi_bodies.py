@@ -0,0 +1,35 @@
+import json
+import time
+
+import pytest
+
+import asgi
+from conftest import asgi_exchange
+
+
+def post(app, path, body):
+    ''' Returns: tuple, the response status and decoded JSON body of a POST request '''
+    status, response = asgi_exchange(app, 'POST', path, body)
+    return status, json.loads(response)
+
+
+@pytest.mark.parametrize('body', [b'[1, 2]', b'"job"', b'7', b'null'])
+def test_bodies_that_are_not_objects_get_an_error_result(body):
+    status, result = post(asgi.build_asgi_app(max_workers=2), '/', body)
+    assert status == 200
+    assert result['statusCode'] == 500
+    assert result['jobRunID'] == '3'
+    assert 'request data empty' in result['error']
+
+
+def test_deadline_error_for_a_body_that_is_not_an_object(monkeypatch):
+    class SlowAdapter:
+        def __init__(self, data):
+            time.sleep(0.5)
+            self.result = {'statusCode': 200}
+
+    monkeypatch.setattr(asgi, 'dClimateAdapter', SlowAdapter)
+    status, result = post(asgi.build_asgi_app(max_workers=2, timeout=0.05), '/api', b'["not", "a", "request"]')
+    assert status == 200
+    assert result['jobRunID'] == '2'
+    assert 'deadline' in result['result']['unit']
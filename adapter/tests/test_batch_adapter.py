@@ -0,0 +1,34 @@
+from adapter import ArbolAdapter
+from app import build_app
+from benchmarks.scenarios import evaluation_request, grid
+
+
+def rainfall_job(job_id, strike):
+    ''' Returns: dict, evaluation request for a rainfall contract over 2 x 2 daily gridcells '''
+    terms = {
+        'dataset': 'cpc_precip_us-daily',
+        'locations': grid(40.125, -100.125, 2),
+        'strike': strike,
+        'limit': '1000',
+        'tick': '50',
+        'opt_type': 'PUT',
+    }
+    job = evaluation_request(terms, (2021, 3, 1), (2021, 5, 31), 'GRP-test')
+    job['id'] = job_id
+    return job
+
+
+def test_invalid_jobs_fail_only_their_own_slot():
+    valid = [rainfall_job('first', '10'), rainfall_job('last', '20')]
+    jobs = [valid[0], 'not a job', 7, ['a', 'list'], None, {'id': 'empty', 'data': {}}, valid[1]]
+
+    response = build_app().test_client().post('/batch', json={'id': 'batch', 'data': jobs})
+
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body['statusCode'] == 200
+    results = body['result']
+    assert [result['statusCode'] for result in results] == [200, 500, 500, 500, 500, 500, 200]
+    assert [result['jobRunID'] for result in results] == ['first', 'batch', 'batch', 'batch', 'batch', 'empty', 'last']
+    for job, result in ((valid[0], results[0]), (valid[1], results[-1])):
+        assert result['result'] == ArbolAdapter(job).result['result']
@@ -0,0 +1,72 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from program_catalog.programs.critical_snowfall_derivative import CriticalSnowfallDerivative
+from program_catalog.programs.rainfall_derivative import RainfallDerivative
+from program_catalog.tools.units import set_unit
+
+
+def history(synthetic, dataset, *key):
+    series = synthetic.series(dataset, *key)
+    series.index = series.index.tz_localize('UTC')
+    return set_unit(series, 'inch')
+
+
+def rainfall_contracts(count, seed=7):
+    ''' Returns: list, rainfall contract terms spanning payouts clipped at
+        zero, clipped at the limit and in between, with ticks or exhausts
+    '''
+    rng = np.random.default_rng(seed)
+    months = pd.date_range('2019-01-01', '2021-10-01', freq='MS')
+    contracts = []
+    for i in range(count):
+        start = months[rng.integers(len(months))]
+        end = start + pd.DateOffset(months=int(rng.integers(1, 4))) - pd.DateOffset(days=1)
+        contract = {
+            'start': start.strftime('%Y-%m-%d'),
+            'end': end.strftime('%Y-%m-%d'),
+            'opt_type': 'CALL' if i % 2 else 'PUT',
+            'strike': str(round(float(rng.uniform(0, 12)), 2)),
+            'limit': str(int(rng.integers(100, 1000))),
+        }
+        if i % 3:
+            contract['tick'] = str(round(float(rng.uniform(10, 200)), 2))
+        else:
+            contract['exhaust'] = str(round(float(contract['strike']) + (1 if i % 2 else -1) * float(rng.uniform(1, 5)), 2))
+        contracts.append(contract)
+    return contracts
+
+
+@pytest.mark.parametrize('count', [3, 40])
+def test_rainfall_batch_payouts_equal_scalar_payouts(synthetic, count):
+    data = history(synthetic, 'cpc_precip_us-daily', 40.125, -100.125)
+    contracts = rainfall_contracts(count)
+    expected = [RainfallDerivative._generate_payouts(data=data, start=c['start'], end=c['end'], opt_type=c['opt_type'],
+                                                     strike=c['strike'], limit=c['limit'], exhaust=c.get('exhaust', None),
+                                                     tick=c.get('tick', None)) for c in contracts]
+    assert len(set(expected)) > 2
+    assert RainfallDerivative.serve_batch(data, contracts) == expected
+
+
+def test_rainfall_batch_keeps_the_zero_spread_error(synthetic):
+    data = history(synthetic, 'cpc_precip_us-daily', 40.125, -100.125)
+    contract = {'start': '2020-01-01', 'end': '2020-03-31', 'opt_type': 'PUT', 'strike': '5', 'limit': '100', 'exhaust': '5'}
+    with pytest.raises(ZeroDivisionError):
+        RainfallDerivative.serve_batch(data, [contract])
+
+
+@pytest.mark.parametrize('count', [3, 24])
+def test_snowfall_batch_payouts_equal_scalar_payouts(synthetic, count):
+    data = history(synthetic, 'ghcnd', 'USW00014739', 'SNOW')
+    rng = np.random.default_rng(11)
+    dates = [[str(day.date()) for day in pd.date_range(start, periods=int(rng.integers(2, 20)), freq='D')]
+             for start in rng.choice(data.index[:-40], size=count)]
+    thresholds = [str(round(float(rng.uniform(0, 1.5)), 2)) for _ in range(count)]
+    opt_types = ['CALL' if i % 2 else 'PUT' for i in range(count)]
+    limits = [str(int(rng.integers(100, 1000))) for _ in range(count)]
+    expected = [CriticalSnowfallDerivative._generate_payouts(data=data.loc[covered], threshold=threshold,
+                                                             opt_type=opt_type, limit=limit)
+                for covered, threshold, opt_type, limit in zip(dates, thresholds, opt_types, limits)]
+    assert len(set(expected)) > 1
+    assert CriticalSnowfallDerivative._generate_payouts_batch(data, dates, thresholds, opt_types, limits) == expected
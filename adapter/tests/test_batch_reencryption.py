@@ -0,0 +1,44 @@
+import base64
+import os
+import threading
+
+import pytest
+from coincurve import PrivateKey
+
+import program_catalog.tools.crypto as crypto
+from conftest import TEST_NODE_KEY
+
+ACCESS_KEY = bytes(range(32))
+
+
+def node_key():
+    ''' Returns: str, the access key encrypted for the test node as sent in requests '''
+    public_key = PrivateKey(bytes.fromhex(TEST_NODE_KEY)).public_key.format(compressed=True)
+    return base64.b64encode(crypto.encrypt_access_key(ACCESS_KEY, public_key)).decode()
+
+
+@pytest.mark.parametrize('keys', [2, 9])
+def test_batch_reencrypt_encrypts_for_each_key_in_order(monkeypatch, keys):
+    monkeypatch.setattr(crypto, 'REENCRYPTION_MAX_WORKERS', 3)
+    private_keys = [PrivateKey(os.urandom(32)) for _ in range(keys)]
+    public_keys = [base64.b64encode(key.public_key.format(compressed=True)).decode() for key in private_keys]
+    encryptions = crypto.batch_reencrypt(node_key(), public_keys)
+    assert len(encryptions) == keys
+    for private_key, encryption in zip(private_keys, encryptions):
+        assert crypto.decrypt_access_key(base64.b64decode(encryption), private_key) == ACCESS_KEY
+
+
+def test_batches_run_on_threads_of_this_process(monkeypatch):
+    monkeypatch.setattr(crypto, 'REENCRYPTION_MAX_WORKERS', 3)
+    threads = set()
+    encrypt = crypto.encrypt_access_key_b64
+
+    def recording_encrypt(access_key, public_key):
+        threads.add(threading.current_thread().name)
+        return encrypt(access_key, public_key)
+
+    monkeypatch.setattr(crypto, 'encrypt_access_key_b64', recording_encrypt)
+    public_keys = [base64.b64encode(PrivateKey(os.urandom(32)).public_key.format(compressed=True)).decode()
+                   for _ in range(crypto.REENCRYPTION_INLINE_SIZE + 1)]
+    crypto.batch_reencrypt(node_key(), public_keys)
+    assert threads and all(name.startswith('reencryption') for name in threads)
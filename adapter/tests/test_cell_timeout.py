@@ -0,0 +1,52 @@
+import threading
+import time
+
+import pandas as pd
+import pytest
+
+from program_catalog.tools.loaders import GridcellLoader
+
+DATASET = 'cpc_precip_us-daily'
+
+
+@pytest.fixture
+def fetch_seconds(monkeypatch):
+    ''' Seconds each location takes to load, keyed on its latitude. Loads
+        still running when a test ends are released
+    '''
+    seconds = {}
+    release = threading.Event()
+
+    def load_series(self, lat, lon):
+        release.wait(seconds.get(lat, 0.0))
+        return pd.Series([float(lat)], index=pd.DatetimeIndex(['2021-01-01'], tz='UTC'))
+
+    monkeypatch.setattr(GridcellLoader, '_load_series', load_series)
+    yield seconds
+    release.set()
+
+
+def locations(count):
+    return [(float(lat), -100.0) for lat in range(count)]
+
+
+def test_time_spent_before_collection_counts_toward_the_timeout(fetch_seconds):
+    fetch_seconds.update({0: 0.3, 1: 0.7})
+    loader = GridcellLoader(locations(2), DATASET, max_workers=2, cell_timeout=0.5)
+    with pytest.raises(ValueError, match=r'\(1.0, -100.0\): timed out after 0.5 seconds'):
+        loader.load()
+
+
+def test_hanging_locations_time_out_together(fetch_seconds):
+    fetch_seconds.update({lat: 30.0 for lat in range(4)})
+    loader = GridcellLoader(locations(4), DATASET, max_workers=4, cell_timeout=0.2)
+    started = time.monotonic()
+    with pytest.raises(ValueError, match='failed to load 4 of 4 locations'):
+        loader.load()
+    assert time.monotonic() - started < 0.6
+
+
+def test_queued_locations_get_their_full_timeout(fetch_seconds):
+    fetch_seconds.update({lat: 0.15 for lat in range(4)})
+    loader = GridcellLoader(locations(4), DATASET, max_workers=2, cell_timeout=0.25)
+    assert loader.load().iloc[0] == pytest.approx(1.5)
@@ -0,0 +1,39 @@
+''' Chain values of reductions over float histories against the values the
+    same chains gave when histories were Series of astropy Quantities. The
+    Quantity baselines below were recorded from that path, which summed the
+    objects one by one, while float histories are summed pairwise by numpy.
+    The two may differ in the last bits of the float result, so values are
+    compared within CHAIN_VALUE_RTOL, a few float64 ulps, rather than exactly
+'''
+import numpy as np
+import pandas as pd
+import pytest
+
+from program_catalog.tools.units import set_unit
+from program_catalog.tools.wrappers import operate_on_data
+
+CHAIN_VALUE_RTOL = 1e-15
+
+# (ops, params, chain value and unit recorded from the Quantity path)
+QUANTITY_BASELINES = [
+    (['sum'], [], 906421600000000131072, 'inch * 1e+18'),
+    (['mean'], [], 827027007299270144, 'inch * 1e+18'),
+    (['last', 'sum'], ["['90D']"], 74511500000000016384, 'inch * 1e+18'),
+    (['last', 'mean'], ["['30D']"], 821339999999999872, 'inch * 1e+18'),
+    (['max'], [], 1300000000000000000, 'inch * 1e+18'),
+]
+
+
+def history():
+    ''' Returns: Pandas Series, three years of daily values in inches '''
+    index = pd.date_range('2019-01-01', '2021-12-31', freq='D')
+    values = np.round(np.abs(np.sin(np.arange(len(index)) * 0.7)) * 1.3, 4)
+    return set_unit(pd.Series(values, index=index), 'inch')
+
+
+@pytest.mark.parametrize('ops, params, baseline, unit', QUANTITY_BASELINES)
+def test_float_chain_values_match_quantity_baselines(ops, params, baseline, unit):
+    value, value_unit, error = operate_on_data(history(), ops, params)
+    assert error is None
+    assert value_unit == unit
+    assert abs(value - baseline) <= CHAIN_VALUE_RTOL * abs(baseline)
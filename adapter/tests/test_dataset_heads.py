@@ -0,0 +1,117 @@
+import types
+
+import pandas as pd
+import pytest
+
+import program_catalog.tools.heads as heads
+from program_catalog.tools.heads import DatasetHeads
+
+
+@pytest.fixture
+def published(monkeypatch):
+    ''' Heads listed by the stand-in v3 client, changed by the tests to republish '''
+    listing = {'cpc_precip_us-daily': 'head-1', 'cme_futures-daily': 'cme-1'}
+    metadata_reads = []
+
+    def get_metadata(head, *args, **kwargs):
+        metadata_reads.append(head)
+        return {'date range': ['2021-01-01', '2021-12-31'], 'head': head}
+
+    monkeypatch.setattr(heads.v3_client, 'get_heads', lambda *args, **kwargs: dict(listing))
+    monkeypatch.setattr(heads.v3_client, 'get_metadata', get_metadata)
+    monkeypatch.setattr(DatasetHeads, 'start', lambda self: None)
+    return types.SimpleNamespace(listing=listing, metadata_reads=metadata_reads)
+
+
+@pytest.fixture
+def heads_path(tmp_path):
+    return str(tmp_path / 'heads.json')
+
+
+def test_one_worker_refreshes_and_the_others_read_its_file(published, heads_path):
+    refresher = DatasetHeads(path=heads_path, metadata_datasets=['cme_futures-daily'])
+    reader = DatasetHeads(path=heads_path, metadata_datasets=['cme_futures-daily'])
+    refresher.refresh()
+    reader.refresh()
+    assert refresher.stats()['refresher'] == 1
+    assert reader.stats()['refresher'] == 0
+    assert reader.head('cpc_precip_us-daily') == 'head-1'
+    assert reader.metadata('cme_futures-daily')['head'] == 'cme-1'
+    assert published.metadata_reads == ['cme-1']
+
+    refresher._lock_file.close()
+    refresher._lock_file = None
+    published.listing['cpc_precip_us-daily'] = 'head-2'
+    reader.refresh()
+    assert reader.stats()['refresher'] == 1
+    assert reader.head('cpc_precip_us-daily') == 'head-2'
+
+
+def test_subscribers_see_head_changes_in_every_worker(published, heads_path):
+    refresher = DatasetHeads(path=heads_path, metadata_datasets=[])
+    reader = DatasetHeads(path=heads_path, metadata_datasets=[])
+    seen = {'refresher': [], 'reader': []}
+    refresher.subscribe(lambda *change: seen['refresher'].append(change))
+    reader.subscribe(lambda *change: seen['reader'].append(change))
+    refresher.refresh()
+    reader.refresh()
+    assert seen == {'refresher': [], 'reader': []}
+
+    published.listing['cpc_precip_us-daily'] = 'head-2'
+    assert refresher.refresh()
+    reader.refresh()
+    change = ('cpc_precip_us-daily', 'head-1', 'head-2')
+    assert seen == {'refresher': [change], 'reader': [change]}
+
+
+def test_broadcast_purges_reach_the_other_workers_once(published, heads_path):
+    sender = DatasetHeads(path=heads_path)
+    receiver = DatasetHeads(path=heads_path)
+    purged = {'sender': [], 'receiver': []}
+    sender.subscribe_purge(purged['sender'].append)
+    receiver.subscribe_purge(purged['receiver'].append)
+    assert sender.broadcast_purge('cpc_precip_us-daily')
+    assert not sender.broadcast_purge('../escape')
+    sender._apply_purges()
+    receiver._apply_purges()
+    receiver._apply_purges()
+    assert purged == {'sender': [], 'receiver': ['cpc_precip_us-daily']}
+
+
+def test_purges_from_before_a_worker_started_are_not_replayed(published, heads_path):
+    DatasetHeads(path=heads_path).broadcast_purge('cpc_precip_us-daily')
+    late = DatasetHeads(path=heads_path)
+    purged = []
+    late.subscribe_purge(purged.append)
+    late._apply_purges(notify=False)
+    late._apply_purges()
+    assert purged == []
+
+
+def test_require_metadata_reads_through_the_registry_once(published):
+    registry = DatasetHeads(path=None, metadata_datasets=[])
+    registry.refresh()
+    assert registry.metadata('cme_futures-daily') is None
+    assert registry.require_metadata('cme_futures-daily')['head'] == 'cme-1'
+    assert registry.require_metadata('cme_futures-daily')['head'] == 'cme-1'
+    assert published.metadata_reads == ['cme-1']
+    with pytest.raises(ValueError):
+        registry.require_metadata('unknown-dataset')
+
+
+def test_unchanged_v4_dataset_is_not_opened(monkeypatch):
+    names = {'era5_precip-hourly': 'cid-1'}
+    opened = []
+
+    def load_ipfs(dataset, *args, **kwargs):
+        opened.append(dataset)
+        return {'time': types.SimpleNamespace(values=pd.date_range('2021-01-01', periods=3, freq='D').values)}
+
+    monkeypatch.setattr(heads, 'get_ipns_name_hash', names.get)
+    monkeypatch.setattr(heads.v4_client, 'load_ipfs', load_ipfs, raising=False)
+    first = heads.read_v4_version('era5_precip-hourly')
+    assert first == {'head': 'cid-1', 'end': '2021-01-03T00:00:00'}
+    assert heads.read_v4_version('era5_precip-hourly', first) is first
+    names['era5_precip-hourly'] = 'cid-2'
+    assert heads.read_v4_version('era5_precip-hourly', first)['head'] == 'cid-2'
+    assert opened == ['era5_precip-hourly', 'era5_precip-hourly']
@@ -0,0 +1,63 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from program_catalog.tools.disk_cache import DiskHistoryCache
+from program_catalog.tools.units import set_unit
+
+
+def history(days=365, start='2020-01-01'):
+    index = pd.date_range(start, periods=days, freq='D', tz='UTC')
+    return set_unit(pd.Series(np.linspace(0.0, 1.0, days), index=index), 'inch')
+
+
+@pytest.fixture
+def disk_cache(tmp_path):
+    return DiskHistoryCache(str(tmp_path), max_bytes=10 * 1024**2, scan_writes=8)
+
+
+def test_hits_only_the_version_it_was_written_for(disk_cache):
+    disk_cache.set(('grid-history', 40.125), {'data': history(), 'unit': 'inch'}, version='head-1', dataset='cpc')
+    hit, result = disk_cache.get(('grid-history', 40.125), version='head-1')
+    assert hit
+    assert result['unit'] == 'inch'
+    assert result['data'].attrs['unit'] == 'inch'
+    assert result['data'].index.equals(history().index)
+    np.testing.assert_array_equal(result['data'].to_numpy(), history().to_numpy())
+    assert disk_cache.get(('grid-history', 40.125), version='head-2') == (False, None)
+    assert disk_cache.get(('grid-history', 41.125), version='head-1') == (False, None)
+
+
+def test_reads_only_the_requested_window(disk_cache):
+    disk_cache.set(('grid-history',), {'data': history()}, version='head-1')
+    hit, result = disk_cache.get(('grid-history',), version='head-1', window=('2020-03-01', '2020-03-31'))
+    assert hit
+    expected = history().loc['2020-03-01':'2020-03-31']
+    assert result['data'].index.equals(expected.index)
+    np.testing.assert_array_equal(result['data'].to_numpy(), expected.to_numpy())
+
+
+def test_purge_removes_only_the_dataset(disk_cache):
+    disk_cache.set(('a',), {'data': history()}, version='head-1', dataset='cpc')
+    disk_cache.set(('b',), {'data': history()}, version='head-1', dataset='era5')
+    assert disk_cache.purge('cpc') == 1
+    assert not disk_cache.get(('a',), version='head-1')[0]
+    assert disk_cache.get(('b',), version='head-1')[0]
+
+
+def test_scans_only_on_the_first_write_and_every_scan_writes(disk_cache):
+    for i in range(17):
+        disk_cache.set(('entry', i), {'data': history()}, version='head-1')
+    assert disk_cache.scans == 3
+
+
+def test_running_size_keeps_the_cache_under_its_cap(tmp_path):
+    entry = DiskHistoryCache(str(tmp_path / 'probe'), max_bytes=1024**3)
+    entry.set(('probe',), {'data': history()}, version='head-1')
+    size = entry._size
+    cache = DiskHistoryCache(str(tmp_path / 'capped'), max_bytes=3 * size, scan_writes=1000)
+    for i in range(10):
+        cache.set(('entry', i), {'data': history()}, version='head-1')
+        assert cache._size <= 3 * size
+    assert sum(cache.get(('entry', i), version='head-1')[0] for i in range(10)) == 3
+    assert cache.get(('entry', 9), version='head-1')[0]
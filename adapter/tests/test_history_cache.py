@@ -0,0 +1,68 @@
+import pytest
+
+import program_catalog.tools.wrappers as wrappers
+from program_catalog.tools.cache import HISTORY_CACHE, TTLCache, purge_dataset
+
+DATASET = 'cpc_precip_us-daily'
+ARGS = {'lat': 40.125, 'lon': -100.125, 'dataset': DATASET}
+
+
+@pytest.fixture
+def head(monkeypatch):
+    ''' Current head of every dataset, changed by the tests to republish '''
+    current = ['head-1']
+    monkeypatch.setattr(wrappers.DATASET_HEADS, 'head', lambda dataset: current[0])
+    return current
+
+
+def test_ttl_cache_evicts_least_recently_used_and_expires():
+    cache = TTLCache(2)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    assert cache.get('a') == (True, 1)
+    cache.set('c', 3)
+    assert cache.get('b') == (False, None)
+    assert cache.get('a') == (True, 1)
+    cache.set('d', 4, ttl=0)
+    assert cache.get('d') == (False, None)
+    assert cache.get('c') == (False, None)
+    assert cache.get('a') == (True, 1)
+    assert cache.stats()['evictions'] == 2
+    assert cache.stats()['expirations'] == 1
+
+
+def test_ttl_cache_purges_matching_keys():
+    cache = TTLCache(8)
+    for key in [('x', 1), ('x', 2), ('y', 1)]:
+        cache.set(key, key)
+    assert cache.purge(lambda key: key[0] == 'x') == 2
+    assert cache.get(('y', 1)) == (True, ('y', 1))
+
+
+def test_repeated_history_requests_are_fetched_once(synthetic, head):
+    fetches = synthetic.fetches
+    first = wrappers.get_gridcell_history_wrapper(ARGS)
+    second = wrappers.get_gridcell_history_wrapper(dict(reversed(list(ARGS.items()))))
+    assert synthetic.fetches == fetches + 1
+    assert second['data'].equals(first['data'])
+    assert second['unit'] == first['unit']
+
+
+def test_new_head_misses_and_purge_forces_a_fetch(synthetic, head):
+    wrappers.get_gridcell_history_wrapper(ARGS)
+    fetches = synthetic.fetches
+    head[0] = 'head-2'
+    wrappers.get_gridcell_history_wrapper(ARGS)
+    assert synthetic.fetches == fetches + 1
+    assert purge_dataset(DATASET)['history_cache'] == 2
+    assert HISTORY_CACHE.stats()['size'] == 0
+    wrappers.get_gridcell_history_wrapper(ARGS)
+    assert synthetic.fetches == fetches + 2
+
+
+def test_windows_are_served_from_the_cached_full_history(synthetic, head):
+    full = wrappers.get_gridcell_history_wrapper(ARGS)['data']
+    fetches = synthetic.fetches
+    window = wrappers.get_gridcell_history_wrapper({**ARGS, '_start': '2020-03-01', '_end': '2020-03-31'})['data']
+    assert synthetic.fetches == fetches
+    assert window.equals(full.loc['2020-03-01':'2020-03-31'])
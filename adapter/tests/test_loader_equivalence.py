@@ -0,0 +1,36 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import program_catalog.tools.wrappers as wrappers
+from program_catalog.tools.loaders import GridcellLoader, MultiPointLoader, compare_loaders
+
+DATASET = 'cpc_precip_us-daily'
+LOCATIONS = [(40.125, -100.125), (40.125, -99.875), (40.375, -100.125), (40.375, -99.875)]
+
+
+@pytest.fixture
+def averaging_v4_client(monkeypatch, synthetic):
+    ''' Serves multi-point queries as the mean of the stand-in v3 gridcell
+        histories of the queried points, in millimeters like the v4 datasets
+    '''
+    def geo_temporal_query(dataset_name, multiple_points_kwargs, time_range=None, **kwargs):
+        points = multiple_points_kwargs['points_mask']
+        cells = [synthetic.series(dataset_name, round(float(point.y), 3), round(float(point.x), 3)) for point in points]
+        data = pd.concat(cells, axis=1).mean(axis=1) * 25.4
+        if time_range is not None:
+            data = data.loc[time_range[0]:time_range[1]]
+        return {'data': data.to_numpy().tolist(), 'times': [str(t) for t in data.index], 'unit of measurement': 'mm'}
+
+    monkeypatch.setattr(wrappers.v4_client, 'geo_temporal_query', geo_temporal_query, raising=False)
+
+
+@pytest.mark.parametrize('window', [(None, None), ('2020-03-01', '2020-08-31')])
+def test_multi_point_loader_matches_gridcell_loader(averaging_v4_client, window):
+    start, end = window
+    expected = GridcellLoader(LOCATIONS, DATASET, start=start, end=end).load()
+    actual = MultiPointLoader(LOCATIONS, DATASET, start=start, end=end).load()
+    summary = compare_loaders(expected, actual)
+    assert summary['shared'] > 0
+    assert summary['equivalent'], summary
+    assert np.isclose(summary['expected_total'], summary['actual_total'])
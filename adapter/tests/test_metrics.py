@@ -0,0 +1,86 @@
+import json
+
+import pytest
+
+import api
+import asgi
+from app import build_app
+from conftest import asgi_exchange
+from program_catalog.tools.metrics import Counter, Histogram, render_metrics, timed
+
+
+def sample(text, name, **labels):
+    ''' Returns: float, value of the sample with the given name and labels in the exposition text, 0 if absent '''
+    selector = name + ('{' + ','.join(f'{key}="{value}"' for key, value in labels.items()) + '}' if labels else '')
+    for line in text.splitlines():
+        if line.startswith(selector + ' '):
+            return float(line.rsplit(' ', 1)[1])
+    return 0.0
+
+
+def api_request():
+    return {'id': 1, 'data': {'request_url': '/apiv3/grid-history/cpc_precip_us-daily/40.125_-100.125',
+                              'request_ops': ['sum'], 'request_params': ['[]']}}
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = Histogram('test_seconds', 'Test latencies', ['stage'], buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 0.5, 5.0):
+        histogram.observe(value, stage='fetch')
+    text = '\n'.join(histogram.render())
+    assert sample(text, 'test_seconds_bucket', stage='fetch', le='0.1') == 1
+    assert sample(text, 'test_seconds_bucket', stage='fetch', le='1.0') == 3
+    assert sample(text, 'test_seconds_bucket', stage='fetch', le='+Inf') == 4
+    assert sample(text, 'test_seconds_count', stage='fetch') == 4
+    assert sample(text, 'test_seconds_sum', stage='fetch') == pytest.approx(6.05)
+
+
+def test_counter_labels_are_escaped():
+    counter = Counter('test_total', 'Test counter', ['route'])
+    counter.inc(route='a"b\nc')
+    counter.inc(2, route='a"b\nc')
+    assert counter.render()[-1] == 'test_total{route="a\\"b\\nc"} 3'
+
+
+def test_timed_stages_count_errors():
+    before = render_metrics()
+    with pytest.raises(RuntimeError):
+        with timed('test_stage', endpoint='test'):
+            raise RuntimeError('failed')
+    after = render_metrics()
+    labels = {'stage': 'test_stage', 'endpoint': 'test', 'dataset': ''}
+    assert sample(after, 'adapter_stage_errors_total', **labels) == sample(before, 'adapter_stage_errors_total', **labels) + 1
+    assert sample(after, 'adapter_stage_seconds_count', **labels) == sample(before, 'adapter_stage_seconds_count', **labels) + 1
+
+
+def test_flask_requests_are_recorded_by_status_including_errors(monkeypatch):
+    client = build_app().test_client()
+    before = client.get('/metrics').get_data(as_text=True)
+    assert client.post('/api', json=api_request()).status_code == 200
+    assert client.post('/', json={'id': 2, 'data': {}}).get_json()['statusCode'] == 500
+
+    def failing_request_data(args):
+        raise RuntimeError('fetch failed')
+
+    monkeypatch.setattr(api, 'get_request_data', failing_request_data)
+    assert client.post('/api', json=api_request()).status_code == 500
+    after = client.get('/metrics').get_data(as_text=True)
+    for route, status in (('/api', '200'), ('/', '500'), ('/api', 'error')):
+        assert sample(after, 'adapter_requests_total', route=route, status=status) == \
+            sample(before, 'adapter_requests_total', route=route, status=status) + 1
+    assert sample(after, 'adapter_request_seconds_count', route='/api') == \
+        sample(before, 'adapter_request_seconds_count', route='/api') + 2
+
+
+def test_asgi_requests_that_raise_are_recorded_as_errors(monkeypatch):
+    def failing_request_data(args):
+        raise RuntimeError('fetch failed')
+
+    monkeypatch.setattr(api, 'get_request_data', failing_request_data)
+    app = asgi.build_asgi_app(max_workers=2)
+    before = asgi_exchange(app, 'GET', '/metrics')[1].decode('utf-8')
+    result = json.loads(asgi_exchange(app, 'POST', '/api', json.dumps(api_request()).encode('utf-8'))[1])
+    assert 'fetch failed' in result['result']['unit']
+    after = asgi_exchange(app, 'GET', '/metrics')[1].decode('utf-8')
+    assert sample(after, 'adapter_requests_total', route='/api', status='error') == \
+        sample(before, 'adapter_requests_total', route='/api', status='error') + 1
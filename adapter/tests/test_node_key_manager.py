@@ -0,0 +1,70 @@
+import json
+import os
+
+import pytest
+
+from conftest import TEST_NODE_KEY
+from program_catalog.tools.crypto import NODE_KEY_MANAGER, NodeKeyManager, read_node_private_key
+
+ROTATED_KEY = '3d' * 32
+
+
+def write_key(path, key, mtime):
+    path.write_text(key)
+    os.utime(path, ns=(mtime, mtime))
+
+
+def test_environment_key_is_loaded_once():
+    private_key, fingerprint = NODE_KEY_MANAGER.current()
+    assert private_key.secret == bytes.fromhex(TEST_NODE_KEY)
+    assert NODE_KEY_MANAGER.private_key is private_key
+    assert NODE_KEY_MANAGER.current()[1] == fingerprint
+
+
+def test_key_files_hold_hex_or_json(tmp_path):
+    hex_file = tmp_path / 'node.key'
+    hex_file.write_text(f'{TEST_NODE_KEY}\n')
+    json_file = tmp_path / 'node.json'
+    json_file.write_text(json.dumps({'NODE_PRIVATE_KEY': TEST_NODE_KEY}))
+    assert read_node_private_key(str(hex_file)) == bytes.fromhex(TEST_NODE_KEY)
+    assert read_node_private_key(str(json_file)) == bytes.fromhex(TEST_NODE_KEY)
+
+
+def test_keys_that_are_not_32_bytes_are_rejected(tmp_path):
+    key_file = tmp_path / 'node.key'
+    key_file.write_text('5c' * 16)
+    with pytest.raises(ValueError, match='32 bytes'):
+        NodeKeyManager(path=str(key_file))
+
+
+def test_rotated_key_file_is_swapped_in_and_notifies(tmp_path):
+    key_file = tmp_path / 'node.key'
+    write_key(key_file, TEST_NODE_KEY, 1_000_000_000)
+    rotations = []
+    manager = NodeKeyManager(path=str(key_file), reload_interval=0, on_rotate=lambda: rotations.append(1))
+    _, fingerprint = manager.current()
+    write_key(key_file, ROTATED_KEY, 2_000_000_000)
+    private_key, rotated_fingerprint = manager.current()
+    assert private_key.secret == bytes.fromhex(ROTATED_KEY)
+    assert rotated_fingerprint != fingerprint
+    assert rotations == [1]
+
+
+def test_invalid_rotation_keeps_the_current_key(tmp_path):
+    key_file = tmp_path / 'node.key'
+    write_key(key_file, TEST_NODE_KEY, 1_000_000_000)
+    manager = NodeKeyManager(path=str(key_file), reload_interval=0)
+    write_key(key_file, 'not a key', 2_000_000_000)
+    assert manager.current()[0].secret == bytes.fromhex(TEST_NODE_KEY)
+    assert not manager.reload()
+
+
+def test_key_file_is_checked_at_most_every_reload_interval(tmp_path):
+    key_file = tmp_path / 'node.key'
+    write_key(key_file, TEST_NODE_KEY, 1_000_000_000)
+    manager = NodeKeyManager(path=str(key_file), reload_interval=3600)
+    manager.current()
+    write_key(key_file, ROTATED_KEY, 2_000_000_000)
+    assert manager.current()[0].secret == bytes.fromhex(TEST_NODE_KEY)
+    assert manager.reload()
+    assert manager.current()[0].secret == bytes.fromhex(ROTATED_KEY)
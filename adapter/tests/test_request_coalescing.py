@@ -0,0 +1,49 @@
+''' Run from the adapter directory with `python -m pytest tests` '''
+import time
+import threading
+from collections import namedtuple
+
+import pandas as pd
+
+from program_catalog.tools.wrappers import REQUEST_FLIGHT, get_request_data
+
+Route = namedtuple('Route', ['base_path', 'key', 'function'])
+
+
+def test_coalesced_callers_each_get_a_series():
+    ''' Concurrent identical requests share one wrapper call and every caller
+        gets a Series even though each overwrites its result in place, as
+        dClimateAdapter.execute_request does after operating on the data
+    '''
+    calls = []
+
+    def wrapper(args):
+        calls.append(args)
+        time.sleep(0.2)
+        return {'data': pd.Series([1.0, 2.0, 3.0], index=pd.date_range('2000-01-01', periods=3)), 'unit': 'mm'}
+
+    route = Route('grid-history', 'test-coalescing', wrapper)
+    callers = 20
+    start = threading.Barrier(callers)
+    results, errors = [], []
+
+    def request():
+        start.wait()
+        try:
+            result = get_request_data({'_route': route, 'dataset': 'test-dataset'})
+            results.append(result['data'].mean())
+            result['data'], result['unit'] = 0, None
+        except Exception as e:
+            errors.append(e)
+
+    coalesced = REQUEST_FLIGHT.coalesced
+    threads = [threading.Thread(target=request) for _ in range(callers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert results == [2.0] * callers
+    assert len(calls) < callers
+    assert REQUEST_FLIGHT.coalesced - coalesced == callers - len(calls)
@@ -0,0 +1,77 @@
+from datetime import datetime
+
+import pytest
+
+import program_catalog.tools.cache as cache
+import program_catalog.tools.wrappers as wrappers
+from api import dClimateAdapter
+from app import build_app
+from program_catalog.tools.cache import RESULT_CACHE
+
+DATASET = 'cpc_precip_us-daily'
+PURGE_TOKEN = 'purge-secret'
+
+
+def v4_request(end='2020-01-31', request_id=1):
+    return {'id': request_id, 'data': {
+        'request_url': f'/apiv4/geo_temporal_query/{DATASET}?output_format=array',
+        'spatial_parameters': ['point_params', '40.125', '-100.125'],
+        'temporal_parameters': ['2020-01-01', end, 'temporal_agg_params', 'all', 'max', '1'],
+    }}
+
+
+@pytest.fixture
+def version(monkeypatch):
+    ''' Version and end of the v4 dataset's latest publication, changed by the tests to republish '''
+    current = ['v1', datetime(2021, 12, 31)]
+    monkeypatch.setattr(wrappers.DATASET_HEADS, 'v4_version', lambda dataset: tuple(current))
+    return current
+
+
+def test_closed_ranges_are_served_from_the_result_cache(synthetic, version):
+    fetches = synthetic.fetches
+    first = dClimateAdapter(v4_request()).result
+    second = dClimateAdapter(v4_request(request_id=2)).result
+    assert synthetic.fetches == fetches + 1
+    assert second['result'] == first['result']
+    assert second['jobRunID'] == 2
+    assert RESULT_CACHE.stats()['hits'] == 1
+
+
+def test_open_ranges_and_new_versions_are_fetched(synthetic, version):
+    fetches = synthetic.fetches
+    dClimateAdapter(v4_request(end='2021-12-31'))
+    dClimateAdapter(v4_request(end='2021-12-31'))
+    assert synthetic.fetches == fetches + 2
+    assert RESULT_CACHE.stats()['size'] == 0
+    dClimateAdapter(v4_request())
+    version[0] = 'v2'
+    dClimateAdapter(v4_request())
+    assert synthetic.fetches == fetches + 4
+
+
+@pytest.mark.parametrize('token, authorization', [
+    (None, f'Bearer {PURGE_TOKEN}'),
+    (PURGE_TOKEN, None),
+    (PURGE_TOKEN, 'Bearer wrong-secret'),
+    (PURGE_TOKEN, f'Basic {PURGE_TOKEN}'),
+])
+def test_purges_without_the_token_are_rejected(monkeypatch, version, token, authorization):
+    monkeypatch.setattr(cache, 'CACHE_PURGE_TOKEN', token)
+    dClimateAdapter(v4_request())
+    headers = {} if authorization is None else {'Authorization': authorization}
+    response = build_app().test_client().post('/cache/purge', json={'dataset': DATASET}, headers=headers)
+    assert response.status_code == 401
+    assert RESULT_CACHE.stats()['size'] == 1
+
+
+def test_purge_with_the_token_empties_the_dataset(monkeypatch, version):
+    monkeypatch.setattr(cache, 'CACHE_PURGE_TOKEN', PURGE_TOKEN)
+    dClimateAdapter(v4_request())
+    client = build_app().test_client()
+    headers = {'Authorization': f'Bearer {PURGE_TOKEN}'}
+    assert client.post('/cache/purge', json={}, headers=headers).status_code == 400
+    response = client.post('/cache/purge', json={'dataset': DATASET}, headers=headers)
+    assert response.status_code == 200
+    assert response.get_json()['result']['result_cache'] == 1
+    assert RESULT_CACHE.stats()['size'] == 0
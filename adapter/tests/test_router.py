@@ -0,0 +1,52 @@
+import re
+
+import pytest
+
+from program_catalog.tools.routes import FLOAT_PARAMS, Router, load_api_routes, parse_swaggers
+
+SWAGGER_ROUTES = parse_swaggers()
+ROUTER = Router(SWAGGER_ROUTES)
+SAMPLE_VALUES = {'dataset': 'cpc_precip_us-daily', 'lat': '40.125', 'lon': '-100.125'}
+
+
+def swagger_urls():
+    ''' Returns: list, (base path, endpoint key, URL built from the endpoint's
+        swagger path, expected primary arguments) test cases of every endpoint
+    '''
+    urls = []
+    for base_path, api_map in SWAGGER_ROUTES.items():
+        for key, endpoint in api_map['paths'].items():
+            # drought-monitor separates its parameters with '-', which requests have never been split on
+            if '}-{' in endpoint['name']:
+                continue
+            values = {param: SAMPLE_VALUES.get(param, param.replace('_', '') + '0') for param in endpoint['primary']}
+            path = re.sub(r'\{(.+?)\}', lambda match: values[match.group(1)], endpoint['name'])
+            expected = {param: float(value) if param in FLOAT_PARAMS else value for param, value in values.items()}
+            urls.append(pytest.param(base_path, key, f'{base_path}{path}', expected, id=f'{base_path}/{key}'))
+    return urls
+
+
+def test_precompiled_routes_match_the_swaggers():
+    assert load_api_routes() == SWAGGER_ROUTES
+
+
+@pytest.mark.parametrize('base_path, key, url, expected', swagger_urls())
+def test_every_swagger_endpoint_resolves_to_itself(base_path, key, url, expected):
+    route, error = ROUTER.resolve(f'{url}?time_range=x')
+    assert error is None
+    assert (route.base_path, route.key) == (base_path, key)
+    assert route.endpoint is SWAGGER_ROUTES[base_path]['paths'][key]
+    assert route.args == expected
+    assert route.query == 'time_range=x'
+
+
+@pytest.mark.parametrize('url, error', [
+    ('/apiv9/grid-history/cpc_precip_us-daily/40.125_-100.125', 'API version not found'),
+    ('/apiv3/no-such-endpoint/x', 'endpoint not found'),
+    ('/apiv3/grid-history/cpc_precip_us-daily/40.125', 'incompatible parameters'),
+    ('/apiv3/ghcn-history/USW00094728/TMAX/extra', 'incompatible parameters'),
+])
+def test_unresolvable_urls_report_why(url, error):
+    route, message = ROUTER.resolve(url)
+    assert route is None
+    assert error in message
@@ -0,0 +1,77 @@
+import base64
+import os
+
+from coincurve import PrivateKey
+
+import program_catalog.tools.crypto as crypto
+from benchmarks.scenarios import encrypt_contract
+from conftest import TEST_NODE_KEY
+from program_catalog.tools.crypto import ACCESS_KEY_CACHE, URI_CACHE, SecretCache
+
+NODE_PUBLIC_KEY = PrivateKey(bytes.fromhex(TEST_NODE_KEY)).public_key.format(compressed=False)
+
+
+def test_returns_copies_of_the_cached_secret():
+    cache = SecretCache(4, ttl=60)
+    cache.set(b'key', b'secret')
+    copy = cache.get(b'key')
+    assert copy == b'secret'
+    assert cache.get(b'key') is not copy
+    assert cache.stats()['hits'] == 2
+
+
+def test_expired_secrets_are_zeroized_by_any_access():
+    cache = SecretCache(4, ttl=0)
+    cache.set(b'expired', b'secret')
+    stored = cache._entries[b'expired'][0]
+    cache.get(b'other')
+    assert stored == bytearray(6)
+    assert cache.stats()['size'] == 0
+
+
+def test_evicted_and_cleared_secrets_are_zeroized():
+    cache = SecretCache(2, ttl=60)
+    cache.set(b'a', b'first')
+    first = cache._entries[b'a'][0]
+    cache.set(b'b', b'second')
+    cache.set(b'c', b'third')
+    assert first == bytearray(5)
+    assert cache.get(b'a') is None
+    assert cache.stats()['evictions'] == 1
+    remaining = [secret for secret, _ in cache._entries.values()]
+    cache.clear()
+    assert all(secret == bytearray(len(secret)) for secret in remaining)
+    assert cache.stats()['size'] == 0
+
+
+def test_access_keys_are_decrypted_once_per_node_key(monkeypatch):
+    decryptions = []
+    decrypt = crypto.decrypt_access_key
+
+    def counting_decrypt(node_key, private_key=None):
+        decryptions.append(node_key)
+        return decrypt(node_key, private_key)
+
+    monkeypatch.setattr(crypto, 'decrypt_access_key', counting_decrypt)
+    access_key = os.urandom(32)
+    node_key = crypto.encrypt_access_key(access_key, NODE_PUBLIC_KEY)
+    assert crypto.get_access_key(node_key) == access_key
+    assert crypto.get_access_key(node_key) == access_key
+    assert len(decryptions) == 1
+    assert crypto.get_access_key(node_key, PrivateKey(os.urandom(32))) == 'MACs do not match'
+    assert crypto.get_access_key(node_key, PrivateKey(os.urandom(32))) == 'MACs do not match'
+    assert len(decryptions) == 3
+    assert ACCESS_KEY_CACHE.stats()['size'] == 1
+
+
+def test_decrypted_contracts_are_cached_and_cleared_on_rotation():
+    access_key = os.urandom(32)
+    node_key = base64.b64encode(crypto.encrypt_access_key(access_key, NODE_PUBLIC_KEY)).decode()
+    uri = encrypt_contract({'strike': '10'}, access_key)
+    hits = URI_CACHE.stats()['hits']
+    assert crypto.decrypt(node_key, uri) == {'strike': '10'}
+    assert crypto.decrypt(node_key, uri) == {'strike': '10'}
+    assert URI_CACHE.stats()['hits'] == hits + 1
+    crypto.clear_secret_caches()
+    assert URI_CACHE.stats()['size'] == 0
+    assert ACCESS_KEY_CACHE.stats()['size'] == 0
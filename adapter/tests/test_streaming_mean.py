@@ -0,0 +1,79 @@
+import astropy.units as u
+import numpy as np
+import pandas as pd
+import pytest
+
+from program_catalog.tools.aggregation import StreamingMean, latitude_weights
+from program_catalog.tools.loaders import GridcellLoader
+from program_catalog.tools.units import set_unit
+
+
+def histories(count, seed=3, missing=0.1):
+    ''' Returns: list, daily float histories in inches with some missing values '''
+    rng = np.random.default_rng(seed)
+    index = pd.date_range('2020-01-01', periods=400, freq='D')
+    series = []
+    for _ in range(count):
+        values = rng.gamma(0.5, 0.4, size=len(index))
+        values[rng.random(len(index)) < missing] = np.nan
+        series.append(set_unit(pd.Series(values, index=index), 'inch'))
+    return series
+
+
+def streaming_mean(series, weights=None):
+    mean = StreamingMean()
+    for i, history in enumerate(series):
+        mean.add(history, None if weights is None else weights[i])
+    return mean.result()
+
+
+@pytest.mark.parametrize('count', [1, 5, 25])
+def test_matches_dataframe_mean_within_rounding(count):
+    series = histories(count)
+    expected = pd.concat(series, axis=1).mean(axis=1)
+    result = streaming_mean(series)
+    assert result.index.equals(expected.index)
+    np.testing.assert_allclose(result.to_numpy(), expected.to_numpy(), rtol=1e-12, equal_nan=True)
+    assert result.attrs['unit'] == 'inch'
+
+
+def test_aligns_histories_on_the_union_of_their_indexes():
+    series = histories(3)
+    series[1] = series[1].iloc[50:]
+    series[2] = series[2].iloc[:-30]
+    expected = pd.concat(series, axis=1).mean(axis=1)
+    result = streaming_mean(series)
+    assert result.index.equals(expected.index)
+    np.testing.assert_allclose(result.to_numpy(), expected.to_numpy(), rtol=1e-12, equal_nan=True)
+
+
+def test_rows_missing_everywhere_are_nan():
+    series = histories(2, missing=0.0)
+    for history in series:
+        history.iloc[10] = np.nan
+    assert np.isnan(streaming_mean(series).iloc[10])
+
+
+def test_weighted_mean_matches_numpy_average():
+    series = histories(4, missing=0.0)
+    weights = latitude_weights([(10.0, 0.0), (40.0, 0.0), (60.0, 0.0), (75.0, 0.0)])
+    expected = np.average(np.column_stack([history.to_numpy() for history in series]), axis=1, weights=weights)
+    np.testing.assert_allclose(streaming_mean(series, weights).to_numpy(), expected, rtol=1e-12)
+
+
+def test_quantity_histories_are_averaged_on_their_values():
+    series = histories(3, missing=0.0)
+    quantities = [pd.Series([value * u.imperial.inch for value in history], index=history.index, dtype=object)
+                  for history in series]
+    expected = pd.concat(series, axis=1).mean(axis=1)
+    result = streaming_mean(quantities)
+    assert result.dtype == object
+    np.testing.assert_allclose(np.asarray(result.tolist(), dtype=np.float64), expected.to_numpy(), rtol=1e-12)
+
+
+def test_streaming_and_concat_gridcell_loads_agree():
+    locations = [(40.125 + 0.25 * i, -100.125 + 0.25 * j) for i in range(3) for j in range(3)]
+    concat = GridcellLoader(locations, 'cpc_precip_us-daily', aggregation='concat').load()
+    streaming = GridcellLoader(locations, 'cpc_precip_us-daily', aggregation='streaming').load()
+    assert streaming.index.equals(concat.index)
+    np.testing.assert_allclose(streaming.to_numpy(), concat.to_numpy(), rtol=1e-12, equal_nan=True)
@@ -0,0 +1,81 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import program_catalog.tools.cache as cache
+import program_catalog.tools.wrappers as wrappers
+
+ARGS = {'dataset': 'cpc_precip_us-daily', 'locations': [[40.125, -100.125], [40.375, -100.125]]}
+
+
+class PublishedDataset:
+    ''' Stand-in v4 dataset whose published history and version the tests advance '''
+
+    def __init__(self, values):
+        self.values = values
+        self.published = 0
+        self.version = None
+        self.queries = []
+
+    def publish(self, periods, version):
+        self.published = periods
+        self.version = version
+
+    def series(self):
+        return self.values.iloc[:self.published]
+
+    def geo_temporal_query(self, dataset_name, time_range=None, **kwargs):
+        self.queries.append(time_range)
+        data = self.series()
+        if time_range is not None:
+            data = data.loc[time_range[0]:time_range[1]]
+        return {'data': data.to_numpy().tolist(), 'times': [str(t) for t in data.index], 'unit of measurement': 'mm'}
+
+    def v4_version(self, dataset):
+        return self.version, self.series().index[-1].to_pydatetime()
+
+
+@pytest.fixture
+def dataset(monkeypatch):
+    index = pd.date_range('2020-01-01', periods=400, freq='D')
+    values = pd.Series(np.random.default_rng(0).gamma(0.4, 0.3, size=len(index)).round(4), index=index)
+    dataset = PublishedDataset(values)
+    monkeypatch.setattr(wrappers.v4_client, 'geo_temporal_query', dataset.geo_temporal_query, raising=False)
+    monkeypatch.setattr(wrappers.DATASET_HEADS, 'v4_version', dataset.v4_version)
+    monkeypatch.setattr(cache, 'HISTORY_TAIL_REFRESH', True)
+    return dataset
+
+
+def full_refetch():
+    ''' Returns: Pandas Series, the history read in full without any cache '''
+    cache.HISTORY_CACHE.purge()
+    cache.LATEST_HISTORIES.purge()
+    return wrappers.get_multi_point_history_wrapper.__wrapped__(dict(ARGS))['data']
+
+
+def test_stitched_history_equals_full_refetch(dataset):
+    dataset.publish(300, 'v1')
+    wrappers.get_multi_point_history_wrapper(dict(ARGS))
+    dataset.publish(400, 'v2')
+    dataset.queries.clear()
+
+    stitched = wrappers.get_multi_point_history_wrapper(dict(ARGS))['data']
+
+    assert len(dataset.queries) == 1 and dataset.queries[0] is not None
+    assert dataset.queries[0][0] == pd.Timestamp('2020-10-20').to_pydatetime()
+    expected = full_refetch()
+    pd.testing.assert_series_equal(stitched, expected)
+    assert stitched.attrs == expected.attrs
+
+
+def test_revised_overlap_is_read_in_full(dataset):
+    dataset.publish(300, 'v1')
+    wrappers.get_multi_point_history_wrapper(dict(ARGS))
+    dataset.values.iloc[298] += 1.0
+    dataset.publish(400, 'v2')
+    dataset.queries.clear()
+
+    refreshed = wrappers.get_multi_point_history_wrapper(dict(ARGS))['data']
+
+    assert dataset.queries[-1] is None
+    pd.testing.assert_series_equal(refreshed, full_refetch())
@@ -0,0 +1,100 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from program_catalog.tools.window_index import WindowIndex
+
+WINDOWS = [
+    ('2019-03-01', '2019-03-31'),
+    ('2019-02', '2019-04'),
+    ('2019', '2019'),
+    ('2019-12-31', '2020-01-01'),
+    ('2020-02-29', '2020-02-29'),
+    (None, '2019-06-15'),
+    ('2021-11', None),
+    (None, None),
+    (pd.Timestamp('2019-05-05 13:00'), pd.Timestamp('2019-05-09 02:00')),
+    ('2019-07-10', '2019-07-01'),
+    ('2018-01-01', '2018-12-31'),
+    ('2022-01-01', '2022-12-31'),
+]
+
+
+def history(freq, missing=0.0, seed=7):
+    ''' Returns: Pandas Series, random float64 history over 2019-2021 with a share of NaNs '''
+    index = pd.date_range('2019-01-01', '2021-12-31 23:00', freq=freq)
+    rng = np.random.default_rng(seed)
+    values = rng.normal(10.0, 5.0, len(index))
+    values[rng.random(len(index)) < missing] = np.nan
+    return pd.Series(values, index=index)
+
+
+def random_windows(series, count=200, seed=11):
+    ''' Returns: list, (start, end) timestamp windows drawn from the history's index '''
+    rng = np.random.default_rng(seed)
+    picks = rng.integers(0, len(series), size=(count, 2))
+    return [(series.index[min(a, b)], series.index[max(a, b)]) for a, b in picks]
+
+
+@pytest.mark.parametrize('freq, missing', [('D', 0.0), ('D', 0.2), ('h', 0.05)])
+@pytest.mark.parametrize('block_size', [1, 5, 32])
+def test_window_aggregates_match_pandas(freq, missing, block_size):
+    series = history(freq, missing)
+    index = WindowIndex(series, block_size=block_size)
+    for start, end in WINDOWS + random_windows(series):
+        window = series.loc[start:end]
+        assert index.positions(start, end)[1] - index.positions(start, end)[0] == len(window)
+        assert index.count(start, end) == window.count()
+        assert index.sum(start, end) == pytest.approx(window.sum(), rel=1e-9, abs=1e-6)
+        assert index.mean(start, end) == pytest.approx(window.mean(), rel=1e-9, nan_ok=True)
+        np.testing.assert_equal(index.max(start, end), window.max())
+        np.testing.assert_equal(index.min(start, end), window.min())
+
+
+def test_all_missing_window_is_nan():
+    series = history('D')
+    series.loc['2020-06'] = np.nan
+    index = WindowIndex(series, block_size=4)
+    assert index.count('2020-06', '2020-06') == 0
+    assert index.sum('2020-06', '2020-06') == 0
+    assert np.isnan(index.mean('2020-06', '2020-06'))
+    assert np.isnan(index.max('2020-06', '2020-06'))
+    assert np.isnan(index.min('2020-06', '2020-06'))
+
+
+def test_timezone_aware_history_matches_pandas():
+    series = history('h', 0.05).tz_localize('UTC')
+    index = WindowIndex(series)
+    for start, end in [('2020-03-01', '2020-03-07'), ('2020-03', '2020-05'), ('2021', None)]:
+        window = series.loc[start:end]
+        assert index.count(start, end) == window.count()
+        np.testing.assert_equal(index.max(start, end), window.max())
+
+
+def test_max_at_matches_pandas():
+    series = history('D', 0.1)
+    index = WindowIndex(series, block_size=8)
+    rng = np.random.default_rng(3)
+    contiguous = list(series.index[100:160])
+    scattered = list(series.index[np.sort(rng.choice(len(series), 40, replace=False))])
+    repeated = [series.index[5], series.index[5], series.index[6]]
+    for dates in [contiguous, scattered, repeated, [series.index[0]]]:
+        np.testing.assert_equal(index.max_at(dates), series.loc[dates].max())
+    as_strings = [date.strftime('%Y-%m-%d') for date in contiguous]
+    np.testing.assert_equal(index.max_at(as_strings), series.loc[contiguous].max())
+
+
+def test_max_at_is_none_for_dates_outside_the_history():
+    index = WindowIndex(history('D'))
+    assert index.max_at([pd.Timestamp('2019-05-01'), pd.Timestamp('2024-01-01')]) is None
+    assert np.isnan(index.max_at([]))
+
+
+def test_only_sorted_float_histories_are_supported():
+    series = history('D')
+    assert WindowIndex.supports(series)
+    assert not WindowIndex.supports(series.astype('float32'))
+    assert not WindowIndex.supports(series.iloc[::-1])
+    assert not WindowIndex.supports(series.reset_index(drop=True))
+    with pytest.raises(ValueError):
+        WindowIndex(series.iloc[::-1])
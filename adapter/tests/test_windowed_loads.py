@@ -0,0 +1,51 @@
+import pytest
+
+import program_catalog.tools.cache as cache
+import program_catalog.tools.wrappers as wrappers
+from program_catalog.tools.cache import HISTORY_CACHE
+from program_catalog.tools.disk_cache import DiskHistoryCache
+from program_catalog.tools.loaders import GridcellLoader
+
+DATASET = 'cpc_precip_us-daily'
+LOCATIONS = [(40.125, -100.125), (40.125, -99.875), (40.375, -100.125)]
+ARGS = {'lat': 40.125, 'lon': -100.125, 'dataset': DATASET}
+
+
+@pytest.fixture
+def disk_cache(monkeypatch, tmp_path):
+    disk = DiskHistoryCache(str(tmp_path), max_bytes=64 * 1024**2)
+    monkeypatch.setattr(cache, 'HISTORY_DISK_CACHE', disk)
+    return disk
+
+
+@pytest.mark.parametrize('aggregation', ['concat', 'streaming'])
+@pytest.mark.parametrize('window', [('2020-03-01', '2020-05-31'), ('2021-12', None), (None, '2019-01-15')])
+def test_windowed_loads_equal_slices_of_the_full_history(aggregation, window):
+    full = GridcellLoader(LOCATIONS, DATASET, aggregation=aggregation).load()
+    windowed = GridcellLoader(LOCATIONS, DATASET, aggregation=aggregation, start=window[0], end=window[1]).load()
+    expected = full.loc[window[0]:window[1]]
+    assert len(windowed) == len(expected) > 0
+    assert windowed.equals(expected)
+    assert windowed.attrs['unit'] == full.attrs['unit']
+
+
+def test_windowed_disk_hits_warm_the_memory_cache(synthetic, disk_cache):
+    full = wrappers.get_gridcell_history_wrapper(ARGS)['data']
+    HISTORY_CACHE.purge()
+    fetches = synthetic.fetches
+    march = wrappers.get_gridcell_history_wrapper({**ARGS, '_start': '2020-03-01', '_end': '2020-03-31'})['data']
+    assert synthetic.fetches == fetches
+    assert march.equals(full.loc['2020-03-01':'2020-03-31'])
+    assert HISTORY_CACHE.stats()['size'] == 1
+
+    hits = HISTORY_CACHE.stats()['hits']
+    april = wrappers.get_gridcell_history_wrapper({**ARGS, '_start': '2020-04-01', '_end': '2020-04-30'})['data']
+    assert HISTORY_CACHE.stats()['hits'] == hits + 1
+    assert april.equals(full.loc['2020-04-01':'2020-04-30'])
+
+
+def test_sliced_results_do_not_share_data_with_the_cache():
+    window = wrappers.get_gridcell_history_wrapper({**ARGS, '_start': '2020-03-01', '_end': '2020-03-31'})['data']
+    window.iloc[:] = -1.0
+    again = wrappers.get_gridcell_history_wrapper({**ARGS, '_start': '2020-03-01', '_end': '2020-03-31'})['data']
+    assert (again >= 0).all()